@@ -0,0 +1,73 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blender_render import DepthDirectionValueGrid, flow_field_streamlines
+from fields import saddle_field, vortex_field
+
+
+def vortex_drift(sl: np.ndarray, cx: float, cy: float) -> float:
+    # Largest deviation of the distance to the centre from its value at the first point
+    r = np.hypot(sl[:, 0] - cx, sl[:, 1] - cy)
+    return float(np.max(np.abs(r - r[0])))
+
+def saddle_drift(sl: np.ndarray, cx: float, cy: float) -> float:
+    # Largest deviation of x * y from its value at the first point, divided by |grad(x * y)| to get pixels
+    x = sl[:, 0] - cx
+    y = sl[:, 1] - cy
+    xy = x * y
+    return float(np.max(np.abs(xy - xy[0]) / np.maximum(np.hypot(x, y), 1.0)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy and speed of the streamline integrators on fields with known streamlines")
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--euler-step", type=float, default=0.9)
+    parser.add_argument("--step", type=float, default=3.0, help="Step length of the higher-order integrators")
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    args = parser.parse_args()
+
+    d_sep = 11.0
+    arc_length = 110 * args.euler_step
+    cases = (
+        ("euler", args.euler_step),
+        ("midpoint", args.step),
+        ("rk4", args.step),
+        ("adaptive_rk23", args.step),
+    )
+    fields = (("vortex", vortex_field, vortex_drift), ("saddle", saddle_field, saddle_drift))
+    for field_name, field, drift in fields:
+        grid = DepthDirectionValueGrid(args.size, args.size, field(args.size, args.size))
+        center = 0.5 * args.size
+        for integrator, d_step in cases:
+            # The same arc length per streamline for all integrators, so that the drift is comparable
+            max_steps = max(int(arc_length / d_step), 2)
+            start = time.perf_counter()
+            streamlines = flow_field_streamlines(
+                grid,
+                rng_seed=420163298,
+                seed_box_size=1.9 * d_sep,
+                d_sep=d_sep,
+                d_test_factor=0.65,
+                d_step=d_step,
+                max_depth_step=0.05,
+                max_accum_angle=100.0,
+                max_steps=max_steps,
+                min_steps=1,
+                integrator=integrator,
+                tolerance=args.tolerance
+            )
+            elapsed = time.perf_counter() - start
+            drifts = np.array([drift(np.array(sl), center, center) for sl in streamlines])
+            print(
+                f"{field_name:6s} {integrator:13s} d_step {d_step:4.1f}: {elapsed:6.2f} s, {len(streamlines):5d} streamlines, "
+                f"{sum(len(sl) for sl in streamlines):7d} points, drift mean {drifts.mean():.4f} px, max {drifts.max():.4f} px"
+            )
+
+
+if __name__ == "__main__":
+    main()
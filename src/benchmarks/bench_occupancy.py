@@ -0,0 +1,116 @@
+import argparse
+from contextlib import contextmanager
+from functools import partial
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blender_render import DepthDirectionValueGrid, flow_field_streamlines
+from blender_render import streamlines as streamlines_module
+from blender_render.streamlines import StreamlineRegistry
+from fields import noise_field, sphere_field
+from occupancy import OccupancyRegistry
+
+
+# "cells" is the exact registry of flow_field_streamlines; the occupancy rasters answer in constant time but measure
+# distances from the nearest raster sample. They lose full traces to the cell list, so they only live here.
+REGISTRY_BACKENDS = {
+    "cells": StreamlineRegistry,
+    "occupancy": OccupancyRegistry,
+    "occupancy_x2": partial(OccupancyRegistry, scale=2.0),
+}
+
+@contextmanager
+def registry_backend(registry_type):
+    # flow_field_streamlines creates its registry from the module global, which is swapped for the trace
+    original = streamlines_module.StreamlineRegistry
+    streamlines_module.StreamlineRegistry = registry_type
+    try:
+        yield
+    finally:
+        streamlines_module.StreamlineRegistry = original
+
+
+def separation_violations(streamlines: list, width: int, height: int, d_test: float) -> int:
+    # Points that come closer than d_test to another streamline, measured exactly
+    violations = 0
+    for sid, sl in enumerate(streamlines):
+        registry = StreamlineRegistry(width, height, d_test)
+        registry.add_streamline(sl)
+        others = [p for other_sid, other in enumerate(streamlines) if other_sid != sid for p in other]
+        # Points outside the image are rejected by the bounds test, not by the distance test
+        others = [p for p in others if 0.0 <= p[0] < width - 1.0 and 0.0 <= p[1] < height - 1.0]
+        if others:
+            violations += int((~registry.points_allowed(np.array(others), d_test, d_test, 0)).sum())
+    return violations // 2
+
+def main():
+    parser = argparse.ArgumentParser(description="Speed and accuracy of the registry backends against the exact cell list")
+    parser.add_argument("--size", type=int, nargs=2, default=[1920, 1080])
+    parser.add_argument("--queries", type=int, default=100_000)
+    parser.add_argument("--check-violations", action="store_true", help="Count separation violations of the traced lines (slow)")
+    args = parser.parse_args()
+    width, height = args.size
+
+    d_sep = 11.0
+    d_test_factor = 0.65
+    params = dict(
+        rng_seed=420163298,
+        seed_box_size=1.9 * d_sep,
+        d_sep=d_sep,
+        d_test_factor=d_test_factor,
+        d_step=0.9,
+        max_depth_step=0.05,
+        max_accum_angle=5.0,
+        max_steps=110,
+        min_steps=10,
+    )
+    for field_name, field in (("sphere", sphere_field), ("noise", noise_field)):
+        grid = DepthDirectionValueGrid(width, height, field(width, height))
+        reference = flow_field_streamlines(grid, **params)
+
+        # Single queries against registries holding the same streamlines, with the relaxed distance for one of them
+        rng = random.Random(1)
+        queries = [(rng.uniform(0.0, width - 1.0), rng.uniform(0.0, height - 1.0)) for _ in range(args.queries)]
+        relaxed_ids = [rng.randint(0, len(reference)) for _ in range(args.queries)]
+        answers = {}
+        for backend, registry_type in REGISTRY_BACKENDS.items():
+            registry = registry_type(width, height, d_sep)
+            start = time.perf_counter()
+            for sl in reference:
+                registry.add_streamline(sl)
+            add_time = time.perf_counter() - start
+            start = time.perf_counter()
+            answers[backend] = np.array([
+                registry.is_point_allowed(p, d_sep, d_test_factor * d_sep, relaxed_id)
+                for p, relaxed_id in zip(queries, relaxed_ids)
+            ])
+            query_time = time.perf_counter() - start
+            mismatches = int((answers[backend] != answers["cells"]).sum())
+            print(
+                f"{field_name:6s} {backend:12s} add {add_time:6.3f} s, {args.queries} queries {query_time:6.3f} s "
+                f"({1e6 * query_time / args.queries:5.2f} us each), answers differing from cells: {mismatches} "
+                f"({100.0 * mismatches / args.queries:.3f}%)"
+            )
+
+        for backend, registry_type in REGISTRY_BACKENDS.items():
+            start = time.perf_counter()
+            with registry_backend(registry_type):
+                streamlines = flow_field_streamlines(grid, **params)
+            trace_time = time.perf_counter() - start
+            line = (
+                f"{field_name:6s} {backend:12s} trace {trace_time:6.2f} s, {len(streamlines)} streamlines, "
+                f"{sum(len(sl) for sl in streamlines)} points"
+            )
+            if args.check_violations:
+                line += f", point pairs closer than d_test: {separation_violations(streamlines, width, height, d_test_factor * d_sep)}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
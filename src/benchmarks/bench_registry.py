@@ -0,0 +1,126 @@
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blender_render.streamlines import StreamlineRegistry
+
+
+class ListStreamlineRegistry:
+    # Reference implementation: one (point, streamline id) tuple per entry in a Python list per cell
+    def __init__(self, width: int, height: int, cell_size: float):
+        self.width = float(width)
+        self.height = float(height)
+        self.cell_size = cell_size
+        self.cells_x = math.ceil(self.width / cell_size)
+        self.cells_y = math.ceil(self.height / cell_size)
+        self.next_streamline_id = 1
+        self.cell_content: list[list[tuple[tuple[float, float], int]]] = [[] for _ in range(self.cells_x * self.cells_y)]
+
+    def _cell_coordinates(self, p: tuple[float, float]) -> tuple[int, int]:
+        cx = max(min(int(p[0] / self.cell_size), self.cells_x - 1), 0)
+        cy = max(min(int(p[1] / self.cell_size), self.cells_y - 1), 0)
+        return (cx, cy)
+
+    def add_streamline(self, streamline: list[tuple[float, float]]) -> int:
+        sid = self.next_streamline_id
+        self.next_streamline_id += 1
+        for p in streamline:
+            ix, iy = self._cell_coordinates(p)
+            self.cell_content[iy * self.cells_x + ix].append((p, sid))
+        return sid
+
+    def is_point_allowed(self, p: tuple[float, float], d_sep: float, d_sep_relaxed: float, relaxed_streamline_id: int) -> bool:
+        if not (0.0 <= p[0] < self.width - 1.0 and 0.0 <= p[1] < self.height - 1.0):
+            return False
+        cell_radius = math.ceil(d_sep / self.cell_size)
+        ix_cell, iy_cell = self._cell_coordinates(p)
+        for iy in range(max(iy_cell - cell_radius, 0), min(iy_cell + cell_radius, self.cells_y - 1) + 1):
+            for ix in range(max(ix_cell - cell_radius, 0), min(ix_cell + cell_radius, self.cells_x - 1) + 1):
+                for point, streamline_id in self.cell_content[iy * self.cells_x + ix]:
+                    min_dist = d_sep_relaxed if streamline_id == relaxed_streamline_id else d_sep
+                    x_diff = point[0] - p[0]
+                    y_diff = point[1] - p[1]
+                    if math.sqrt(x_diff * x_diff + y_diff * y_diff) < min_dist:
+                        return False
+        return True
+
+
+def dense_streamlines(size: int, d_sep: float, d_test_factor: float, d_step: float, rng: random.Random) -> list[list[tuple[float, float]]]:
+    # Wavy, nearly parallel lines spaced at the tightest distance the tracer accepts
+    spacing = d_test_factor * d_sep
+    streamlines = []
+    for row in range(int(size / spacing)):
+        y0 = (row + 0.5) * spacing
+        phase = rng.uniform(0.0, 2.0 * math.pi)
+        xs = np.arange(0.0, size - 1.0, d_step)
+        ys = y0 + 0.2 * spacing * np.sin(xs / 40.0 + phase)
+        streamlines.append(list(zip(xs.tolist(), ys.tolist())))
+    return streamlines
+
+
+def time_queries(registry, queries) -> tuple[list[bool], float]:
+    start = time.perf_counter()
+    allowed = [registry.is_point_allowed(p, *query_args) for p, query_args in queries]
+    return allowed, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the streamline registry in dense scenes")
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--d-sep", type=float, default=11.0)
+    parser.add_argument("--d-test-factor", type=float, default=0.65)
+    parser.add_argument("--d-step", type=float, default=0.5)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    streamlines = dense_streamlines(args.size, args.d_sep, args.d_test_factor, args.d_step, rng)
+    point_count = sum(len(sl) for sl in streamlines)
+    d_test = args.d_test_factor * args.d_sep
+    points = [(rng.uniform(-2.0, args.size + 2.0), rng.uniform(-2.0, args.size + 2.0)) for _ in range(args.queries)]
+    # Seed tests use d_sep, relaxed to d_test for the streamline the seed was spawned from; tracing tests use d_test only
+    seed_queries = [(p, (args.d_sep, d_test, rng.randrange(1, len(streamlines) + 1))) for p in points]
+    trace_queries = [(p, (d_test, d_test, 0)) for p in points]
+    print(f"{len(streamlines)} streamlines, {point_count} points, {args.queries} queries per kind")
+
+    registries = []
+    for registry_type in (ListStreamlineRegistry, StreamlineRegistry):
+        registry = registry_type(args.size, args.size, args.d_sep)
+        start = time.perf_counter()
+        for sl in streamlines:
+            registry.add_streamline(sl)
+        print(f"{registry_type.__name__:>24}: add_streamline {time.perf_counter() - start:8.3f} s")
+        registries.append(registry)
+
+    for kind, queries in (("seed", seed_queries), ("trace", trace_queries)):
+        reference = None
+        for registry in registries:
+            allowed, query_time = time_queries(registry, queries)
+            mismatches = "" if reference is None else f", {sum(a != b for a, b in zip(reference, allowed))} mismatches"
+            reference = reference or allowed
+            print(f"{type(registry).__name__:>24}: {kind} is_point_allowed {1.0e6 * query_time / len(queries):7.2f} us/query{mismatches}")
+
+    # Bulk tracing tests in chunks, as issued by flow_field_streamline
+    registry = registries[-1]
+    point_array = np.array(points)
+    start = time.perf_counter()
+    allowed = np.concatenate([
+        registry.points_allowed(point_array[i:i + args.chunk_size], d_test, d_test, 0)
+        for i in range(0, len(point_array), args.chunk_size)
+    ])
+    bulk_time = time.perf_counter() - start
+    mismatches = sum(a != b for a, b in zip(reference, allowed.tolist()))
+    print(f"{type(registry).__name__:>24}: trace points_allowed {1.0e6 * bulk_time / len(points):7.2f} us/query, {mismatches} mismatches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blender_render import DepthDirectionValueGrid, flow_field_streamlines, flow_field_streamlines_tiled
+from fields import sphere_field
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speedup of tiled, multi-process streamline tracing over the serial path")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--tile-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--border-policy", choices=("reject", "trim"), default="trim")
+    parser.add_argument("--no-fill-gaps", action="store_true", help="Skip the serial pass that fills the gaps at the seams")
+    args = parser.parse_args()
+
+    grid = DepthDirectionValueGrid(args.width, args.height, sphere_field(args.width, args.height))
+    d_sep = 11.0
+    params = dict(
+        rng_seed=420163298,
+        seed_box_size=1.9 * d_sep,
+        d_sep=d_sep,
+        d_test_factor=0.65,
+        d_step=0.9,
+        max_depth_step=0.05,
+        max_accum_angle=5.0,
+        max_steps=110,
+        min_steps=10,
+    )
+
+    start = time.perf_counter()
+    serial = flow_field_streamlines(grid, **params)
+    serial_time = time.perf_counter() - start
+    print(f"serial: {serial_time:7.2f} s, {len(serial)} streamlines, {sum(len(sl) for sl in serial)} points")
+
+    reference = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        tiled = flow_field_streamlines_tiled(grid, tile_size=args.tile_size, workers=workers, border_policy=args.border_policy, fill_gaps=not args.no_fill_gaps, **params)
+        tiled_time = time.perf_counter() - start
+        reference = reference or tiled
+        print(
+            f"tiled, {workers:2d} workers: {tiled_time:7.2f} s, speedup {serial_time / tiled_time:5.2f}x, "
+            f"{len(tiled)} streamlines, {sum(len(sl) for sl in tiled)} points, identical to 1 worker: {tiled == reference}"
+        )
+
+
+if __name__ == "__main__":
+    main()
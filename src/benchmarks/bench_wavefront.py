@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blender_render import DepthDirectionValueGrid, Profiler, ToneSeparation, flow_field_streamlines
+from fields import noise_field, sphere_field, torus_field
+
+
+def max_deviation(streamlines: list, reference: list) -> float:
+    # Largest coordinate difference between matching points, or infinity if the lines do not match up
+    if len(streamlines) != len(reference) or any(len(a) != len(b) for a, b in zip(streamlines, reference)):
+        return float("inf")
+    return max((float(np.abs(np.asarray(a) - np.asarray(b)).max()) for a, b in zip(streamlines, reference)), default=0.0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Speed of the wavefront tracer and its deviation from the serial search")
+    parser.add_argument("--size", type=int, nargs=2, default=[1920, 1080])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[256, 1024, 4096])
+    parser.add_argument("--integrator", default="rk4", help="Integrator of the traced lines; the batches pay off with rk4")
+    parser.add_argument("--max-steps", type=int, default=110)
+    parser.add_argument("--repeat", type=int, default=3, help="Report the fastest of this many runs")
+    args = parser.parse_args()
+    width, height = args.size
+
+    params = dict(
+        rng_seed=420163298,
+        seed_box_size=20.9,
+        d_test_factor=0.65,
+        d_step=0.9,
+        max_depth_step=0.05,
+        max_accum_angle=5.0,
+        max_steps=args.max_steps,
+        min_steps=10,
+        integrator=args.integrator,
+    )
+    fields = (("sphere", sphere_field), ("noise", noise_field), ("torus", torus_field))
+    for field_name, field in fields:
+        grid = DepthDirectionValueGrid(width, height, field(width, height))
+        for d_sep in (11.0, ToneSeparation(6.0, 14.0)):
+            d_sep_name = "tone" if isinstance(d_sep, ToneSeparation) else "fixed"
+            reference = None
+            for batch_size in [None] + args.batch_sizes:
+                trace_time = float("inf")
+                for _ in range(args.repeat):
+                    profiler = Profiler()
+                    start = time.perf_counter()
+                    streamlines = flow_field_streamlines(grid, d_sep=d_sep, batch_size=batch_size, profiler=profiler, **params)
+                    trace_time = min(trace_time, time.perf_counter() - start)
+                reference = streamlines if reference is None else reference
+                counters = profiler.report()["counters"]
+                line = (
+                    f"{field_name:6s} {d_sep_name:5s} batch {str(batch_size):>5s} trace {trace_time:6.2f} s, "
+                    f"{len(streamlines)} streamlines, deviation from serial {max_deviation(streamlines, reference):.2e} px"
+                )
+                if batch_size is not None:
+                    line += (
+                        f", {counters.get('wavefront_candidates', 0)} traced in lockstep, "
+                        f"{counters.get('wavefront_traced_alone', 0)} alone, {counters.get('wavefront_lines_cut', 0)} cut"
+                    )
+                print(line, flush=True)
+
+
+if __name__ == "__main__":
+    main()
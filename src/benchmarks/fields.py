@@ -0,0 +1,78 @@
+import numpy as np
+
+
+# Synthetic depth/orientation/value fields of shape (height, width, 3), laid out like the G-buffer of
+# BlenderShaderRenderer.render_depth_orientation_value: depth <= 0 marks uncovered pixels.
+
+def sphere_field(width: int, height: int, radius_fraction: float = 0.4) -> np.ndarray:
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float64)
+    cx = 0.5 * width
+    cy = 0.5 * height
+    radius = radius_fraction * min(width, height)
+    r = np.hypot(xx - cx, yy - cy)
+    z = np.sqrt(np.clip(radius * radius - r * r, 0.0, None))
+    depth = np.where(r < radius, 10.0 - z / radius, -1.0)
+    # Hatch directions circle around the centre with a slow wobble
+    orientation = np.arctan2(yy - cy, xx - cx) + 0.5 * np.pi + 0.3 * np.sin(xx / (0.05 * width))
+    value = np.clip(z / radius, 0.0, 1.0)
+    return np.stack((depth, orientation, value), axis=-1).astype(np.float32)
+
+def vortex_field(width: int, height: int) -> np.ndarray:
+    # Exact circles around the centre: streamlines should keep their distance to it
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float64)
+    cx = 0.5 * width
+    cy = 0.5 * height
+    orientation = np.arctan2(yy - cy, xx - cx) + 0.5 * np.pi
+    depth = np.full((height, width), 5.0)
+    value = np.full((height, width), 0.5)
+    return np.stack((depth, orientation, value), axis=-1).astype(np.float32)
+
+def saddle_field(width: int, height: int) -> np.ndarray:
+    # Hyperbolas x * y = const around the centre: streamlines should keep their value of x * y
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float64)
+    x = xx - 0.5 * width
+    y = yy - 0.5 * height
+    orientation = np.arctan2(-y, x)
+    depth = np.full((height, width), 5.0)
+    value = np.full((height, width), 0.5)
+    return np.stack((depth, orientation, value), axis=-1).astype(np.float32)
+
+def torus_field(width: int, height: int, ring_fraction: float = 0.3, tube_fraction: float = 0.12) -> np.ndarray:
+    # A torus seen from above, hatched across its tube
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float64)
+    cx = 0.5 * width
+    cy = 0.5 * height
+    ring_radius = ring_fraction * min(width, height)
+    tube_radius = tube_fraction * min(width, height)
+    tube_distance = np.abs(np.hypot(xx - cx, yy - cy) - ring_radius)
+    z = np.sqrt(np.clip(tube_radius * tube_radius - tube_distance * tube_distance, 0.0, None))
+    depth = np.where(tube_distance < tube_radius, 10.0 - z / tube_radius, -1.0)
+    orientation = np.arctan2(yy - cy, xx - cx)
+    value = np.clip(z / tube_radius, 0.0, 1.0)
+    return np.stack((depth, orientation, value), axis=-1).astype(np.float32)
+
+def noise_field(width: int, height: int, cell_size: float = 64.0, seed: int = 1997) -> np.ndarray:
+    # Smooth value noise for the orientation, with holes where a second noise channel is low
+    rng = np.random.default_rng(seed)
+    cells_x = int(np.ceil(width / cell_size)) + 2
+    cells_y = int(np.ceil(height / cell_size)) + 2
+    lattice = rng.random((2, cells_y, cells_x))
+
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float64)
+    gx = xx / cell_size
+    gy = yy / cell_size
+    ix = gx.astype(np.intp)
+    iy = gy.astype(np.intp)
+    # Smoothstep weights give continuous derivatives across lattice cells
+    fx = gx - ix
+    fy = gy - iy
+    fx = fx * fx * (3.0 - 2.0 * fx)
+    fy = fy * fy * (3.0 - 2.0 * fy)
+    noise = (
+        (1.0 - fy) * ((1.0 - fx) * lattice[:, iy, ix] + fx * lattice[:, iy, ix + 1]) +
+        fy * ((1.0 - fx) * lattice[:, iy + 1, ix] + fx * lattice[:, iy + 1, ix + 1])
+    )
+    orientation = 2.0 * np.pi * noise[0]
+    depth = np.where(noise[1] > 0.2, 5.0 + noise[1], -1.0)
+    value = noise[1]
+    return np.stack((depth, orientation, value), axis=-1).astype(np.float32)
@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blender_render import DepthDirectionValueGrid, flow_field_streamlines, streamlines_to_strokes
+from blender_render.streamlines import StreamlineRegistry
+from fields import noise_field, sphere_field, torus_field
+
+
+FIELDS = {
+    "sphere": sphere_field,
+    "torus": torus_field,
+    "noise": noise_field,
+}
+
+SIZES = {
+    "512": (512, 512),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+
+D_SEP = 11.0
+STREAMLINE_PARAMS = dict(
+    rng_seed=420163298,
+    seed_box_size=1.9 * D_SEP,
+    d_sep=D_SEP,
+    d_test_factor=0.65,
+    d_step=0.9,
+    max_depth_step=0.05,
+    max_accum_angle=5.0,
+    max_steps=110,
+    min_steps=10,
+)
+QUERY_COUNT = 100_000
+
+
+def measure(stage, repeat: int, trace_memory: bool) -> tuple[float, int, object]:
+    # Best wall-clock time over repeat runs. tracemalloc slows down allocations considerably, so the peak of traced
+    # allocations (Python and NumPy) is taken from one extra run.
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = stage()
+        times.append(time.perf_counter() - start)
+
+    peak_bytes = 0
+    if trace_memory:
+        tracemalloc.start()
+        stage()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return min(times), peak_bytes, result
+
+def run_case(field_name: str, size_name: str, repeat: int, trace_memory: bool) -> list[dict]:
+    width, height = SIZES[size_name]
+    pixels = FIELDS[field_name](width, height)
+    rng = random.Random(1)
+    query_points = [(rng.uniform(0.0, width - 1.0), rng.uniform(0.0, height - 1.0)) for _ in range(QUERY_COUNT)]
+    records = []
+
+    def record(stage: str, seconds: float, peak_bytes: int, **extra):
+        records.append(dict(field=field_name, size=size_name, stage=stage, seconds=seconds, peak_bytes=peak_bytes, **extra))
+        print(f"{field_name:6s} {size_name:5s} {stage:22s} {seconds:9.4f} s {peak_bytes / 1024**2:9.1f} MiB", flush=True)
+
+    seconds, peak_bytes, grid = measure(lambda: DepthDirectionValueGrid(width, height, pixels), repeat, trace_memory)
+    record("grid_construction", seconds, peak_bytes)
+
+    def sample_grid():
+        for x, y in query_points:
+            grid.grid_value(x, y)
+    seconds, peak_bytes, _ = measure(sample_grid, repeat, trace_memory)
+    record("grid_value", seconds, peak_bytes, calls=QUERY_COUNT)
+
+    seconds, peak_bytes, streamlines = measure(lambda: flow_field_streamlines(grid, **STREAMLINE_PARAMS), repeat, trace_memory)
+    record(
+        "flow_field_streamlines", seconds, peak_bytes,
+        streamlines=len(streamlines), points=sum(len(sl) for sl in streamlines)
+    )
+
+    registry = StreamlineRegistry(width, height, D_SEP)
+    for sl in streamlines:
+        registry.add_streamline(sl)
+    d_sep_relaxed = STREAMLINE_PARAMS["d_test_factor"] * D_SEP
+
+    def query_registry():
+        for p in query_points:
+            registry.is_point_allowed(p, D_SEP, d_sep_relaxed, 0)
+    seconds, peak_bytes, _ = measure(query_registry, repeat, trace_memory)
+    record("is_point_allowed", seconds, peak_bytes, calls=QUERY_COUNT)
+
+    seconds, peak_bytes, _ = measure(
+        lambda: streamlines_to_strokes(width, height, (0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), streamlines),
+        repeat,
+        trace_memory
+    )
+    record("streamlines_to_strokes", seconds, peak_bytes)
+    return records
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    # Stages that got slower than the baseline by more than the relative threshold
+    baseline_seconds = {(r["field"], r["size"], r["stage"]): r["seconds"] for r in baseline["results"]}
+    regressions = []
+    for r in results["results"]:
+        before = baseline_seconds.get((r["field"], r["size"], r["stage"]))
+        if before is None:
+            continue
+        change = r["seconds"] / before - 1.0
+        line = f"{r['field']:6s} {r['size']:5s} {r['stage']:22s} {before:9.4f} s -> {r['seconds']:9.4f} s ({100.0 * change:+6.1f}%)"
+        if change > threshold:
+            regressions.append(line)
+            line += "  REGRESSION"
+        print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Timings and peak memory of the pipeline stages that run outside of Blender")
+    parser.add_argument("--fields", nargs="+", choices=FIELDS.keys(), default=list(FIELDS.keys()))
+    parser.add_argument("--sizes", nargs="+", choices=SIZES.keys(), default=list(SIZES.keys()))
+    parser.add_argument("--repeat", type=int, default=3, help="Report the best time of this many runs per stage")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the extra run per stage that records peak memory")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    records = []
+    for size_name in args.sizes:
+        for field_name in args.fields:
+            records.extend(run_case(field_name, size_name, args.repeat, not args.no_memory))
+
+    results = dict(
+        commit=git_commit(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        machine=platform.machine(),
+        processor=platform.processor(),
+        repeat=args.repeat,
+        results=records,
+    )
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) slower by more than {100.0 * args.threshold:.0f}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
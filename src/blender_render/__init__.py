@@ -1,6 +1,21 @@
-from .grease_pencil import GreasePencilDrawing
-from .grid import DepthDirectionValueGrid
-from .scene import MeshTriangles, BlenderScene
-from .streamlines import flow_field_streamlines, streamlines_to_strokes
-from .render import BlenderShaderRenderer
-from .utils import ndarray_to_gz_file
+from .geometry_cache import GeometryCache, GeometryCacheStats
+from .grid import DepthDirectionValueGrid, analysis_resolution
+from .hatching import HatchLayer, flow_field_hatch_layers, iter_hatch_layer_streamlines, refine_hatch_layers
+from .multiresolution import RefinementBand, refine_streamlines
+from .parallel import SweepResult, flow_field_streamlines_tiled, parameter_sweep
+from .plotter import StrokeOrder, order_strokes, travel_distance, write_hpgl, write_svg
+from .profiling import Profiler
+from .ragged import RaggedPoints
+from .session import RendererSession, RendererSessionStats
+from .simplify import simplify_strokes
+from .streamlines import ToneSeparation, batched_streamlines, flow_field_streamlines, iter_flow_field_streamlines, stroke_values, streamlines_to_strokes
+from .utils import GBuffer, create_gbuffer, read_gbuffer, read_strokes, write_gbuffer, write_strokes
+
+try:
+    from .grease_pencil import GreasePencilDrawing, StrokeSyncStats
+    from .scene import MeshTriangles, BlenderScene
+    from .render import BlenderShaderRenderer
+except ModuleNotFoundError as e:
+    # Outside of Blender, only the modules that do not depend on bpy, gpu or mathutils are available
+    if e.name not in ("bpy", "gpu", "mathutils"):
+        raise
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import os
+
+import numpy as np
+
+
+@dataclass
+class GeometryCacheStats:
+    hits: int = 0
+    misses: int = 0
+    spill_hits: int = 0 # Hits served from the spill directory; also counted in hits
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+class GeometryCache:
+    def __init__(self, max_bytes: int, spill_dir: str | None = None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.entries: OrderedDict[str, dict[str, np.ndarray]] = OrderedDict()
+        self.stats = GeometryCacheStats()
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @staticmethod
+    def content_key(*arrays: np.ndarray) -> str:
+        digest = hashlib.blake2b(digest_size=20)
+        for a in arrays:
+            a = np.ascontiguousarray(a)
+            digest.update(f"{a.dtype.str}{a.shape}".encode())
+            digest.update(a.data)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _entry_bytes(arrays: dict[str, np.ndarray]) -> int:
+        return sum(a.nbytes for a in arrays.values())
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.npz")
+
+    def get(self, key: str) -> dict[str, np.ndarray] | None:
+        arrays = self.entries.get(key)
+        if arrays is not None:
+            self.entries.move_to_end(key)
+            self.stats.hits += 1
+            return arrays
+
+        if self.spill_dir is not None and os.path.exists(self._spill_path(key)):
+            with np.load(self._spill_path(key)) as spilled:
+                arrays = {name: spilled[name] for name in spilled.files}
+            self.stats.hits += 1
+            self.stats.spill_hits += 1
+            self._insert(key, arrays)
+            return arrays
+
+        self.stats.misses += 1
+        return None
+
+    def put(self, key: str, arrays: dict[str, np.ndarray]):
+        if key in self.entries:
+            self.stats.bytes -= __class__._entry_bytes(self.entries.pop(key))
+        self._insert(key, arrays)
+
+    def _insert(self, key: str, arrays: dict[str, np.ndarray]):
+        self.entries[key] = arrays
+        self.stats.bytes += __class__._entry_bytes(arrays)
+        # Evict least recently used entries, but always keep the newest one even if it exceeds the cap on its own
+        while self.stats.bytes > self.max_bytes and len(self.entries) > 1:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            self.stats.bytes -= __class__._entry_bytes(evicted)
+            self.stats.evictions += 1
+            if self.spill_dir is not None and not os.path.exists(self._spill_path(evicted_key)):
+                self._spill(evicted_key, evicted)
+        self.stats.entries = len(self.entries)
+
+    def _spill(self, key: str, arrays: dict[str, np.ndarray]):
+        # Write to a temporary file first so that an interrupted write never leaves a truncated entry behind
+        temp_path = self._spill_path(key) + ".tmp"
+        with open(temp_path, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(temp_path, self._spill_path(key))
+
+    def clear(self):
+        self.entries.clear()
+        self.stats = GeometryCacheStats()
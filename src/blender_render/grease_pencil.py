@@ -1,10 +1,24 @@
 import bpy
 import numpy as np
 from collections.abc import Sequence
+from dataclasses import dataclass
 
+from .ragged import RaggedPoints, point_indices
+
+
+@dataclass
+class StrokeSyncStats:
+    kept: int
+    added: int
+    removed: int
 
 class GreasePencilDrawing:
-    def __init__(self, obj_name: str, layer_name: str):
+    # The uint64 stroke keys of sync_strokes, split into two INT stroke attributes
+    KEY_ATTRIBUTES = ("stroke_key_lo", "stroke_key_hi")
+    # What Grease Pencil assumes for points without a value of these attributes
+    POINT_ATTRIBUTE_DEFAULTS = {"radius": 0.01, "opacity": 1.0}
+
+    def __init__(self, obj_name: str, layer_name: str, create_layer: bool = False):
         gp_obj = bpy.data.objects.get(obj_name)
         if not gp_obj or gp_obj.type != "GREASEPENCIL":
             raise ValueError(f"Object '{obj_name}' not found or is not a Grease Pencil v3 object.")
@@ -13,29 +27,164 @@ class GreasePencilDrawing:
 
         layer = gp_data.layers.get(layer_name)
         if layer is None:
-            raise KeyError(f"Grease Pencil Layer '{layer_name}' not found.")
+            if not create_layer:
+                raise KeyError(f"Grease Pencil Layer '{layer_name}' not found.")
+            layer = gp_data.layers.new(layer_name)
 
         frame = layer.current_frame()
+        if frame is None:
+            frame = layer.frames.new(bpy.context.scene.frame_current)
+        self.gp_data = gp_data
         self.drawing = frame.drawing
-    
+
     def clear(self):
         self.drawing.remove_strokes()
-    
-    def add_strokes(self, strokes: Sequence[np.ndarray], radius: float):
-        self.drawing.add_strokes([s.shape[0] for s in strokes])
 
+    def add_strokes(self, strokes: RaggedPoints | Sequence[np.ndarray], radius: float | np.ndarray, opacity: float | np.ndarray | None = None):
+        # Appends the strokes after the ones already in the drawing. radius and opacity are constant or given per point.
+        if not isinstance(strokes, RaggedPoints):
+            strokes = RaggedPoints.from_sequences(strokes, 3, dtype=np.float32)
+        if len(strokes) == 0:
+            return
+        first_new_point = self._append_strokes(strokes)
+        point_count = first_new_point + len(strokes.points)
+        if opacity is None and self.drawing.attributes.get("opacity") is not None:
+            # Once the drawing has opacities, new points need one as well
+            opacity = 1.0
+        for name, values in (("radius", radius), ("opacity", opacity)):
+            if values is not None:
+                self._set_point_values(name, point_count, slice(first_new_point, None), values, read_back=first_new_point > 0)
+        # Redraw the viewport also when strokes are added from a timer
+        self.gp_data.update_tag()
+
+    def sync_strokes(
+        self,
+        strokes: RaggedPoints | Sequence[np.ndarray],
+        radius: float | np.ndarray,
+        opacity: float | np.ndarray | None = None,
+        remove_missing: bool = True,
+        keys: np.ndarray | None = None,
+        update_kept: bool = False
+    ) -> StrokeSyncStats:
+        # Keyed update: strokes are identified by RaggedPoints.keys() of their points. Strokes that are already in the
+        # drawing stay in place, with their undo history and other attributes; only the missing ones are added, and
+        # with remove_missing, the strokes of the drawing that are not in strokes are removed. Without it, strokes can
+        # be synced in batches, followed by remove_strokes_except with the keys of all batches.
+        # radius and opacity are constant or given per point of strokes, and are set in bulk for the added strokes;
+        # the kept strokes keep the values they have, e.g. edits made in Blender, unless update_kept is set.
+        if not isinstance(strokes, RaggedPoints):
+            strokes = RaggedPoints.from_sequences(strokes, 3, dtype=np.float32)
+        keys = strokes.keys() if keys is None else keys
+        removed = self.remove_strokes_except(keys) if remove_missing else 0
+        existing_keys = self.stroke_keys()
+
+        # Identical strokes would be drawn on top of each other, so each key is added once
+        unique_keys, first_index = np.unique(keys, return_index=True)
+        added = np.sort(first_index[~np.isin(unique_keys, existing_keys)])
+        stroke_keys = existing_keys
+        if len(added) > 0:
+            first_new_point = self._append_strokes(strokes.take(added))
+            stroke_keys = np.concatenate((existing_keys, keys[added]))
+            self._set_stroke_keys(stroke_keys)
+            if opacity is None and self.drawing.attributes.get("opacity") is not None:
+                # Once the drawing has opacities, new points need one as well; the kept strokes keep theirs
+                point_count = len(self.drawing.attributes["position"].data)
+                self._set_point_values("opacity", point_count, slice(first_new_point, None), 1.0, read_back=True)
+
+        # The points of the drawing's strokes that get the values, and the matching points of strokes
+        is_synced = np.isin(stroke_keys, unique_keys)
+        kept = int(is_synced[:len(existing_keys)].sum())
+        if not update_kept:
+            is_synced[:len(existing_keys)] = False
+        if is_synced.any():
+            offsets = self._stroke_offsets(len(stroke_keys))
+            point_count = int(offsets[-1])
+            targets = point_indices(offsets, np.flatnonzero(is_synced))
+            sources = strokes.point_indices(first_index[np.searchsorted(unique_keys, stroke_keys[is_synced])])
+            for name, values in (("radius", radius), ("opacity", opacity)):
+                if values is not None:
+                    values = values if np.isscalar(values) else np.asarray(values)[sources]
+                    self._set_point_values(name, point_count, targets, values, read_back=len(targets) < point_count)
+        self.gp_data.update_tag()
+        return StrokeSyncStats(kept=kept, added=len(added), removed=removed)
+
+    def remove_strokes_except(self, keys: np.ndarray) -> int:
+        # Removes the strokes whose key is not in keys, those added without one (key 0, even if keys holds a 0), and
+        # all but the first stroke of repeated keys
+        stroke_keys = self.stroke_keys()
+        keep = np.zeros(len(stroke_keys), dtype=bool)
+        keep[np.unique(stroke_keys, return_index=True)[1]] = True
+        keep &= np.isin(stroke_keys, keys) & (stroke_keys != 0)
+        removed = np.flatnonzero(~keep)
+        if len(removed) > 0:
+            self.drawing.remove_strokes(indices=removed.tolist())
+            self.gp_data.update_tag()
+        return len(removed)
+
+    def stroke_keys(self) -> np.ndarray:
+        # The keys of sync_strokes; strokes added otherwise have key 0
+        stroke_count = len(self.drawing.strokes)
+        key = np.zeros(stroke_count, dtype=np.uint64)
+        for shift, name in zip((0, 32), __class__.KEY_ATTRIBUTES):
+            attribute = self.drawing.attributes.get(name)
+            if attribute is not None:
+                half = np.empty(stroke_count, dtype=np.int32)
+                attribute.data.foreach_get("value", half)
+                key |= half.view(np.uint32).astype(np.uint64) << np.uint64(shift)
+        return key
+
+    def _set_stroke_keys(self, keys: np.ndarray):
         gp_attributes = self.drawing.attributes
+        for shift, name in zip((0, 32), __class__.KEY_ATTRIBUTES):
+            attribute = gp_attributes.get(name)
+            if attribute is None:
+                attribute = gp_attributes.new(name, "INT", "CURVE")
+            half = ((keys >> np.uint64(shift)) & np.uint64(0xFFFFFFFF)).astype(np.uint32).view(np.int32)
+            attribute.data.foreach_set("value", half)
+
+    def _stroke_offsets(self, stroke_count: int) -> np.ndarray:
+        # (stroke_count + 1,) offsets of the strokes' points
+        curve_offsets = self.drawing.curve_offsets
+        offsets = np.empty(len(curve_offsets), dtype=np.int32)
+        curve_offsets.foreach_get("value", offsets)
+        point_count = len(self.drawing.attributes["position"].data)
+        return np.append(offsets[:stroke_count], point_count).astype(np.int64)
 
-        gp_rad_attr = gp_attributes.get("radius")
-        if gp_rad_attr is None:
-            gp_rad_attr = gp_attributes.new("radius", "FLOAT", "POINT")
+    def _append_strokes(self, strokes: RaggedPoints) -> int:
+        # Adds the strokes and writes their positions; returns the index of their first point
+        self.drawing.add_strokes(strokes.lengths().tolist())
 
-        gp_pos_attr = gp_attributes.get("position")
+        gp_pos_attr = self.drawing.attributes.get("position")
         if gp_pos_attr is None:
             raise KeyError(f"Grease Pencil position attribute not found.")
-        
-        stroke_data = np.vstack(strokes).flatten()
-        radius_data = np.full(stroke_data.shape[0] // 3, radius, dtype=np.float32)
 
+        new_stroke_data = np.ascontiguousarray(strokes.points, dtype=np.float32).reshape(-1)
+        point_count = len(gp_pos_attr.data)
+        first_new_point = point_count - len(strokes.points)
+
+        if first_new_point == 0:
+            # An empty drawing takes the stroke buffer as is
+            stroke_data = new_stroke_data
+        else:
+            # foreach_set always writes the whole attribute, so the existing points are read back first
+            stroke_data = np.empty(3 * point_count, dtype=np.float32)
+            gp_pos_attr.data.foreach_get("vector", stroke_data)
+            stroke_data[3 * first_new_point:] = new_stroke_data
         gp_pos_attr.data.foreach_set("vector", stroke_data)
-        gp_rad_attr.data.foreach_set("value", radius_data)
+        return first_new_point
+
+    def _set_point_values(self, name: str, point_count: int, targets: slice | np.ndarray, values: float | np.ndarray, read_back: bool):
+        # Writes values to the targets of a FLOAT point attribute; the other points keep theirs only with read_back
+        gp_attributes = self.drawing.attributes
+        attribute = gp_attributes.get(name)
+        data = np.empty(point_count, dtype=np.float32)
+        if attribute is None:
+            attribute = gp_attributes.new(name, "FLOAT", "POINT")
+            # A new attribute is all zeros, e.g. fully transparent, so the other points get the value they were drawn
+            # with before
+            if read_back:
+                data.fill(__class__.POINT_ATTRIBUTE_DEFAULTS[name])
+        elif read_back:
+            attribute.data.foreach_get("value", data)
+        data[targets] = values
+        attribute.data.foreach_set("value", data)
@@ -2,6 +2,8 @@ from collections.abc import Sequence
 from dataclasses import dataclass
 import math
 
+import numpy as np
+
 
 @dataclass
 class GridValue:
@@ -9,59 +11,183 @@ class GridValue:
     depth: float
     direction: tuple[float, float]  # (cos, sin) of the orientation angle
     value: float
-    
+
     def is_covered(self) -> bool:
         return self.coverage_value > 0.9
 
+@dataclass
+class GridSamples:
+    coverage: np.ndarray
+    depth: np.ndarray
+    dir_cos: np.ndarray
+    dir_sin: np.ndarray
+    value: np.ndarray
+
+    def __len__(self) -> int:
+        return self.coverage.shape[0]
+
+    def __getitem__(self, index: np.ndarray | slice) -> "GridSamples":
+        return GridSamples(self.coverage[index], self.depth[index], self.dir_cos[index], self.dir_sin[index], self.value[index])
+
+    def is_covered(self) -> np.ndarray:
+        return self.coverage > 0.9
+
 class DepthDirectionValueGrid:
-    def __init__(self, width: int, height: int, pixels_depth_orientation_value: Sequence[tuple[float, float, float]]):
-        assert len(pixels_depth_orientation_value) == width * height, "The number of pixels must match the width and height dimensions"
-        self.width = width
-        self.height = height
-        self.pixels_coverage_depth_direction_value = [
-            (coverage := (1.0 if t[0] > 0.0 else 0.0), 
-            coverage * t[0],
-            coverage * math.cos(t[1]), 
-            coverage * math.sin(t[1]), 
-            coverage * t[2])
-            for t in pixels_depth_orientation_value
-        ]
-
-    def grid_value(self, x: int, y: int) -> GridValue:
+    PLANE_NAMES = ("coverage", "depth", "dir_cos", "dir_sin", "value")
+
+    def __init__(self, width: int, height: int, pixels_depth_orientation_value: np.ndarray | Sequence[tuple[float, float, float]]):
+        pixels = np.asarray(pixels_depth_orientation_value, dtype=np.float32)
+        assert pixels.size == width * height * 3, "The number of pixels must match the width and height dimensions"
+        pixels = pixels.reshape((height, width, 3))
+
+        # One contiguous float32 block holding the planes (coverage, depth, cos, sin, value), each of shape (height, width)
+        planes = np.empty((len(__class__.PLANE_NAMES), height, width), dtype=np.float32)
+        __class__._fill_planes(planes, pixels)
+        self._set_planes(planes)
+
+    @staticmethod
+    def _fill_planes(planes: np.ndarray, pixels: np.ndarray):
+        covered = pixels[:, :, 0] > 0.0
+        planes[0] = covered
+        planes[1] = pixels[:, :, 0]
+        np.cos(pixels[:, :, 1], out=planes[2])
+        np.sin(pixels[:, :, 1], out=planes[3])
+        planes[4] = pixels[:, :, 2]
+        planes[1:, ~covered] = 0.0
+
+    @classmethod
+    def from_pixels(cls, pixels: np.ndarray, planes: np.ndarray, rows_per_chunk: int = 256) -> "DepthDirectionValueGrid":
+        # Fills planes of shape (5, height, width) from (height, width, 3) pixels a chunk of rows at a time, e.g. from
+        # the memmap of a G-buffer into memory-mapped planes (see np.lib.format.open_memmap), so that only a chunk
+        # is held in memory. Sampling then reads the pages of the planes as needed.
+        height, width = pixels.shape[:2]
+        assert planes.shape == (len(cls.PLANE_NAMES), height, width), "The planes must match the size of the pixels"
+        for y0 in range(0, height, rows_per_chunk):
+            rows = slice(y0, min(y0 + rows_per_chunk, height))
+            cls._fill_planes(planes[:, rows], np.asarray(pixels[rows], dtype=np.float32))
+        return cls.from_planes(planes)
+
+    @classmethod
+    def from_planes(cls, planes: np.ndarray) -> "DepthDirectionValueGrid":
+        # Wraps existing planes (e.g. in shared memory) without copying them
+        grid = cls.__new__(cls)
+        grid._set_planes(planes)
+        return grid
+
+    def _set_planes(self, planes: np.ndarray):
+        assert planes.shape[0] == len(__class__.PLANE_NAMES) and planes.dtype == np.float32, "Expected float32 planes of shape (5, height, width)"
+        assert planes.flags.c_contiguous, "The planes must be C-contiguous"
+        self.height = planes.shape[1]
+        self.width = planes.shape[2]
+        self.planes = planes
+        self._flat_planes = self.planes.reshape((len(__class__.PLANE_NAMES), self.height * self.width))
+        # Scalar lookups through a flat memoryview yield Python floats without creating NumPy scalars
+        self._plane_values = tuple(memoryview(plane.reshape(-1)) for plane in self.planes)
+
+    @property
+    def coverage(self) -> np.ndarray:
+        return self.planes[0]
+
+    @property
+    def depth(self) -> np.ndarray:
+        return self.planes[1]
+
+    @property
+    def dir_cos(self) -> np.ndarray:
+        return self.planes[2]
+
+    @property
+    def dir_sin(self) -> np.ndarray:
+        return self.planes[3]
+
+    @property
+    def value(self) -> np.ndarray:
+        return self.planes[4]
+
+    def grid_value(self, x: float, y: float) -> GridValue:
         x = max(x, 0.0)
         y = max(y, 0.0)
         EPS = 1.0e-5
         x = min(x, float(self.width - 1) - EPS)
         y = min(y, float(self.height - 1) - EPS)
-        
-        x_frac, x_int = math.modf(x)
-        y_frac, y_int = math.modf(y)
+
+        x_int = int(x)
+        y_int = int(y)
+        x_frac = x - x_int
+        y_frac = y - y_int
         x_frac_ai = 1.0 - x_frac
         y_frac_ai = 1.0 - y_frac
-        
-        idx_00 = int(y_int) * self.width + int(x_int)
+
+        idx_00 = y_int * self.width + x_int
         idx_01 = idx_00 + 1
         idx_10 = idx_00 + self.width
         idx_11 = idx_10 + 1
-        
+
         w_00 = y_frac_ai * x_frac_ai
         w_01 = y_frac_ai * x_frac
         w_10 = y_frac * x_frac_ai
         w_11 = y_frac * x_frac
 
-        v_00 = self.pixels_coverage_depth_direction_value[idx_00]
-        v_01 = self.pixels_coverage_depth_direction_value[idx_01]
-        v_10 = self.pixels_coverage_depth_direction_value[idx_10]
-        v_11 = self.pixels_coverage_depth_direction_value[idx_11]
-
-        coverage = w_00 * v_00[0] + w_01 * v_01[0] + w_10 * v_10[0] + w_11 * v_11[0]
+        v_cov, v_depth, v_cos, v_sin, v_value = self._plane_values
+        coverage = w_00 * v_cov[idx_00] + w_01 * v_cov[idx_01] + w_10 * v_cov[idx_10] + w_11 * v_cov[idx_11]
         if coverage < EPS:
             return GridValue(0.0, 0.0, (1.0, 0.0), 0.0)
         coverage_inv = 1.0 / coverage
-        depth = (w_00 * v_00[1] + w_01 * v_01[1] + w_10 * v_10[1] + w_11 * v_11[1]) * coverage_inv
-        direction_cos = (w_00 * v_00[2] + w_01 * v_01[2] + w_10 * v_10[2] + w_11 * v_11[2])
-        direction_sin = (w_00 * v_00[3] + w_01 * v_01[3] + w_10 * v_10[3] + w_11 * v_11[3])
+        depth = (w_00 * v_depth[idx_00] + w_01 * v_depth[idx_01] + w_10 * v_depth[idx_10] + w_11 * v_depth[idx_11]) * coverage_inv
+        direction_cos = (w_00 * v_cos[idx_00] + w_01 * v_cos[idx_01] + w_10 * v_cos[idx_10] + w_11 * v_cos[idx_11])
+        direction_sin = (w_00 * v_sin[idx_00] + w_01 * v_sin[idx_01] + w_10 * v_sin[idx_10] + w_11 * v_sin[idx_11])
         direction_mag = math.sqrt(direction_cos * direction_cos + direction_sin * direction_sin)
         direction = (direction_cos / direction_mag, direction_sin / direction_mag) if direction_mag > EPS else (1.0, 0.0)
-        value = (w_00 * v_00[4] + w_01 * v_01[4] + w_10 * v_10[4] + w_11 * v_11[4]) * coverage_inv
+        value = (w_00 * v_value[idx_00] + w_01 * v_value[idx_01] + w_10 * v_value[idx_10] + w_11 * v_value[idx_11]) * coverage_inv
         return GridValue(coverage, depth, direction, value)
+
+    def sample_many(self, xs: np.ndarray | Sequence[float], ys: np.ndarray | Sequence[float]) -> GridSamples:
+        EPS = 1.0e-5
+        xs = np.clip(np.asarray(xs, dtype=np.float64), 0.0, float(self.width - 1) - EPS)
+        ys = np.clip(np.asarray(ys, dtype=np.float64), 0.0, float(self.height - 1) - EPS)
+
+        x_int = xs.astype(np.intp)
+        y_int = ys.astype(np.intp)
+        x_frac = xs - x_int
+        y_frac = ys - y_int
+        x_frac_ai = 1.0 - x_frac
+        y_frac_ai = 1.0 - y_frac
+
+        idx_00 = y_int * self.width + x_int
+        idx_01 = idx_00 + 1
+        idx_10 = idx_00 + self.width
+        idx_11 = idx_10 + 1
+
+        w_00 = y_frac_ai * x_frac_ai
+        w_01 = y_frac_ai * x_frac
+        w_10 = y_frac * x_frac_ai
+        w_11 = y_frac * x_frac
+
+        planes = self._flat_planes
+        coverage, depth, direction_cos, direction_sin, value = (
+            w_00 * planes[:, idx_00] + w_01 * planes[:, idx_01] + w_10 * planes[:, idx_10] + w_11 * planes[:, idx_11]
+        )
+
+        is_valid = coverage >= EPS
+        coverage = np.where(is_valid, coverage, 0.0)
+        coverage_inv = np.divide(1.0, coverage, out=np.zeros_like(coverage), where=is_valid)
+        direction_mag = np.sqrt(direction_cos * direction_cos + direction_sin * direction_sin)
+        has_direction = is_valid & (direction_mag > EPS)
+        return GridSamples(
+            coverage,
+            depth * coverage_inv,
+            np.divide(direction_cos, direction_mag, out=np.ones_like(direction_mag), where=has_direction),
+            np.divide(direction_sin, direction_mag, out=np.zeros_like(direction_mag), where=has_direction),
+            value * coverage_inv
+        )
+
+# An analysis grid holds the field at analysis_scale times the output resolution. Pixel centers line up, so output
+# pixel p and analysis pixel (p + 0.5) * analysis_scale - 0.5 are the same point of the image.
+def analysis_resolution(width: int, height: int, analysis_scale: float) -> tuple[int, int]:
+    return (max(2, round(width * analysis_scale)), max(2, round(height * analysis_scale)))
+
+def output_to_analysis(points: np.ndarray | Sequence[tuple[float, float]], analysis_scale: float) -> np.ndarray:
+    return (np.asarray(points, dtype=np.float64) + 0.5) * analysis_scale - 0.5
+
+def analysis_to_output(points: np.ndarray | Sequence[tuple[float, float]], analysis_scale: float) -> np.ndarray:
+    return (np.asarray(points, dtype=np.float64) + 0.5) / analysis_scale - 0.5
@@ -0,0 +1,108 @@
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+import math
+
+import numpy as np
+
+from .grid import DepthDirectionValueGrid, GridSamples, GridValue
+from .multiresolution import RefinementBand, refine_streamlines
+from .streamlines import ToneSeparation, iter_flow_field_streamlines
+
+
+@dataclass
+class HatchLayer:
+    name: str
+    d_sep: float | ToneSeparation
+    orientation_offset: float = 0.0 # in radians, added to the orientation of the grid
+    value_threshold: float | None = None # If set, the layer only covers pixels with a value below the threshold
+
+class LayerGrid:
+    # A view of a grid with rotated directions and coverage limited by value, so that hatch layers share the planes
+    # of one grid instead of building their own. Rotating the interpolated (cos, sin) pair before normalizing gives
+    # the same direction as rotating after normalizing, so the view samples exactly like a rotated grid would.
+    def __init__(self, grid: DepthDirectionValueGrid, orientation_offset: float, value_threshold: float | None):
+        self.grid = grid
+        self.width = grid.width
+        self.height = grid.height
+        self.offset_cos = math.cos(orientation_offset)
+        self.offset_sin = math.sin(orientation_offset)
+        self.value_threshold = value_threshold
+
+    def grid_value(self, x: float, y: float) -> GridValue:
+        gv = self.grid.grid_value(x, y)
+        c, s = gv.direction
+        direction = (c * self.offset_cos - s * self.offset_sin, c * self.offset_sin + s * self.offset_cos)
+        coverage = gv.coverage_value
+        if self.value_threshold is not None and gv.value >= self.value_threshold:
+            coverage = 0.0
+        return GridValue(coverage, gv.depth, direction, gv.value)
+
+    def sample_many(self, xs: np.ndarray | Sequence[float], ys: np.ndarray | Sequence[float]) -> GridSamples:
+        samples = self.grid.sample_many(xs, ys)
+        coverage = samples.coverage
+        if self.value_threshold is not None:
+            coverage = np.where(samples.value < self.value_threshold, coverage, 0.0)
+        return GridSamples(
+            coverage,
+            samples.depth,
+            samples.dir_cos * self.offset_cos - samples.dir_sin * self.offset_sin,
+            samples.dir_cos * self.offset_sin + samples.dir_sin * self.offset_cos,
+            samples.value
+        )
+
+def layer_grid(grid: DepthDirectionValueGrid, layer: HatchLayer) -> DepthDirectionValueGrid | LayerGrid:
+    if layer.orientation_offset == 0.0 and layer.value_threshold is None:
+        return grid
+    return LayerGrid(grid, layer.orientation_offset, layer.value_threshold)
+
+def iter_hatch_layer_streamlines(
+    grid: DepthDirectionValueGrid,
+    layers: Sequence[HatchLayer],
+    rng_seed: int,
+    **streamline_kwargs
+) -> Iterator[tuple[str, Iterator[list[tuple[float, float]]]]]:
+    # One streamline generator per layer, in layer order. Each layer has its own registry, so lines of different
+    # layers may cross; the layer index is added to the seed so that the layers do not start from the same points.
+    # The layers share the planes of the grid, but not the samples: each layer follows its own directions, so apart
+    # from the seed candidates (under 1% of the trace) no two layers sample the same points.
+    for layer_index, layer in enumerate(layers):
+        yield layer.name, iter_flow_field_streamlines(
+            layer_grid(grid, layer),
+            rng_seed + layer_index,
+            d_sep=layer.d_sep,
+            **streamline_kwargs
+        )
+
+def flow_field_hatch_layers(
+    grid: DepthDirectionValueGrid,
+    layers: Sequence[HatchLayer],
+    rng_seed: int,
+    **streamline_kwargs
+) -> dict[str, list[list[tuple[float, float]]]]:
+    assert len({layer.name for layer in layers}) == len(layers), "The layer names must be unique"
+    return {
+        name: list(streamlines)
+        for name, streamlines in iter_hatch_layer_streamlines(grid, layers, rng_seed, **streamline_kwargs)
+    }
+
+def refine_hatch_layers(
+    layer_streamlines: dict[str, list[list[tuple[float, float]]]],
+    fine_grid: DepthDirectionValueGrid,
+    band: RefinementBand,
+    layers: Sequence[HatchLayer],
+    rng_seed: int,
+    **streamline_kwargs
+) -> dict[str, list[list[tuple[float, float]]]]:
+    # refine_streamlines for the result of flow_field_hatch_layers; the band is shared, since depth discontinuities
+    # do not depend on the layer
+    return {
+        layer.name: refine_streamlines(
+            layer_streamlines[layer.name],
+            layer_grid(fine_grid, layer),
+            band,
+            rng_seed + layer_index,
+            d_sep=layer.d_sep,
+            **streamline_kwargs
+        )
+        for layer_index, layer in enumerate(layers)
+    }
@@ -0,0 +1,131 @@
+import math
+
+import numpy as np
+
+from .grid import DepthDirectionValueGrid, GridSamples, GridValue
+
+
+ADAPTIVE_MIN_STEP = 0.1 # in pixels
+
+# Integrators advance a point by one emitted step of signed length h (at most h_max long) along the direction field,
+# starting in direction d0 (the direction at p). They return the new point, the grid value there, and the signed step
+# length to use next. Only the emitted points are tested for coverage, angle, depth and separation; internal stages
+# just sample directions.
+
+def _euler_step(grid: DepthDirectionValueGrid, p: tuple[float, float], d0: tuple[float, float], h: float, h_max: float, tolerance: float) -> tuple[tuple[float, float], GridValue, float]:
+    p_new = (p[0] + d0[0] * h, p[1] + d0[1] * h)
+    return p_new, grid.grid_value(p_new[0], p_new[1]), h
+
+def _midpoint_step(grid: DepthDirectionValueGrid, p: tuple[float, float], d0: tuple[float, float], h: float, h_max: float, tolerance: float) -> tuple[tuple[float, float], GridValue, float]:
+    k2 = grid.grid_value(p[0] + 0.5 * h * d0[0], p[1] + 0.5 * h * d0[1]).direction
+    p_new = (p[0] + h * k2[0], p[1] + h * k2[1])
+    return p_new, grid.grid_value(p_new[0], p_new[1]), h
+
+def _rk4_step(grid: DepthDirectionValueGrid, p: tuple[float, float], d0: tuple[float, float], h: float, h_max: float, tolerance: float) -> tuple[tuple[float, float], GridValue, float]:
+    k1 = d0
+    k2 = grid.grid_value(p[0] + 0.5 * h * k1[0], p[1] + 0.5 * h * k1[1]).direction
+    k3 = grid.grid_value(p[0] + 0.5 * h * k2[0], p[1] + 0.5 * h * k2[1]).direction
+    k4 = grid.grid_value(p[0] + h * k3[0], p[1] + h * k3[1]).direction
+    h_6 = h / 6.0
+    p_new = (
+        p[0] + h_6 * (k1[0] + 2.0 * k2[0] + 2.0 * k3[0] + k4[0]),
+        p[1] + h_6 * (k1[1] + 2.0 * k2[1] + 2.0 * k3[1] + k4[1])
+    )
+    return p_new, grid.grid_value(p_new[0], p_new[1]), h
+
+def _adaptive_rk23_step(grid: DepthDirectionValueGrid, p: tuple[float, float], d0: tuple[float, float], h: float, h_max: float, tolerance: float) -> tuple[tuple[float, float], GridValue, float]:
+    # Bogacki-Shampine 3(2): the direction sampled at the new point is both the last stage of the error estimate and
+    # the first stage of the next step. The step length shrinks (but not below ADAPTIVE_MIN_STEP) until the local error
+    # estimate is below tolerance pixels, and grows again up to h_max.
+    h_initial = h
+    k1 = d0
+    while True:
+        k2 = grid.grid_value(p[0] + 0.5 * h * k1[0], p[1] + 0.5 * h * k1[1]).direction
+        k3 = grid.grid_value(p[0] + 0.75 * h * k2[0], p[1] + 0.75 * h * k2[1]).direction
+        p_new = (
+            p[0] + h * (2.0 / 9.0 * k1[0] + 1.0 / 3.0 * k2[0] + 4.0 / 9.0 * k3[0]),
+            p[1] + h * (2.0 / 9.0 * k1[1] + 1.0 / 3.0 * k2[1] + 4.0 / 9.0 * k3[1])
+        )
+        gv = grid.grid_value(p_new[0], p_new[1])
+        k4 = gv.direction
+        err_x = -5.0 / 72.0 * k1[0] + 1.0 / 12.0 * k2[0] + 1.0 / 9.0 * k3[0] - 1.0 / 8.0 * k4[0]
+        err_y = -5.0 / 72.0 * k1[1] + 1.0 / 12.0 * k2[1] + 1.0 / 9.0 * k3[1] - 1.0 / 8.0 * k4[1]
+        err = abs(h) * math.sqrt(err_x * err_x + err_y * err_y)
+        scale = 0.9 * (tolerance / err) ** (1.0 / 3.0) if err > 0.0 else 2.0
+        if err <= tolerance or abs(h) <= ADAPTIVE_MIN_STEP:
+            return p_new, gv, math.copysign(min(abs(h) * min(scale, 2.0), h_max), h)
+        h = math.copysign(max(abs(h) * max(scale, 0.2), ADAPTIVE_MIN_STEP), h_initial)
+
+INTEGRATORS = {
+    "euler": _euler_step,
+    "midpoint": _midpoint_step,
+    "rk4": _rk4_step,
+    "adaptive_rk23": _adaptive_rk23_step,
+}
+
+# Batched versions of the integrators: the same steps for (N, 2) arrays of points and directions
+# with (N,) signed step lengths, returning the new points, the grid samples there, and the next step lengths
+
+def sample_directions(samples: GridSamples) -> np.ndarray:
+    return np.stack((samples.dir_cos, samples.dir_sin), axis=1)
+
+def _sample(grid: DepthDirectionValueGrid, points: np.ndarray) -> GridSamples:
+    return grid.sample_many(points[:, 0], points[:, 1])
+
+def _euler_steps(grid: DepthDirectionValueGrid, p: np.ndarray, d0: np.ndarray, h: np.ndarray, h_max: float, tolerance: float) -> tuple[np.ndarray, GridSamples, np.ndarray]:
+    p_new = p + d0 * h[:, np.newaxis]
+    return p_new, _sample(grid, p_new), h
+
+def _midpoint_steps(grid: DepthDirectionValueGrid, p: np.ndarray, d0: np.ndarray, h: np.ndarray, h_max: float, tolerance: float) -> tuple[np.ndarray, GridSamples, np.ndarray]:
+    h = h[:, np.newaxis]
+    k2 = sample_directions(_sample(grid, p + 0.5 * h * d0))
+    p_new = p + h * k2
+    return p_new, _sample(grid, p_new), h[:, 0]
+
+def _rk4_steps(grid: DepthDirectionValueGrid, p: np.ndarray, d0: np.ndarray, h: np.ndarray, h_max: float, tolerance: float) -> tuple[np.ndarray, GridSamples, np.ndarray]:
+    h = h[:, np.newaxis]
+    k1 = d0
+    k2 = sample_directions(_sample(grid, p + 0.5 * h * k1))
+    k3 = sample_directions(_sample(grid, p + 0.5 * h * k2))
+    k4 = sample_directions(_sample(grid, p + h * k3))
+    p_new = p + h / 6.0 * (k1 + 2.0 * k2 + 2.0 * k3 + k4)
+    return p_new, _sample(grid, p_new), h[:, 0]
+
+def _adaptive_rk23_steps(grid: DepthDirectionValueGrid, p: np.ndarray, d0: np.ndarray, h: np.ndarray, h_max: float, tolerance: float) -> tuple[np.ndarray, GridSamples, np.ndarray]:
+    # Steps that miss the tolerance are retried with a shorter step, only for the points that missed it
+    h_initial = h
+    h = h.copy()
+    p_out = np.empty_like(p)
+    h_out = np.empty_like(h)
+    planes_out = np.empty((5, len(p)))
+    pending = np.arange(len(p))
+    while len(pending) > 0:
+        hp = h[pending][:, np.newaxis]
+        pp = p[pending]
+        k1 = d0[pending]
+        k2 = sample_directions(_sample(grid, pp + 0.5 * hp * k1))
+        k3 = sample_directions(_sample(grid, pp + 0.75 * hp * k2))
+        p_new = pp + hp * (2.0 / 9.0 * k1 + 1.0 / 3.0 * k2 + 4.0 / 9.0 * k3)
+        samples = _sample(grid, p_new)
+        k4 = sample_directions(samples)
+        err_xy = -5.0 / 72.0 * k1 + 1.0 / 12.0 * k2 + 1.0 / 9.0 * k3 - 1.0 / 8.0 * k4
+        err = np.abs(hp[:, 0]) * np.sqrt(err_xy[:, 0] * err_xy[:, 0] + err_xy[:, 1] * err_xy[:, 1])
+        with np.errstate(divide="ignore"):
+            scale = np.where(err > 0.0, 0.9 * (tolerance / err) ** (1.0 / 3.0), 2.0)
+        done = (err <= tolerance) | (np.abs(hp[:, 0]) <= ADAPTIVE_MIN_STEP)
+
+        finished = pending[done]
+        p_out[finished] = p_new[done]
+        planes_out[:, finished] = [plane[done] for plane in (samples.coverage, samples.depth, samples.dir_cos, samples.dir_sin, samples.value)]
+        h_out[finished] = np.copysign(np.minimum(np.abs(hp[done, 0]) * np.minimum(scale[done], 2.0), h_max), hp[done, 0])
+        retried = pending[~done]
+        h[retried] = np.copysign(np.maximum(np.abs(hp[~done, 0]) * np.maximum(scale[~done], 0.2), ADAPTIVE_MIN_STEP), h_initial[retried])
+        pending = retried
+    return p_out, GridSamples(*planes_out), h_out
+
+BATCH_INTEGRATORS = {
+    "euler": _euler_steps,
+    "midpoint": _midpoint_steps,
+    "rk4": _rk4_steps,
+    "adaptive_rk23": _adaptive_rk23_steps,
+}
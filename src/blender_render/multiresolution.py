@@ -0,0 +1,98 @@
+from collections.abc import Sequence
+import math
+
+import numpy as np
+
+from .grid import DepthDirectionValueGrid, GridSamples, GridValue, output_to_analysis
+from .seeding import depth_discontinuities, dilate
+from .streamlines import iter_flow_field_streamlines
+from .utils import tile_slices
+
+
+class RefinementBand:
+    # The pixels of an analysis grid within a margin of its depth discontinuities, looked up with points in output
+    # pixels. Only this band is traced again at full resolution, so the full resolution grid is never sampled outside.
+    def __init__(self, grid: DepthDirectionValueGrid, analysis_scale: float, max_depth_jump: float, margin: float):
+        self.analysis_scale = analysis_scale
+        # The margin is in output pixels; one extra analysis pixel covers the footprint of the edge pixels
+        edges = depth_discontinuities(grid.coverage > 0.5, grid.depth, max_depth_jump)
+        self.mask = dilate(edges, math.ceil(margin * analysis_scale) + 1)
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        analysis_points = np.rint(output_to_analysis(points, self.analysis_scale)).astype(np.intp).reshape((-1, 2))
+        xs = np.clip(analysis_points[:, 0], 0, self.mask.shape[1] - 1)
+        ys = np.clip(analysis_points[:, 1], 0, self.mask.shape[0] - 1)
+        return self.mask[ys, xs]
+
+    def output_tiles(self, width: int, height: int, tile_size: int) -> list[tuple[slice, slice]]:
+        # The tiles of tile_slices at the output resolution that the band reaches, so that the full resolution render
+        # can skip the others. A tile counts if the band covers an analysis pixel within one output pixel of it, plus
+        # one analysis pixel, since the grid interpolates between neighbouring pixels at the edge of the band.
+        tiles = []
+        for ys, xs in tile_slices(height, width, tile_size):
+            (ax0, ay0), (ax1, ay1) = output_to_analysis(
+                ((xs.start - 1, ys.start - 1), (xs.stop, ys.stop)), self.analysis_scale
+            )
+            ax0 = max(math.floor(ax0) - 1, 0)
+            ay0 = max(math.floor(ay0) - 1, 0)
+            ax1 = math.ceil(ax1) + 2
+            ay1 = math.ceil(ay1) + 2
+            if self.mask[ay0:ay1, ax0:ax1].any():
+                tiles.append((ys, xs))
+        return tiles
+
+    def contains_point(self, x: float, y: float) -> bool:
+        ix = min(max(round((x + 0.5) * self.analysis_scale - 0.5), 0), self.mask.shape[1] - 1)
+        iy = min(max(round((y + 0.5) * self.analysis_scale - 0.5), 0), self.mask.shape[0] - 1)
+        return bool(self.mask[iy, ix])
+
+class BandGrid:
+    # A view of a full resolution grid that is only covered inside a refinement band, so that lines traced on it
+    # stay within the band
+    def __init__(self, grid: DepthDirectionValueGrid, band: RefinementBand):
+        self.grid = grid
+        self.width = grid.width
+        self.height = grid.height
+        self.band = band
+
+    def grid_value(self, x: float, y: float) -> GridValue:
+        gv = self.grid.grid_value(x, y)
+        if not self.band.contains_point(x, y):
+            return GridValue(0.0, gv.depth, gv.direction, gv.value)
+        return gv
+
+    def sample_many(self, xs: np.ndarray | Sequence[float], ys: np.ndarray | Sequence[float]) -> GridSamples:
+        samples = self.grid.sample_many(xs, ys)
+        inside = self.band.contains(np.stack((np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)), axis=-1))
+        samples.coverage = np.where(inside, samples.coverage, 0.0)
+        return samples
+
+def _runs_outside(streamline: np.ndarray, inside: np.ndarray, min_length: int) -> list[np.ndarray]:
+    # The parts of a streamline outside the band with at least min_length points
+    padded = np.concatenate(([True], inside, [True]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return [streamline[start:end] for start, end in zip(edges[0::2], edges[1::2]) if end - start >= min_length]
+
+def refine_streamlines(
+    streamlines: Sequence[list[tuple[float, float]]],
+    fine_grid: DepthDirectionValueGrid,
+    band: RefinementBand,
+    rng_seed: int,
+    min_steps: int,
+    **streamline_kwargs
+) -> list[list[tuple[float, float]]]:
+    # Cuts the band out of streamlines traced on an analysis grid and traces it again on fine_grid, which has the
+    # output resolution. The remaining parts of the coarse lines keep their place and seed the new lines, which are
+    # appended after them. streamline_kwargs are those of iter_flow_field_streamlines, without analysis_scale.
+    kept = []
+    for sl in streamlines:
+        points = np.asarray(sl, dtype=np.float64)
+        kept.extend(list(map(tuple, run.tolist())) for run in _runs_outside(points, band.contains(points), min_steps + 2))
+    refined = iter_flow_field_streamlines(
+        BandGrid(fine_grid, band),
+        rng_seed,
+        min_steps=min_steps,
+        initial_streamlines=kept,
+        **streamline_kwargs
+    )
+    return kept + list(refined)
@@ -0,0 +1,248 @@
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, is_dataclass
+from multiprocessing import shared_memory
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from .grid import DepthDirectionValueGrid
+from .ragged import RaggedPoints
+from .streamlines import StreamlineRegistry, ToneSeparation, flow_field_streamlines, iter_flow_field_streamlines
+from .utils import write_strokes
+
+
+class SharedGridPlanes:
+    # Copies the planes of a grid into a shared memory block that worker processes attach to by name
+    def __init__(self, grid: DepthDirectionValueGrid):
+        self.shape = grid.planes.shape
+        self.shm = shared_memory.SharedMemory(create=True, size=grid.planes.nbytes)
+        self.planes = np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)
+        self.planes[...] = grid.planes
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self):
+        del self.planes
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self) -> "SharedGridPlanes":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Per-process state of pool workers, set up once by _attach_shared_planes
+_worker_shm: shared_memory.SharedMemory | None = None
+_worker_planes: np.ndarray | None = None
+
+def _attach_shared_planes(name: str, shape: tuple[int, int, int]):
+    global _worker_shm, _worker_planes
+    _worker_shm = shared_memory.SharedMemory(name=name)
+    _worker_planes = np.ndarray(shape, dtype=np.float32, buffer=_worker_shm.buf)
+
+@dataclass
+class TileTask:
+    tile_index: int
+    core: tuple[int, int, int, int] # (x0, y0, x1, y1) of the pixels owned by the tile
+    window: tuple[int, int, int, int] # The core extended by the halo and clipped to the grid
+    rng_seed: int
+    streamline_kwargs: dict
+
+def _trace_tile_on(planes: np.ndarray, task: TileTask) -> list[np.ndarray]:
+    wx0, wy0, wx1, wy1 = task.window
+    cx0, cy0, cx1, cy1 = task.core
+    grid = DepthDirectionValueGrid.from_planes(np.ascontiguousarray(planes[:, wy0:wy1, wx0:wx1]))
+    streamlines = flow_field_streamlines(grid, rng_seed=task.rng_seed, **task.streamline_kwargs)
+
+    # A tile owns the streamlines whose middle point lies in its core; lines owned by neighbours are dropped
+    owned = []
+    for sl in streamlines:
+        mx, my = sl[len(sl) // 2]
+        if cx0 <= mx + wx0 < cx1 and cy0 <= my + wy0 < cy1:
+            owned.append(np.array(sl) + (wx0, wy0))
+    return owned
+
+def _trace_tile(task: TileTask) -> list[np.ndarray]:
+    return _trace_tile_on(_worker_planes, task)
+
+def _tile_tasks(width: int, height: int, tile_size: int, halo: int, rng_seed: int, streamline_kwargs: dict) -> list[TileTask]:
+    tasks = []
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            x1 = min(x0 + tile_size, width)
+            y1 = min(y0 + tile_size, height)
+            window = (max(x0 - halo, 0), max(y0 - halo, 0), min(x1 + halo, width), min(y1 + halo, height))
+            # Each tile gets its own seed so that the result does not depend on which worker traces it
+            tile_index = len(tasks)
+            tasks.append(TileTask(tile_index, (x0, y0, x1, y1), window, rng_seed * 1_000_003 + tile_index, streamline_kwargs))
+    return tasks
+
+def tile_halo(max_d_sep: float, max_steps: int, d_step: float) -> int:
+    # The middle point of an owned line is in the core, and each half of a line has at most max_steps // 2 steps of
+    # at most |d_step|, so no owned line reaches the window edge, and the lines it keeps its distance to are in the
+    # window as well
+    return math.ceil((max_steps // 2 + 1) * abs(d_step) + max_d_sep)
+
+def _longest_run(mask: np.ndarray) -> tuple[int, int]:
+    # (start, end) of the longest run of True values in mask
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    if len(edges) == 0:
+        return (0, 0)
+    starts = edges[0::2]
+    ends = edges[1::2]
+    longest = int(np.argmax(ends - starts))
+    return (int(starts[longest]), int(ends[longest]))
+
+def flow_field_streamlines_tiled(
+    grid: DepthDirectionValueGrid,
+    rng_seed: int,
+    d_sep: float | ToneSeparation,
+    d_test_factor: float,
+    min_steps: int,
+    tile_size: int = 512,
+    workers: int = 1,
+    halo: int | None = None,
+    border_policy: str = "trim",
+    fill_gaps: bool = True,
+    **streamline_kwargs
+) -> list[list[tuple[float, float]]]:
+    # Traces the tiles independently (in a process pool if workers > 1) and stitches them in tile order.
+    # During stitching, a streamline that comes closer than d_test_factor * d_sep to an already accepted one is
+    # either dropped (border_policy "reject") or cut down to its longest conflict-free part (border_policy "trim").
+    # With fill_gaps, a serial pass that starts from the stitched lines then fills the gaps this leaves at the seams.
+    # The result depends on rng_seed and tile_size, but not on the number of workers.
+    assert border_policy in ("reject", "trim"), f"Unknown border policy '{border_policy}'"
+    assert streamline_kwargs.get("analysis_scale", 1.0) == 1.0, "Tiled tracing works in grid pixels; rescale the result instead"
+    max_d_sep = d_sep.max_separation if isinstance(d_sep, ToneSeparation) else d_sep
+    if halo is None:
+        halo = tile_halo(max_d_sep, streamline_kwargs["max_steps"], streamline_kwargs["d_step"])
+    assert halo >= max_d_sep, "The halo must be at least d_sep wide"
+
+    streamline_kwargs = dict(streamline_kwargs, d_sep=d_sep, d_test_factor=d_test_factor, min_steps=min_steps)
+    tasks = _tile_tasks(grid.width, grid.height, tile_size, halo, rng_seed, streamline_kwargs)
+    if workers <= 1:
+        tile_streamlines = [_trace_tile_on(grid.planes, task) for task in tasks]
+    else:
+        with SharedGridPlanes(grid) as shared_planes:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_attach_shared_planes,
+                initargs=(shared_planes.name, shared_planes.shape)
+            ) as executor:
+                tile_streamlines = list(executor.map(_trace_tile, tasks))
+
+    registry = StreamlineRegistry(grid.width, grid.height, max_d_sep)
+    streamlines: list[list[tuple[float, float]]] = []
+    for sl in (sl for owned in tile_streamlines for sl in owned):
+        if isinstance(d_sep, ToneSeparation):
+            d_test = d_test_factor * d_sep(grid.sample_many(sl[:, 0], sl[:, 1]).value)
+        else:
+            d_test = d_test_factor * d_sep
+        allowed = registry.points_allowed(sl, d_test, d_test, 0)
+        if not allowed.all():
+            if border_policy == "reject":
+                continue
+            start, end = _longest_run(allowed)
+            sl = sl[start:end]
+        if len(sl) > min_steps + 1:
+            registry.add_streamline(sl)
+            streamlines.append(list(map(tuple, sl.tolist())))
+    if fill_gaps:
+        streamlines.extend(iter_flow_field_streamlines(
+            grid,
+            rng_seed,
+            initial_streamlines=list(streamlines),
+            **streamline_kwargs
+        ))
+    return streamlines
+
+@dataclass
+class SweepResult:
+    index: int # Position of the parameter set in the sweep
+    params: dict
+    streamline_count: int
+    point_count: int
+    total_length: float # Sum of the streamline lengths in pixels
+    seconds: float # Tracing time in the worker
+    streamlines: RaggedPoints | None # None if the streamlines were written to the output directory instead
+
+@dataclass
+class SweepTask:
+    index: int
+    params: dict
+    output_dir: str | None
+
+def sweep_strokes_path(output_dir: str, index: int) -> str:
+    return os.path.join(output_dir, f"sweep_{index:05d}.bin")
+
+def _sweep_on(planes: np.ndarray, task: SweepTask) -> SweepResult:
+    grid = DepthDirectionValueGrid.from_planes(planes)
+    start = time.perf_counter()
+    streamlines = flow_field_streamlines(grid, **task.params)
+    seconds = time.perf_counter() - start
+
+    ragged = RaggedPoints.from_sequences(streamlines, 2, dtype=np.float32)
+    segment_lengths = np.linalg.norm(np.diff(ragged.points, axis=0), axis=1)
+    # Drop the gaps between consecutive streamlines
+    segment_lengths[ragged.offsets[1:-1] - 1] = 0.0
+    result = SweepResult(task.index, task.params, len(ragged), len(ragged.points), float(segment_lengths.sum()), seconds, ragged)
+    if task.output_dir is not None:
+        # Workers write their own results, so that the streamlines never travel back to the main process
+        write_strokes(sweep_strokes_path(task.output_dir, task.index), {"Layer": ragged}, metadata=_summary(result))
+        result.streamlines = None
+    return result
+
+def _sweep(task: SweepTask) -> SweepResult:
+    return _sweep_on(_worker_planes, task)
+
+def _summary(result: SweepResult) -> dict:
+    # Parameters like ToneSeparation are dataclasses, which json cannot serialize on its own
+    params = json.loads(json.dumps(result.params, default=lambda o: asdict(o) if is_dataclass(o) else str(o)))
+    return {
+        "index": result.index,
+        "params": params,
+        "streamline_count": result.streamline_count,
+        "point_count": result.point_count,
+        "total_length": result.total_length,
+        "seconds": result.seconds,
+    }
+
+def parameter_sweep(
+    grid: DepthDirectionValueGrid,
+    param_sets: Sequence[dict],
+    workers: int = 1,
+    output_dir: str | None = None
+) -> Iterator[SweepResult]:
+    # Runs flow_field_streamlines(grid, **params) for every parameter set and yields the results in the order of
+    # param_sets. The grid planes are shared with the workers once. With an output directory, the streamlines of each
+    # set go to sweep_strokes_path(output_dir, index) and a line with its summary is appended to summary.jsonl as soon
+    # as it arrives, and the yielded results carry no streamlines.
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    tasks = [SweepTask(index, dict(params), output_dir) for index, params in enumerate(param_sets)]
+
+    def record(results: Iterator[SweepResult]) -> Iterator[SweepResult]:
+        for result in results:
+            if output_dir is not None:
+                with open(os.path.join(output_dir, "summary.jsonl"), "a") as file:
+                    file.write(json.dumps(_summary(result)) + "\n")
+            yield result
+
+    if workers <= 1:
+        yield from record(_sweep_on(grid.planes, task) for task in tasks)
+        return
+    with SharedGridPlanes(grid) as shared_planes:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_attach_shared_planes,
+            initargs=(shared_planes.name, shared_planes.shape)
+        ) as executor:
+            yield from record(executor.map(_sweep, tasks))
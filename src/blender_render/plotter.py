@@ -0,0 +1,268 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
+from html import escape
+import math
+from typing import TextIO
+
+import numpy as np
+
+from .profiling import DISABLED_PROFILER, Profiler
+from .ragged import RaggedPoints
+
+
+@dataclass
+class StrokeOrder:
+    # Plot order of strokes: stroke order[k] is drawn k-th, from its last point to its first if reverse[k]. The pen
+    # travel (pen up, from the start point through all strokes) is given for the input order, after the greedy
+    # pass and at the end.
+    order: np.ndarray # (M,) int64
+    reverse: np.ndarray # (M,) bool
+    travel_before: float
+    travel_greedy: float
+    travel_after: float
+
+    def apply(self, strokes: RaggedPoints) -> RaggedPoints:
+        ordered = strokes.take(self.order)
+        if not self.reverse.any():
+            return ordered
+        # The point at start + t of a flipped stroke is taken from start + length - 1 - t
+        flipped = np.flatnonzero(self.reverse)
+        lengths = ordered.lengths()[flipped]
+        forward = ordered.point_indices(flipped)
+        indices = np.arange(len(ordered.points))
+        indices[forward] = np.repeat(2 * ordered.offsets[flipped] + lengths - 1, lengths) - forward
+        return RaggedPoints(ordered.points[indices], ordered.offsets)
+
+def stroke_ends(strokes: RaggedPoints) -> tuple[np.ndarray, np.ndarray]:
+    # (M, 2) first and last points of the strokes, which must not be empty
+    assert (strokes.lengths() > 0).all(), "Strokes must not be empty"
+    points = np.asarray(strokes.points[:, :2], dtype=np.float64)
+    return points[strokes.offsets[:-1]], points[strokes.offsets[1:] - 1]
+
+def travel_distance(
+    strokes: RaggedPoints,
+    order: np.ndarray | None = None,
+    reverse: np.ndarray | None = None,
+    start: tuple[float, float] = (0.0, 0.0)
+) -> float:
+    # Pen-up travel from start through the strokes in the given order (default: as stored), with the pen moving from
+    # the last point of each stroke to the first point of the next one
+    firsts, lasts = stroke_ends(strokes)
+    if order is not None:
+        firsts, lasts = firsts[order], lasts[order]
+    if reverse is not None:
+        firsts, lasts = np.where(reverse[:, np.newaxis], lasts, firsts), np.where(reverse[:, np.newaxis], firsts, lasts)
+    exits = np.concatenate((np.asarray(start, dtype=np.float64).reshape((1, 2)), lasts[:-1]))
+    return float(np.sqrt(((firsts - exits) ** 2).sum(axis=1)).sum())
+
+def _greedy_order(firsts: np.ndarray, lasts: np.ndarray, start: tuple[float, float]) -> tuple[np.ndarray, np.ndarray]:
+    # Nearest neighbour tour over the stroke ends: from the current pen position, the stroke with the nearest end
+    # comes next, entered at that end. The ends are bucketed in a uniform grid with about one stroke per cell, and
+    # the search visits rings of cells around the pen until no unvisited end can be nearer than the best one found.
+    stroke_count = len(firsts)
+    ends = np.concatenate((firsts, lasts)) # end e belongs to stroke e % stroke_count
+    lower = ends.min(axis=0)
+    extent = np.maximum(ends.max(axis=0) - lower, 1e-9)
+    cell_size = max(math.sqrt(extent[0] * extent[1] / stroke_count), float(extent.max()) / 4096.0, 1e-9)
+    cells_x = int(extent[0] / cell_size) + 1
+    cells_y = int(extent[1] / cell_size) + 1
+    cell_ids = (np.minimum(((ends - lower) / cell_size).astype(np.int64), (cells_x - 1, cells_y - 1)) * (1, cells_x)).sum(axis=1)
+    buckets: dict[int, set[int]] = {}
+    for e, cell in enumerate(cell_ids.tolist()):
+        buckets.setdefault(cell, set()).add(e)
+    end_points = ends.tolist()
+    lower_x, lower_y = lower.tolist()
+
+    order = np.empty(stroke_count, dtype=np.int64)
+    reverse = np.empty(stroke_count, dtype=bool)
+    x, y = start
+    for k in range(stroke_count):
+        cx = min(max(int((x - lower_x) / cell_size), 0), cells_x - 1)
+        cy = min(max(int((y - lower_y) / cell_size), 0), cells_y - 1)
+        best = -1
+        best_dist_sq = math.inf
+        # Ring r holds the cells at Chebyshev distance r; an end in ring r + 1 or beyond is at least r * cell_size
+        # away from a pen inside the grid (pens outside are clamped to the border, which the bound also covers, since
+        # it only uses distances between cells)
+        radius = 0
+        max_radius = max(cells_x, cells_y)
+        while radius <= max_radius:
+            for iy in range(cy - radius, cy + radius + 1):
+                if iy < 0 or iy >= cells_y:
+                    continue
+                is_edge_row = iy == cy - radius or iy == cy + radius
+                for ix in (range(cx - radius, cx + radius + 1) if is_edge_row else (cx - radius, cx + radius)):
+                    if ix < 0 or ix >= cells_x:
+                        continue
+                    for e in buckets.get(iy * cells_x + ix, ()):
+                        ex, ey = end_points[e]
+                        dist_sq = (ex - x) * (ex - x) + (ey - y) * (ey - y)
+                        if dist_sq < best_dist_sq or (dist_sq == best_dist_sq and e < best):
+                            best = e
+                            best_dist_sq = dist_sq
+            if best >= 0 and math.sqrt(best_dist_sq) <= radius * cell_size - _outside_distance(x, y, lower_x, lower_y, cells_x, cells_y, cell_size):
+                break
+            radius += 1
+
+        stroke = best % stroke_count
+        is_reversed = best >= stroke_count
+        order[k] = stroke
+        reverse[k] = is_reversed
+        for e in (stroke, stroke + stroke_count):
+            buckets[int(cell_ids[e])].discard(e)
+        x, y = end_points[stroke if is_reversed else stroke + stroke_count]
+    return order, reverse
+
+def _outside_distance(x: float, y: float, lower_x: float, lower_y: float, cells_x: int, cells_y: int, cell_size: float) -> float:
+    # How far a pen lies outside the grid, which the ring bound has to make up for
+    dx = max(lower_x - x, x - (lower_x + cells_x * cell_size), 0.0)
+    dy = max(lower_y - y, y - (lower_y + cells_y * cell_size), 0.0)
+    return math.sqrt(dx * dx + dy * dy)
+
+def _two_opt(
+    firsts: np.ndarray,
+    lasts: np.ndarray,
+    order: np.ndarray,
+    reverse: np.ndarray,
+    start: tuple[float, float],
+    window: int,
+    max_passes: int,
+    min_pass_gain: float
+) -> tuple[np.ndarray, np.ndarray]:
+    # Windowed 2-opt: reversing the strokes at positions i + 1..j of the tour (and flipping each of them) only
+    # changes the travel into i + 1 and out of j, so all moves with j - i <= window are scored at once per pass.
+    # The improving moves are then applied from the best one down, skipping those that overlap an applied one.
+    stroke_count = len(order)
+    for _ in range(max_passes):
+        # Entry and exit points by tour position, with the start point as position 0
+        entry = np.where(reverse[:, np.newaxis], lasts[order], firsts[order])
+        exit = np.where(reverse[:, np.newaxis], firsts[order], lasts[order])
+        start_point = np.asarray(start, dtype=np.float64).reshape((1, 2))
+        entry = np.concatenate((start_point, entry))
+        exit = np.concatenate((start_point, exit))
+
+        best_gain = np.zeros(stroke_count)
+        best_j = np.zeros(stroke_count, dtype=np.int64)
+        i = np.arange(stroke_count)
+        removed_in = np.sqrt(((exit[i] - entry[i + 1]) ** 2).sum(axis=1))
+        for width in range(1, min(window, stroke_count) + 1):
+            j = i + width
+            valid = j <= stroke_count
+            iv = i[valid]
+            jv = j[valid]
+            # The travel out of j into j + 1, if there is a next stroke
+            has_next = jv < stroke_count
+            next_entry = entry[np.minimum(jv + 1, stroke_count)]
+            removed_out = np.where(has_next, np.sqrt(((exit[jv] - next_entry) ** 2).sum(axis=1)), 0.0)
+            added_in = np.sqrt(((exit[iv] - exit[jv]) ** 2).sum(axis=1))
+            added_out = np.where(has_next, np.sqrt(((entry[iv + 1] - next_entry) ** 2).sum(axis=1)), 0.0)
+            gain = removed_in[valid] + removed_out - added_in - added_out
+            better = gain > best_gain[valid]
+            best_gain[iv[better]] = gain[better]
+            best_j[iv[better]] = jv[better]
+
+        # Gains below this are rounding noise and could make the passes cycle
+        candidates = np.flatnonzero(best_gain > 1e-9 * (1.0 + removed_in))
+        if len(candidates) == 0:
+            break
+        touched = np.zeros(stroke_count + 2, dtype=bool)
+        applied_gain = 0.0
+        for i0 in candidates[np.argsort(-best_gain[candidates], kind="stable")].tolist():
+            j0 = int(best_j[i0])
+            # The move changes the travel from position i0 through j0 + 1
+            if touched[i0:j0 + 2].any():
+                continue
+            touched[i0:j0 + 2] = True
+            # Tour position p is order index p - 1
+            order[i0:j0] = order[i0:j0][::-1]
+            reverse[i0:j0] = ~reverse[i0:j0][::-1]
+            applied_gain += float(best_gain[i0])
+        # Later passes mostly shuffle the last few moves around
+        if applied_gain < min_pass_gain * removed_in.sum():
+            break
+    return order, reverse
+
+def order_strokes(
+    strokes: RaggedPoints,
+    start: tuple[float, float] = (0.0, 0.0),
+    two_opt_window: int = 32,
+    max_two_opt_passes: int = 20,
+    min_two_opt_pass_gain: float = 0.002,
+    profiler: Profiler = DISABLED_PROFILER
+) -> StrokeOrder:
+    # A plot order with little pen-up travel: a greedy nearest neighbour tour from start, entering each stroke at its
+    # nearer end, followed by windowed 2-opt passes that reverse runs of up to two_opt_window strokes, until a pass
+    # shortens the travel by less than the fraction min_two_opt_pass_gain. Both scale to hundreds of thousands of
+    # strokes. Empty strokes are not allowed; drop them first.
+    firsts, lasts = stroke_ends(strokes)
+    identity = np.arange(len(strokes), dtype=np.int64)
+    no_reverse = np.zeros(len(strokes), dtype=bool)
+    travel_before = travel_distance(strokes, start=start)
+    if len(strokes) == 0:
+        return StrokeOrder(identity, no_reverse, travel_before, travel_before, travel_before)
+    with profiler.stage("plot_order_greedy"):
+        order, reverse = _greedy_order(firsts, lasts, start)
+    travel_greedy = travel_distance(strokes, order, reverse, start)
+    with profiler.stage("plot_order_two_opt"):
+        order, reverse = _two_opt(firsts, lasts, order, reverse, start, two_opt_window, max_two_opt_passes, min_two_opt_pass_gain)
+    travel_after = travel_distance(strokes, order, reverse, start)
+    if travel_after > travel_before:
+        # The input order was better already, e.g. strokes that were ordered before
+        order, reverse, travel_greedy, travel_after = identity, no_reverse, travel_before, travel_before
+    return StrokeOrder(order, reverse, travel_before, travel_greedy, travel_after)
+
+def _format_points(points: np.ndarray, separator: str, precision: int) -> Iterable[str]:
+    return (f"{x:.{precision}f}{separator}{y:.{precision}f}" for x, y in points.tolist())
+
+def write_svg(
+    file: TextIO,
+    layers: dict[str, RaggedPoints],
+    width: float,
+    height: float,
+    stroke_width: float = 1.0,
+    units: str = "",
+    size: tuple[float, float] | None = None,
+    precision: int = 2
+):
+    # Writes strokes in pixel coordinates of a width x height image as one SVG group per layer and one path per
+    # stroke, a stroke at a time, so that nothing but the file grows with the stroke count. Pixel rows count from the
+    # bottom of the image, so y is flipped. size (in units, e.g. "mm") is the printed size, by default the pixel size.
+    size = (width, height) if size is None else size
+    file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    file.write(
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size[0]}{units}" height="{size[1]}{units}" '
+        f'viewBox="0 0 {width} {height}">\n'
+    )
+    for name, strokes in layers.items():
+        file.write(
+            f'<g id="{escape(name, quote=True)}" fill="none" stroke="black" stroke-width="{stroke_width}" '
+            'stroke-linecap="round" stroke-linejoin="round">\n'
+        )
+        for stroke in strokes:
+            if len(stroke) == 0:
+                continue
+            points = np.column_stack((stroke[:, 0], height - stroke[:, 1]))
+            file.write('<path d="M')
+            file.write(" L".join(_format_points(points, " ", precision)))
+            file.write('"/>\n')
+        file.write("</g>\n")
+    file.write("</svg>\n")
+
+def write_hpgl(file: TextIO, layers: dict[str, RaggedPoints], units_per_pixel: float = 1.0):
+    # Writes strokes in pixel coordinates as HPGL, with pen k + 1 for layer k: a pen-up move to the first point of
+    # each stroke and pen-down moves through the rest, a stroke at a time. HPGL has its origin at the bottom left like
+    # the pixel rows. Coordinates are rounded to whole plotter units, of which most plotters have 40 per mm.
+    file.write("IN;\n")
+    for pen, strokes in enumerate(layers.values(), start=1):
+        file.write(f"SP{pen};\n")
+        for stroke in strokes:
+            if len(stroke) == 0:
+                continue
+            points = np.rint(np.asarray(stroke[:, :2], dtype=np.float64) * units_per_pixel).astype(np.int64)
+            # Points that round to the previous one would only slow the plotter down
+            points = points[np.concatenate(([True], (points[1:] != points[:-1]).any(axis=1)))]
+            file.write(f"PU{points[0, 0]},{points[0, 1]};")
+            if len(points) > 1:
+                file.write("PD" + ",".join(f"{x},{y}" for x, y in points[1:].tolist()) + ";")
+            file.write("\n")
+    file.write("PU;SP0;\n")
@@ -0,0 +1,76 @@
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+import json
+import time
+
+import numpy as np
+
+
+class Profiler:
+    # Accumulates wall-clock time per stage and named event counters. A disabled profiler records nothing; the hot
+    # loops check `enabled` once and skip their bookkeeping entirely.
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stage_seconds: dict[str, float] = {}
+        self.stage_calls: dict[str, int] = {}
+        self.counters: dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        if self.enabled:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self) -> dict:
+        stages = {
+            name: {"seconds": seconds, "calls": self.stage_calls[name]}
+            for name, seconds in self.stage_seconds.items()
+        }
+        queries = self.counters.get("registry_queries", 0)
+        candidates = self.counters.get("registry_candidates", 0)
+        simplify_points_in = self.counters.get("simplify_points_in", 0)
+        simplify_points_out = self.counters.get("simplify_points_out", 0)
+        return {
+            "stages": stages,
+            "counters": dict(sorted(self.counters.items())),
+            "registry_candidates_per_query": candidates / queries if queries > 0 else 0.0,
+            "simplify_point_reduction": 1.0 - simplify_points_out / simplify_points_in if simplify_points_in > 0 else 0.0,
+        }
+
+    def write_json(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.report(), file, indent=2)
+
+DISABLED_PROFILER = Profiler(enabled=False)
+
+class CountingGrid:
+    # Stands in for a DepthDirectionValueGrid and counts its samples; only used while profiling
+    def __init__(self, grid, profiler: Profiler):
+        self._grid = grid
+        self._profiler = profiler
+
+    def __getattr__(self, name: str):
+        return getattr(self._grid, name)
+
+    def grid_value(self, x: float, y: float):
+        self._profiler.count("grid_value_calls")
+        return self._grid.grid_value(x, y)
+
+    def sample_many(self, xs: np.ndarray | Sequence[float], ys: np.ndarray | Sequence[float]):
+        self._profiler.count("sample_many_calls")
+        self._profiler.count("sample_many_points", len(xs))
+        return self._grid.sample_many(xs, ys)
@@ -0,0 +1,86 @@
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+import itertools
+
+import numpy as np
+
+
+def point_indices(offsets: np.ndarray, polyline_indices: np.ndarray | Sequence[int]) -> np.ndarray:
+    # Indices of the points of the given polylines, back to back, for polylines stored with the given offsets
+    offsets = np.asarray(offsets, dtype=np.int64)
+    polyline_indices = np.asarray(polyline_indices, dtype=np.int64)
+    lengths = np.diff(offsets)[polyline_indices]
+    starts = offsets[:-1][polyline_indices]
+    first_of_polyline = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) > 0 else lengths
+    return np.repeat(starts - first_of_polyline, lengths) + np.arange(int(lengths.sum()), dtype=np.int64)
+
+@dataclass
+class RaggedPoints:
+    # Variable-length polylines stored back to back: polyline i is points[offsets[i]:offsets[i + 1]]
+    points: np.ndarray # (N, D)
+    offsets: np.ndarray # (M + 1,) int64, starting with 0 and ending with N
+
+    def __post_init__(self):
+        assert self.offsets.ndim == 1 and len(self.offsets) >= 1, "Expected at least one offset"
+        assert self.offsets[0] == 0 and self.offsets[-1] == self.points.shape[0], "The offsets must span all points"
+
+    @classmethod
+    def from_sequences(cls, polylines: Sequence[np.ndarray | Sequence[Sequence[float]]], dimensions: int, dtype=np.float64) -> "RaggedPoints":
+        lengths = np.fromiter((len(pl) for pl in polylines), dtype=np.int64, count=len(polylines))
+        offsets = np.zeros(len(polylines) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        points = np.empty((int(offsets[-1]), dimensions), dtype=dtype)
+        if len(points) > 0:
+            if all(isinstance(pl, np.ndarray) for pl in polylines):
+                np.concatenate(polylines, axis=0, out=points)
+            else:
+                # Flattening the coordinates in Python is much faster than converting each polyline to an array first
+                flat = itertools.chain.from_iterable(itertools.chain.from_iterable(polylines))
+                points.reshape(-1)[:] = np.fromiter(flat, dtype=np.float64, count=points.size)
+        return cls(points, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self.points[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        offsets = self.offsets.tolist()
+        return (self.points[start:end] for start, end in zip(offsets[:-1], offsets[1:]))
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def point_indices(self, polyline_indices: np.ndarray | Sequence[int]) -> np.ndarray:
+        return point_indices(self.offsets, polyline_indices)
+
+    def take(self, polyline_indices: np.ndarray | Sequence[int]) -> "RaggedPoints":
+        polyline_indices = np.asarray(polyline_indices, dtype=np.int64)
+        offsets = np.zeros(len(polyline_indices) + 1, dtype=np.int64)
+        np.cumsum(self.lengths()[polyline_indices], out=offsets[1:])
+        return RaggedPoints(self.points[self.point_indices(polyline_indices)], offsets)
+
+    def keys(self) -> np.ndarray:
+        # A uint64 hash of each polyline, computed from the exact bits of its points, so it is stable across runs
+        # and processes (unlike hash()) as long as the points are
+        with np.errstate(over="ignore"):
+            bits = np.ascontiguousarray(self.points).view(np.uint8).reshape((len(self.points), -1))
+            # Fold the bytes of each point into 64-bit words and mix them with the index of the point in its polyline
+            bits = np.pad(bits, ((0, 0), (0, -bits.shape[1] % 8))).view(np.uint64)
+            lengths = self.lengths()
+            positions = np.arange(len(self.points), dtype=np.uint64) - np.repeat(self.offsets[:-1], lengths).astype(np.uint64)
+            point_hashes = _mix64(positions * np.uint64(0x9E3779B97F4A7C15))
+            for column in bits.T:
+                point_hashes = _mix64(point_hashes ^ column)
+            sums = np.zeros(len(self), dtype=np.uint64)
+            non_empty = lengths > 0
+            if non_empty.any():
+                sums[non_empty] = np.add.reduceat(point_hashes, self.offsets[:-1][non_empty])
+            return _mix64(sums ^ lengths.astype(np.uint64))
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    # The finalizer of SplitMix64
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
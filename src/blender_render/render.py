@@ -7,7 +7,10 @@ import gpu
 import numpy as np
 from mathutils import Matrix, Vector
 
+from .profiling import DISABLED_PROFILER, Profiler
 from .scene import MeshTriangles
+from .session import RendererSession
+from .utils import tile_slices
 
 
 @dataclass
@@ -16,12 +19,16 @@ class ShaderAttribute:
     name: str
 
 class BlenderShaderRenderer:
-    def __init__(self):
-        self.shader = __class__._shader_setup(
+    def __init__(self, session: RendererSession | None = None):
+        # With a session that outlives the renderer (see RendererSession.from_namespace), the shader is only compiled
+        # when its sources changed, and framebuffers and the uploaded geometry are reused across renderers
+        self.session = RendererSession() if session is None else session
+        shader_info = dict(
             name="main_br_shader",
             vertex_source=__class__._read_file("vertex_shader.glsl"),
             fragment_source=__class__._read_file("fragment_shader.glsl"),
             constants=[
+                ShaderAttribute("MAT4", "tileMatrix"),
                 ShaderAttribute("MAT4", "viewProjectionMatrix"),
                 ShaderAttribute("VEC3", "cameraPosition"),
                 ShaderAttribute("VEC3", "light"),
@@ -42,6 +49,10 @@ class BlenderShaderRenderer:
                 ShaderAttribute("VEC4", "fragColor"),
             ]
         )
+        self.shader = self.session.shader(
+            RendererSession.source_key(*shader_info.items()),
+            lambda: __class__._shader_setup(**shader_info)
+        )
 
     @staticmethod
     def _read_file(relative_path: str) -> str:
@@ -102,6 +113,13 @@ class BlenderShaderRenderer:
             batch = gpu.types.GPUBatch(type="TRIS", buf=vertex_buffer)
 
         return batch
+
+    @staticmethod
+    def _allocate_framebuffer(width: int, height: int) -> tuple[gpu.types.GPUFrameBuffer, gpu.types.GPUTexture, gpu.types.GPUTexture]:
+        depth_texture = gpu.types.GPUTexture(size=(width, height), format="DEPTH_COMPONENT32F")
+        color_texture = gpu.types.GPUTexture(size=(width, height), format="RGBA32F")
+        fb = gpu.types.GPUFrameBuffer(depth_slot=depth_texture, color_slots=color_texture)
+        return fb, depth_texture, color_texture
     
     @staticmethod
     def _set_gpu_state():
@@ -154,6 +172,21 @@ class BlenderShaderRenderer:
         rgb_pixels = pixels.reshape((height, width, 4))[:, :, :3]
         return rgb_pixels
 
+    @staticmethod
+    def tile_matrix(x0: int, y0: int, x1: int, y1: int, width: int, height: int) -> Matrix:
+        # Clip space transform that maps the pixels [x0, x1) x [y0, y1) of a width x height frame onto a whole
+        # framebuffer. Rows count from the bottom of the frame, like the rows of the readback.
+        scale_x = width / (x1 - x0)
+        scale_y = height / (y1 - y0)
+        center_x = (x0 + x1) / width - 1.0
+        center_y = (y0 + y1) / height - 1.0
+        return Matrix((
+            (scale_x, 0.0, 0.0, -scale_x * center_x),
+            (0.0, scale_y, 0.0, -scale_y * center_y),
+            (0.0, 0.0, 1.0, 0.0),
+            (0.0, 0.0, 0.0, 1.0),
+        ))
+
     def render_depth_orientation_value(
             self,
             triangles: MeshTriangles,
@@ -163,27 +196,86 @@ class BlenderShaderRenderer:
             is_directional_light: bool,
             orientation_offset: float,
             width: int,
-            height: int
-        ) -> Sequence[tuple[float, float, float]]:
-        batch = __class__._prepare_batch(triangles)
-        depth_texture = gpu.types.GPUTexture(size=(width, height), format="DEPTH_COMPONENT32F")
+            height: int,
+            profiler: Profiler = DISABLED_PROFILER
+        ) -> np.ndarray:
+        batch = self._upload(triangles, profiler)
+        return self._render_pass(
+            batch, Matrix.Identity(4), view_projection_matrix, camera_position, light, is_directional_light,
+            orientation_offset, width, height, profiler
+        )
+
+    def render_depth_orientation_value_tiled(
+            self,
+            triangles: MeshTriangles,
+            view_projection_matrix: Matrix,
+            camera_position: Vector,
+            light: Vector,
+            is_directional_light: bool,
+            orientation_offset: float,
+            width: int,
+            height: int,
+            out: np.ndarray,
+            tile_size: int = 4096,
+            profiler: Profiler = DISABLED_PROFILER,
+            tiles: Sequence[tuple[slice, slice]] | None = None
+        ) -> np.ndarray:
+        # Renders the frame in tiles of at most tile_size x tile_size pixels into out, an array of shape (height,
+        # width, 3) such as the memmap of create_gbuffer, so that the framebuffer and the readback only ever hold one
+        # tile. The tiles see the scene through sub-frustums of the full frame, so the pixels are those of
+        # render_depth_orientation_value. With tiles, e.g. a subset of tile_slices(height, width, tile_size), only
+        # those (ys, xs) slices are rendered and the other pixels of out are left as they are.
+        assert out.shape == (height, width, 3), "out must have the shape (height, width, 3)"
+        batch = self._upload(triangles, profiler)
+        for ys, xs in tile_slices(height, width, tile_size) if tiles is None else tiles:
+            pixels = self._render_pass(
+                batch, __class__.tile_matrix(xs.start, ys.start, xs.stop, ys.stop, width, height), view_projection_matrix,
+                camera_position, light, is_directional_light, orientation_offset, xs.stop - xs.start, ys.stop - ys.start,
+                profiler
+            )
+            with profiler.stage("tile_store"):
+                out[ys, xs] = pixels
+        return out
+
+    def _upload(self, triangles: MeshTriangles, profiler: Profiler) -> gpu.types.GPUBatch:
+        with profiler.stage("gpu_upload"):
+            return self.session.batch(
+                (triangles.vertices, triangles.normals, triangles.indices),
+                lambda: __class__._prepare_batch(triangles)
+            )
+
+    def _render_pass(
+            self,
+            batch: gpu.types.GPUBatch,
+            tile_matrix: Matrix,
+            view_projection_matrix: Matrix,
+            camera_position: Vector,
+            light: Vector,
+            is_directional_light: bool,
+            orientation_offset: float,
+            width: int,
+            height: int,
+            profiler: Profiler
+        ) -> np.ndarray:
+        fb, depth_texture, color_texture = self.session.framebuffer(width, height, __class__._allocate_framebuffer)
         depth_texture.clear(format="FLOAT", value=(1.0,))
-        color_texture = gpu.types.GPUTexture(size=(width, height), format="RGBA32F")
         color_texture.clear(format="FLOAT", value=(-1.0, 0.0, 0.0, 1.0))
-        fb = gpu.types.GPUFrameBuffer(depth_slot=depth_texture, color_slots=color_texture)
         with fb.bind():
+            # The tile matrix only moves the rasterized pixels; the orientations are computed in the full frame
+            self.shader.uniform_float("tileMatrix", tile_matrix)
             self.shader.uniform_float("viewProjectionMatrix", view_projection_matrix)
             self.shader.uniform_float("cameraPosition", camera_position)
             self.shader.uniform_float("light", light)
             self.shader.uniform_bool("isDirectionalLight", is_directional_light)
             self.shader.uniform_float("orientationOffset", orientation_offset)
-            __class__._set_gpu_state()
-            batch.draw(self.shader)
-            __class__._reset_gpu_state()
-            buffer = color_texture.read()
-            buffer.dimensions = width * height * 4
-            buffer_values = [v for v in buffer]
-        depth_orientation_value_pixels = [
-            tuple(buffer_values[i:i+3]) for i in range(0, len(buffer_values), 4)
-        ]
-        return depth_orientation_value_pixels
+            with profiler.stage("gpu_pass"):
+                __class__._set_gpu_state()
+                batch.draw(self.shader)
+                __class__._reset_gpu_state()
+            # Drawing only queues GPU commands, so the readback also waits for the pass to finish
+            with profiler.stage("readback"):
+                buffer = color_texture.read()
+                buffer.dimensions = width * height * 4
+        # View the buffer memory as (height, width, RGBA) without copying; the alpha channel is dropped by slicing
+        pixels = np.frombuffer(buffer, dtype=np.float32, count=width * height * 4).reshape((height, width, 4))
+        return pixels[:, :, :3]
@@ -3,14 +3,29 @@ from collections.abc import Sequence
 from typing import Any
 
 import bpy
+import numpy as np
 from mathutils import Matrix, Vector
 
+from .geometry_cache import GeometryCache
+
 
 @dataclass
 class MeshTriangles:
-    vertices: Sequence[Vector]
-    normals: Sequence[Vector]
-    indices: Sequence[Sequence[int]] | None # One index sequence per triangle; if None, each triplet of vertices forms a triangle.
+    vertices: np.ndarray # (V, 3) float32
+    normals: np.ndarray # (V, 3) float32
+    indices: np.ndarray | None # (T, 3) uint32, one index triplet per triangle; if None, each triplet of vertices forms a triangle.
+
+    @staticmethod
+    def concatenate(parts: Sequence["MeshTriangles"]) -> "MeshTriangles":
+        vertex_offsets = np.cumsum([0] + [len(part.vertices) for part in parts[:-1]])
+        return MeshTriangles(
+            np.concatenate([part.vertices for part in parts] + [np.empty((0, 3), dtype=np.float32)]),
+            np.concatenate([part.normals for part in parts] + [np.empty((0, 3), dtype=np.float32)]),
+            np.concatenate(
+                [part.indices + np.uint32(offset) for part, offset in zip(parts, vertex_offsets)] +
+                [np.empty((0, 3), dtype=np.uint32)]
+            )
+        )
 
 class BlenderScene:
     def __init__(self, light_name: str):
@@ -42,6 +57,19 @@ class BlenderScene:
     def camera_position(self) -> Vector:
         return self.camera.matrix_world.to_translation()
 
+    def drawing_frame(self) -> tuple[Vector, Vector, Vector]:
+        # Origin and axes of the image plane one unit in front of the camera, such that pixel (x, y) of the render
+        # lies at origin + (x / width) * x_axis + (y / height) * y_axis
+        width, height = self.render_resolution()
+        aspect_ratio = width / height
+        ratio = self.ratio_sensor_size_to_focal_length()
+        camera_rotation = self.camera_rotation_matrix()
+        frame_center = self.camera_position() + (camera_rotation @ Vector((0.0, 0.0, -1.0)))
+        frame_x_axis = ratio * min(aspect_ratio, 1.0) * (camera_rotation @ Vector((1.0, 0.0, 0.0)))
+        frame_y_axis = ratio * min(1.0 / aspect_ratio, 1.0) * (camera_rotation @ Vector((0.0, 1.0, 0.0)))
+        frame_origin = frame_center - (0.5 - 0.5/width) * frame_x_axis - (0.5 - 0.5/height) * frame_y_axis
+        return frame_origin, frame_x_axis, frame_y_axis
+
     def light_position(self) -> Vector:
         return self.light.matrix_world.to_translation()
 
@@ -49,40 +77,100 @@ class BlenderScene:
         direction = self.light.matrix_world.to_3x3() @ Vector((0.0, 0.0, 1.0))
         return direction.normalized()
 
-    def world_triangle_data(self) -> MeshTriangles:
-        all_vertices = []
-        all_normals = []
-
+    @staticmethod
+    def _local_triangle_data(mesh: bpy.types.Mesh, geometry_cache: GeometryCache | None = None) -> MeshTriangles:
+        vertex_count = len(mesh.vertices)
+        loop_count = len(mesh.loops)
+
+        co = np.empty(vertex_count * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+        loop_vertex_indices = np.empty(loop_count, dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loop_vertex_indices)
+        use_smooth = np.empty(len(mesh.polygons), dtype=bool)
+        mesh.polygons.foreach_get("use_smooth", use_smooth)
+        loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get("loop_total", loop_totals)
+
+        def read_loop_normals() -> np.ndarray:
+            loop_normals = np.empty(loop_count * 3, dtype=np.float32)
+            mesh.loops.foreach_get("normal", loop_normals)
+            return loop_normals.reshape((-1, 3))
+
+        # The evaluated mesh already reflects the modifier stack; positions, topology and smooth flags determine the
+        # triangle buffers unless custom normals override the corner normals
+        loop_normals = read_loop_normals() if mesh.has_custom_normals else None
+        cache_key = None
+        if geometry_cache is not None:
+            key_arrays = (co, loop_vertex_indices, use_smooth, loop_totals) + ((loop_normals,) if loop_normals is not None else ())
+            cache_key = GeometryCache.content_key(*key_arrays)
+            cached = geometry_cache.get(cache_key)
+            if cached is not None:
+                return MeshTriangles(cached["vertices"], cached["normals"], cached["indices"])
+
+        mesh.calc_loop_triangles()
+        vertex_normals = np.empty(vertex_count * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("normal", vertex_normals)
+        triangle_loops = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("loops", triangle_loops)
+
+        # Smooth corners share their vertex and its normal; flat corners get a vertex of their own carrying the corner normal
+        flat_loops = np.flatnonzero(np.repeat(~use_smooth, loop_totals))
+        co = co.reshape((-1, 3))
+        vertex_normals = vertex_normals.reshape((-1, 3))
+        vertices = co
+        normals = vertex_normals
+        loop_to_vertex = loop_vertex_indices
+        if len(flat_loops) > 0:
+            if loop_normals is None:
+                loop_normals = read_loop_normals()
+            vertices = np.concatenate((co, co[loop_vertex_indices[flat_loops]]))
+            normals = np.concatenate((vertex_normals, loop_normals[flat_loops]))
+            loop_to_vertex = loop_vertex_indices.copy()
+            loop_to_vertex[flat_loops] = vertex_count + np.arange(len(flat_loops), dtype=np.int32)
+
+        indices = loop_to_vertex[triangle_loops].reshape((-1, 3)).astype(np.uint32)
+        if cache_key is not None:
+            geometry_cache.put(cache_key, {"vertices": vertices, "normals": normals, "indices": indices})
+        return MeshTriangles(vertices, normals, indices)
+
+    @staticmethod
+    def _transform_instances(local: MeshTriangles, model_matrices: np.ndarray) -> MeshTriangles:
+        # model_matrices has shape (K, 4, 4); every instance gets its own copy of the local vertices
+        linear = model_matrices[:, :3, :3]
+        translation = model_matrices[:, :3, 3]
+        normal_matrices = np.linalg.inv(linear).transpose((0, 2, 1))
+
+        vertices = local.vertices @ linear.transpose((0, 2, 1)) + translation[:, np.newaxis, :]
+        normals = local.normals @ normal_matrices.transpose((0, 2, 1))
+        normal_lengths = np.linalg.norm(normals, axis=2, keepdims=True)
+        np.divide(normals, normal_lengths, out=normals, where=normal_lengths > 0.0)
+
+        vertex_offsets = np.arange(len(model_matrices), dtype=np.uint32) * np.uint32(len(local.vertices))
+        indices = local.indices[np.newaxis, :, :] + vertex_offsets[:, np.newaxis, np.newaxis]
+        return MeshTriangles(
+            vertices.reshape((-1, 3)).astype(np.float32),
+            normals.reshape((-1, 3)).astype(np.float32),
+            indices.reshape((-1, 3))
+        )
+
+    def world_triangle_data(self, geometry_cache: GeometryCache | None = None) -> MeshTriangles:
         depsgraph = bpy.context.evaluated_depsgraph_get()
 
+        # Instances sharing an evaluated mesh are extracted once and transformed together
+        local_data: dict[int, MeshTriangles] = {}
+        model_matrices: dict[int, list[np.ndarray]] = {}
         for inst in depsgraph.object_instances:
             obj = inst.object
             if obj.type != "MESH" or not inst.show_self:
                 continue
 
             mesh = obj.data
-            model_matrix = inst.matrix_world
-            normal_matrix = model_matrix.inverted().transposed().to_3x3()
-
-            world_vertices = [(model_matrix @ vertex.co.to_4d()).to_3d() for vertex in mesh.vertices]
-            world_vertex_normals = [(normal_matrix @ vertex.normal).normalized() for vertex in mesh.vertices]
-
-            for face in mesh.polygons:
-                face_loops = [mesh.loops[loop_index] for loop_index in face.loop_indices]
-                face_vertices = [world_vertices[loop.vertex_index] for loop in face_loops]
-                if face.use_smooth:
-                    face_normals = [world_vertex_normals[loop.vertex_index] for loop in face_loops]
-                else:
-                    face_normals = [(normal_matrix @ loop.normal).normalized() for loop in face_loops]
-                if len(face_vertices) == 3:
-                    all_vertices.extend(face_vertices)
-                    all_normals.extend(face_normals)
-                elif len(face_vertices) == 4: # Triangulate quads on the fly
-                    all_vertices.extend(face_vertices[:3])
-                    all_normals.extend(face_normals[:3])
-                    all_vertices.extend([face_vertices[0], face_vertices[2], face_vertices[3]])
-                    all_normals.extend([face_normals[0], face_normals[2], face_normals[3]])
-                else:
-                    raise ValueError("Only triangles and quads are supported")
-
-        return MeshTriangles(all_vertices, all_normals, None)
+            key = mesh.as_pointer()
+            if key not in local_data:
+                local_data[key] = __class__._local_triangle_data(mesh, geometry_cache)
+            model_matrices.setdefault(key, []).append(np.array(inst.matrix_world, dtype=np.float64))
+
+        return MeshTriangles.concatenate([
+            __class__._transform_instances(local_data[key], np.stack(matrices))
+            for key, matrices in model_matrices.items()
+        ])
@@ -0,0 +1,116 @@
+from dataclasses import dataclass
+import random
+
+import numpy as np
+
+from .grid import DepthDirectionValueGrid, GridSamples
+
+
+SEED_ORDERS = ("grid", "value", "discontinuity_distance")
+
+def depth_discontinuities(covered: np.ndarray, depth: np.ndarray, max_depth_jump: float) -> np.ndarray:
+    # Pixels next to a silhouette or to a neighbour whose depth differs by more than max_depth_jump
+    edges = np.zeros(covered.shape, dtype=bool)
+    jump_x = (covered[:, 1:] != covered[:, :-1]) | (
+        covered[:, 1:] & covered[:, :-1] & (np.abs(depth[:, 1:] - depth[:, :-1]) > max_depth_jump)
+    )
+    edges[:, 1:] |= jump_x
+    edges[:, :-1] |= jump_x
+    jump_y = (covered[1:, :] != covered[:-1, :]) | (
+        covered[1:, :] & covered[:-1, :] & (np.abs(depth[1:, :] - depth[:-1, :]) > max_depth_jump)
+    )
+    edges[1:, :] |= jump_y
+    edges[:-1, :] |= jump_y
+    return edges
+
+def dilate(mask: np.ndarray, radius: int) -> np.ndarray:
+    # Dilation with a (2 * radius + 1)² square, one pixel per pass and axis
+    dilated = mask.copy()
+    for axis in (0, 1):
+        for _ in range(radius):
+            grown = dilated.copy()
+            if axis == 0:
+                grown[1:, :] |= dilated[:-1, :]
+                grown[:-1, :] |= dilated[1:, :]
+            else:
+                grown[:, 1:] |= dilated[:, :-1]
+                grown[:, :-1] |= dilated[:, 1:]
+            dilated = grown
+    return dilated
+
+@dataclass
+class SeedingMaps:
+    # The grid sampled on a lattice with the given spacing in pixels: which nodes are covered, which lie at a depth
+    # discontinuity, and the distance of each node to the nearest discontinuity in lattice steps (Chebyshev, up to
+    # max_distance). Works with any grid that has sample_many, including the views of hatch layers.
+    spacing: float
+    covered: np.ndarray # (rows, columns) bool
+    discontinuities: np.ndarray # (rows, columns) bool
+    discontinuity_distance: np.ndarray # (rows, columns) int32
+
+    @classmethod
+    def from_grid(cls, grid: DepthDirectionValueGrid, spacing: float, max_depth_jump: float, max_distance: int = 64) -> "SeedingMaps":
+        columns = int((grid.width - 1) / spacing) + 1
+        rows = int((grid.height - 1) / spacing) + 1
+        ys, xs = np.mgrid[0:rows, 0:columns] * spacing
+        samples = grid.sample_many(xs.reshape(-1), ys.reshape(-1))
+        covered = samples.is_covered().reshape((rows, columns))
+        discontinuities = depth_discontinuities(covered, samples.depth.reshape((rows, columns)), max_depth_jump)
+
+        distance = np.full((rows, columns), max_distance, dtype=np.int32)
+        reached = discontinuities
+        for steps in range(max_distance):
+            distance[reached & (distance == max_distance)] = steps
+            if reached.all():
+                break
+            reached = dilate(reached, 1)
+        return cls(spacing, covered, discontinuities, distance)
+
+    def lookup(self, plane: np.ndarray, points: np.ndarray) -> np.ndarray:
+        # Values of a plane at the lattice nodes nearest to an (N, 2) array of points
+        ix = np.clip(np.rint(points[:, 0] / self.spacing).astype(np.intp), 0, plane.shape[1] - 1)
+        iy = np.clip(np.rint(points[:, 1] / self.spacing).astype(np.intp), 0, plane.shape[0] - 1)
+        return plane[iy, ix]
+
+def jittered_seeds(width: int, height: int, seed_box_size: float, rng_seed: int) -> np.ndarray:
+    # One seed at a random position in each box of a grid of boxes of about seed_box_size pixels, row by row
+    rng = random.Random(rng_seed)
+    cell_count_x = int(width / seed_box_size)
+    cell_count_y = int(height / seed_box_size)
+    cell_width = float(width) / float(cell_count_x)
+    cell_height = float(height) / float(cell_count_y)
+    return np.array([
+        (cell_width * (ix + rng.random()), cell_height * (iy + rng.random()))
+        for iy in range(cell_count_y)
+        for ix in range(cell_count_x)
+    ]).reshape((-1, 2))
+
+def seed_candidates(
+    grid: DepthDirectionValueGrid,
+    rng_seed: int,
+    seed_box_size: float,
+    order: str = "grid",
+    max_depth_jump: float | None = None
+) -> tuple[np.ndarray, GridSamples, int]:
+    # The covered jittered seeds, their samples, and the number of seeds dropped for lack of coverage. The seeds
+    # stay in row order ("grid"), or are stably sorted from dark to light ("value") or from far away from depth
+    # discontinuities to close to them ("discontinuity_distance", which needs max_depth_jump between pixels).
+    # The result only depends on the grid and the arguments.
+    assert order in SEED_ORDERS, f"Unknown seed order '{order}'"
+    seeds = jittered_seeds(grid.width, grid.height, seed_box_size, rng_seed)
+    samples = grid.sample_many(seeds[:, 0], seeds[:, 1])
+    covered = samples.is_covered()
+    seeds = seeds[covered]
+    samples = samples[covered]
+
+    if order == "value":
+        ranks = np.argsort(samples.value, kind="stable")
+    elif order == "discontinuity_distance":
+        assert max_depth_jump is not None, "Ordering by discontinuity distance needs max_depth_jump"
+        # A lattice of a quarter seed box resolves the distances well enough to order the boxes
+        spacing = max(1.0, 0.25 * seed_box_size)
+        maps = SeedingMaps.from_grid(grid, spacing, max_depth_jump * spacing)
+        ranks = np.argsort(-maps.lookup(maps.discontinuity_distance, seeds), kind="stable")
+    else:
+        ranks = np.arange(len(seeds))
+    return seeds[ranks], samples[ranks], int(len(covered) - covered.sum())
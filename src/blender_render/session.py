@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from collections.abc import Callable, MutableMapping
+from dataclasses import dataclass
+import hashlib
+
+import numpy as np
+
+from .geometry_cache import GeometryCache
+
+
+@dataclass
+class RendererSessionStats:
+    shader_compiles: int = 0
+    shader_reuses: int = 0
+    framebuffer_allocations: int = 0
+    framebuffer_reuses: int = 0
+    batch_uploads: int = 0
+    batch_reuses: int = 0
+
+class RendererSession:
+    # GPU resources that outlive a run of main.py: compiled shaders by source hash, framebuffers by size, and the batch
+    # of the last uploaded geometry. The resources live in a plain dict, e.g. in bpy.app.driver_namespace, so that the
+    # reloaded modules of the next run can use them; this class only wraps that dict. Nothing here calls gpu itself,
+    # the GPU objects are made by the callbacks of the renderer.
+    NAMESPACE_KEY = "blender_render_renderer_session"
+    # Sizes that are rendered alternately, e.g. the analysis and the refinement resolution, each keep their buffers
+    MAX_FRAMEBUFFERS = 4
+
+    def __init__(self, state: MutableMapping | None = None):
+        self.state = {} if state is None else state
+        self.state.setdefault("shaders", {})
+        self.state.setdefault("framebuffers", OrderedDict())
+        self.state.setdefault("batch", None)
+        self.stats = RendererSessionStats()
+
+    @classmethod
+    def from_namespace(cls, namespace: MutableMapping) -> "RendererSession":
+        # The session stored in namespace, which is created on first use
+        return cls(namespace.setdefault(cls.NAMESPACE_KEY, {}))
+
+    @staticmethod
+    def source_key(*parts: object) -> str:
+        # Hash of shader sources and interface descriptions; parts are hashed by their repr
+        digest = hashlib.blake2b(digest_size=20)
+        for part in parts:
+            digest.update(repr(part).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def shader(self, key: str, compile_shader: Callable[[], object]) -> object:
+        shaders = self.state["shaders"]
+        shader = shaders.get(key)
+        if shader is None:
+            shader = compile_shader()
+            shaders[key] = shader
+            self.stats.shader_compiles += 1
+        else:
+            self.stats.shader_reuses += 1
+        return shader
+
+    def framebuffer(self, width: int, height: int, allocate: Callable[[int, int], tuple]) -> tuple:
+        # The resources returned by allocate(width, height) for this size, e.g. (framebuffer, depth, color) textures.
+        # Their content is left from the previous use, so they must be cleared before drawing.
+        framebuffers = self.state["framebuffers"]
+        resources = framebuffers.get((width, height))
+        if resources is None:
+            resources = allocate(width, height)
+            framebuffers[(width, height)] = resources
+            self.stats.framebuffer_allocations += 1
+            while len(framebuffers) > __class__.MAX_FRAMEBUFFERS:
+                framebuffers.popitem(last=False)
+        else:
+            framebuffers.move_to_end((width, height))
+            self.stats.framebuffer_reuses += 1
+        return resources
+
+    def batch(self, arrays: tuple[np.ndarray | None, ...], upload: Callable[[], object]) -> object:
+        # The batch of the last upload if its arrays had the same content, otherwise the result of upload(). Only one
+        # batch is kept, since a new scene state replaces the previous one.
+        key = GeometryCache.content_key(*(np.zeros(0) if a is None else a for a in arrays), np.array([a is None for a in arrays]))
+        cached = self.state["batch"]
+        if cached is not None and cached[0] == key:
+            self.stats.batch_reuses += 1
+            return cached[1]
+        # Release the previous vertex buffers before uploading the new ones
+        self.state["batch"] = None
+        batch = upload()
+        self.state["batch"] = (key, batch)
+        self.stats.batch_uploads += 1
+        return batch
+
+    def clear(self):
+        self.state["shaders"].clear()
+        self.state["framebuffers"].clear()
+        self.state["batch"] = None
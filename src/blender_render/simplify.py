@@ -0,0 +1,66 @@
+import numpy as np
+
+from .profiling import DISABLED_PROFILER, Profiler
+from .ragged import RaggedPoints
+
+
+def _segment_distances(points: np.ndarray, indices: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # Distance of points[indices] to the chords points[starts] -> points[ends]
+    a = points[starts]
+    ab = points[ends] - a
+    ap = points[indices] - a
+    ab_length_sq = np.einsum("ij,ij->i", ab, ab)
+    t = np.divide(np.einsum("ij,ij->i", ap, ab), ab_length_sq, out=np.zeros_like(ab_length_sq), where=ab_length_sq > 0.0)
+    closest = ap - np.clip(t, 0.0, 1.0)[:, np.newaxis] * ab
+    return np.sqrt(np.einsum("ij,ij->i", closest, closest))
+
+def simplify_strokes(strokes: RaggedPoints, tolerance: float, profiler: Profiler = DISABLED_PROFILER) -> RaggedPoints:
+    # Ramer–Douglas–Peucker simplification of all strokes at once: every pass splits all open segments of all
+    # strokes at their farthest point, so the number of passes grows with the depth of the recursion, not with the
+    # number of strokes or points. Points closer than tolerance to the simplified stroke are dropped; the end points
+    # are always kept. The tolerance is in the units of the points, e.g. pixels before streamlines_to_strokes.
+    points = np.asarray(strokes.points, dtype=np.float64)
+    offsets = np.asarray(strokes.offsets, dtype=np.int64)
+    keep = np.zeros(len(points), dtype=bool)
+    non_empty = offsets[1:] > offsets[:-1]
+    keep[offsets[:-1][non_empty]] = True
+    keep[offsets[1:][non_empty] - 1] = True
+
+    # Open segments (start, end) with points between them; the end points are kept
+    starts = offsets[:-1][non_empty]
+    ends = offsets[1:][non_empty] - 1
+    while True:
+        open_segments = ends - starts > 1
+        starts = starts[open_segments]
+        ends = ends[open_segments]
+        if len(starts) == 0:
+            break
+        # The inner points of all segments back to back, with the index of their segment
+        inner_counts = ends - starts - 1
+        segment_ids = np.repeat(np.arange(len(starts)), inner_counts)
+        inner_offsets = np.concatenate(([0], np.cumsum(inner_counts)[:-1]))
+        indices = starts[segment_ids] + 1 + (np.arange(len(segment_ids)) - inner_offsets[segment_ids])
+        distances = _segment_distances(points, indices, starts[segment_ids], ends[segment_ids])
+
+        # The first farthest point of each segment
+        max_distances = np.maximum.reduceat(distances, inner_offsets)
+        is_farthest = distances == max_distances[segment_ids]
+        farthest_segments, first = np.unique(segment_ids[is_farthest], return_index=True)
+        farthest = np.flatnonzero(is_farthest)[first]
+        assert len(farthest_segments) == len(starts)
+
+        splits = max_distances > tolerance
+        split_points = indices[farthest[splits]]
+        keep[split_points] = True
+        starts, ends = (
+            np.concatenate((starts[splits], split_points)),
+            np.concatenate((split_points, ends[splits]))
+        )
+
+    kept_counts = np.add.reduceat(keep.astype(np.int64), offsets[:-1][non_empty]) if non_empty.any() else np.zeros(0, dtype=np.int64)
+    kept_offsets = np.zeros(len(offsets), dtype=np.int64)
+    kept_offsets[1:][non_empty] = kept_counts
+    np.cumsum(kept_offsets, out=kept_offsets)
+    profiler.count("simplify_points_in", len(points))
+    profiler.count("simplify_points_out", int(kept_offsets[-1]))
+    return RaggedPoints(strokes.points[keep], kept_offsets)
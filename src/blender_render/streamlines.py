@@ -1,46 +1,101 @@
 from collections import deque
 from dataclasses import dataclass
+from collections.abc import Iterable, Iterator, Sequence
 import math
-import random
+import time
 import numpy as np
 
-from .grid import DepthDirectionValueGrid
+from .grid import DepthDirectionValueGrid, analysis_to_output, output_to_analysis
+from .integrators import INTEGRATORS
+from .profiling import DISABLED_PROFILER, CountingGrid, Profiler
+from .ragged import RaggedPoints
+from .seeding import seed_candidates
+from .wavefront import separated_subset, trace_lockstep
 
 
+SEPARATION_TEST_CHUNK_SIZE = 16
+# Jittered seeds are tested against the registry in chunks of this size before they are traced one by one
+SEED_PREFILTER_CHUNK_SIZE = 64
+
 @dataclass
-class StreamlineRegistryEntry:
-    point: tuple[float, float]
-    streamline_id: int
+class ToneSeparation:
+    # Separation distance as a function of the value channel, from d_sep_dark at value 0 to d_sep_light at value 1.
+    # Works on floats and on NumPy arrays of values.
+    d_sep_dark: float
+    d_sep_light: float
+    gamma: float = 1.0
+
+    def __call__(self, value: float | np.ndarray) -> float | np.ndarray:
+        t = np.clip(value, 0.0, 1.0) ** self.gamma
+        return self.d_sep_dark + (self.d_sep_light - self.d_sep_dark) * t
+
+    @property
+    def max_separation(self) -> float:
+        return max(self.d_sep_dark, self.d_sep_light)
+
+    def scaled(self, factor: float) -> "ToneSeparation":
+        return ToneSeparation(factor * self.d_sep_dark, factor * self.d_sep_light, self.gamma)
 
 class StreamlineRegistry:
-    def __init__(self, width: int, height: int, cell_size: float):
+    INITIAL_CELL_CAPACITY = 16
+
+    def __init__(self, width: int, height: int, cell_size: float, profiler: Profiler = DISABLED_PROFILER):
         self.width = float(width)
         self.height = float(height)
         self.cell_size = cell_size
         self.cells_x = math.ceil(self.width / cell_size)
         self.cells_y = math.ceil(self.height / cell_size)
         self.next_streamline_id = 1
-        self.cell_content: list[list[StreamlineRegistryEntry]] = [[] for _ in range(self.cells_x * self.cells_y)]
+        # Per-cell point and id slots, padded to a common capacity so that any block of neighbouring cells is a single
+        # array view. Points are stored as complex numbers x + iy, which turns a distance test into a subtraction and
+        # an abs. Unused slots hold infinite coordinates and never pass a distance test.
+        self.cell_counts = np.zeros((self.cells_y, self.cells_x), dtype=np.int64)
+        self.max_cell_count = 0
+        self.cell_points = np.full((self.cells_y, self.cells_x, __class__.INITIAL_CELL_CAPACITY), complex(np.inf, np.inf))
+        self.cell_ids = np.zeros((self.cells_y, self.cells_x, __class__.INITIAL_CELL_CAPACITY), dtype=np.int64)
+        self.profiler = profiler
 
-    def _cell_coordinates(self, p: tuple[float, float]) -> tuple[int, int]:
-        cx = max(min(int(p[0] / self.cell_size), self.cells_x - 1), 0)
-        cy = max(min(int(p[1] / self.cell_size), self.cells_y - 1), 0)
-        return (cx, cy)
+    def _cell_indices(self, points: np.ndarray) -> np.ndarray:
+        cx = np.clip((points[:, 0] / self.cell_size).astype(np.int64), 0, self.cells_x - 1)
+        cy = np.clip((points[:, 1] / self.cell_size).astype(np.int64), 0, self.cells_y - 1)
+        return cy * self.cells_x + cx
 
-    def _cell_index(self, p: tuple[float, float]) -> int:
-        ix, iy = self._cell_coordinates(p)
-        return iy * self.cells_x + ix
+    def _grow(self, capacity: int):
+        def grown(slots: np.ndarray, fill_value) -> np.ndarray:
+            result = np.full((self.cells_y, self.cells_x, capacity), fill_value, dtype=slots.dtype)
+            result[:, :, :slots.shape[2]] = slots
+            return result
 
-    def _cell(self, ix: int, iy: int) -> list[StreamlineRegistryEntry]:
-        idx = iy * self.cells_x + ix
-        return self.cell_content[idx]
+        self.cell_points = grown(self.cell_points, complex(np.inf, np.inf))
+        self.cell_ids = grown(self.cell_ids, 0)
 
-    def add_streamline(self, streamline: list[tuple[float, float]]) -> int:
+    def add_streamline(self, streamline: np.ndarray | list[tuple[float, float]]) -> int:
         sid = self.next_streamline_id
         self.next_streamline_id += 1
-        for p in streamline:
-            idx = self._cell_index(p)
-            self.cell_content[idx].append(StreamlineRegistryEntry(p, sid))
+        points = np.asarray(streamline, dtype=np.float64).reshape((-1, 2))
+        if points.shape[0] == 0:
+            return sid
+
+        # Rank every point among the points of this streamline that fall into the same cell to find its slot
+        cells = self._cell_indices(points)
+        order = np.argsort(cells, kind="stable")
+        sorted_cells = cells[order]
+        group_starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(cells)])
+        ranks = np.empty_like(order)
+        ranks[order] = np.arange(len(cells)) - np.repeat(group_starts, group_sizes)
+
+        flat_counts = self.cell_counts.reshape(-1)
+        slots = flat_counts[cells] + ranks
+        required_capacity = int(slots.max()) + 1
+        if required_capacity > self.cell_ids.shape[2]:
+            self._grow(max(required_capacity, 2 * self.cell_ids.shape[2]))
+
+        capacity = self.cell_ids.shape[2]
+        self.cell_points.reshape((-1, capacity))[cells, slots] = points[:, 0] + 1j * points[:, 1]
+        self.cell_ids.reshape((-1, capacity))[cells, slots] = sid
+        flat_counts[sorted_cells[group_starts]] += group_sizes
+        self.max_cell_count = max(self.max_cell_count, required_capacity)
         return sid
 
     def is_point_allowed(
@@ -50,48 +105,112 @@ class StreamlineRegistry:
         d_sep_relaxed: float,
         relaxed_streamline_id: int
     ) -> bool:
-        if not (0.0 <= p[0] < self.width - 1.0 and 0.0 <= p[1] < self.height - 1.0):
+        if self.profiler.enabled:
+            self.profiler.count("registry_queries")
+        x, y = p
+        if not (0.0 <= x < self.width - 1.0 and 0.0 <= y < self.height - 1.0):
             return False
+        if self.max_cell_count == 0:
+            return True
 
+        # A single point pays for every NumPy call, so this takes as few of them as possible: the nearest candidate
+        # decides most queries without looking at streamline ids
         cell_radius = math.ceil(d_sep / self.cell_size)
-        ix_cell, iy_cell = self._cell_coordinates(p)
-        ix_min = max(ix_cell - cell_radius, 0)
-        ix_max = min(ix_cell + cell_radius, self.cells_x - 1)
+        ix_cell = min(int(x / self.cell_size), self.cells_x - 1)
+        iy_cell = min(int(y / self.cell_size), self.cells_y - 1)
         iy_min = max(iy_cell - cell_radius, 0)
-        iy_max = min(iy_cell + cell_radius, self.cells_y - 1)
-
-        for iy in range(iy_min, iy_max + 1):
-            for ix in range(ix_min, ix_max + 1):
-                cell = self._cell(ix, iy)
-                for candidate in cell:
-                    min_dist = d_sep_relaxed if candidate.streamline_id == relaxed_streamline_id else d_sep
-                    x_diff = candidate.point[0] - p[0]
-                    y_diff = candidate.point[1] - p[1]
-                    dist = math.sqrt(x_diff * x_diff + y_diff * y_diff)
-                    if dist < min_dist:
-                        return False
-        return True
+        ix_min = max(ix_cell - cell_radius, 0)
+        if self.profiler.enabled:
+            self.profiler.count("registry_candidates", int(self.cell_counts[iy_min:iy_cell + cell_radius + 1, ix_min:ix_cell + cell_radius + 1].sum()))
+
+        block = (slice(iy_min, iy_cell + cell_radius + 1), slice(ix_min, ix_cell + cell_radius + 1), slice(0, self.max_cell_count))
+        dist = np.abs(self.cell_points[block] - complex(x, y))
+        nearest = dist.min()
+        max_dist = max(d_sep, d_sep_relaxed)
+        if nearest >= max_dist:
+            return True
+        if d_sep_relaxed == d_sep or nearest < min(d_sep, d_sep_relaxed):
+            return False
+
+        # The remaining close candidates lie between both distances and only violate the larger one
+        close_ids = self.cell_ids[block][dist < max_dist]
+        if d_sep_relaxed < d_sep:
+            return bool((close_ids == relaxed_streamline_id).all())
+        return not (close_ids == relaxed_streamline_id).any()
+
+    def points_allowed(
+        self,
+        points: np.ndarray,
+        d_sep: float | np.ndarray,
+        d_sep_relaxed: float | np.ndarray,
+        relaxed_streamline_id: int
+    ) -> np.ndarray:
+        # Vectorized is_point_allowed for an (N, 2) array of points; the distances may be given per point
+        points = np.asarray(points, dtype=np.float64).reshape((-1, 2))
+        if self.profiler.enabled:
+            self.profiler.count("registry_queries", len(points))
+        xs = points[:, 0]
+        ys = points[:, 1]
+        allowed = (0.0 <= xs) & (xs < self.width - 1.0) & (0.0 <= ys) & (ys < self.height - 1.0)
+        if self.max_cell_count == 0 or not allowed.any():
+            return allowed
+
+        is_variable = np.ndim(d_sep) > 0 or np.ndim(d_sep_relaxed) > 0
+        is_relaxed = not np.array_equal(d_sep_relaxed, d_sep) if is_variable else d_sep_relaxed != d_sep
+        if is_variable:
+            d_sep = np.broadcast_to(np.asarray(d_sep, dtype=np.float64), (len(points),))[:, np.newaxis, np.newaxis]
+            d_sep_relaxed = np.broadcast_to(np.asarray(d_sep_relaxed, dtype=np.float64), (len(points),))[:, np.newaxis, np.newaxis]
+
+        # Neighbour cells beyond the border are clamped onto border cells, which only repeats candidates
+        cell_radius = math.ceil(float(np.max(d_sep)) / self.cell_size) if is_variable else math.ceil(d_sep / self.cell_size)
+        offsets = np.arange(-cell_radius, cell_radius + 1)
+        cx = np.clip((xs / self.cell_size).astype(np.int64), 0, self.cells_x - 1)
+        cy = np.clip((ys / self.cell_size).astype(np.int64), 0, self.cells_y - 1)
+        neighbour_cx = np.clip(cx[:, np.newaxis] + offsets, 0, self.cells_x - 1)
+        neighbour_cy = np.clip(cy[:, np.newaxis] + offsets, 0, self.cells_y - 1)
+        cells = (neighbour_cy[:, :, np.newaxis] * self.cells_x + neighbour_cx[:, np.newaxis, :]).reshape((len(points), -1))
+        if self.profiler.enabled:
+            self.profiler.count("registry_candidates", int(self.cell_counts.reshape(-1)[cells].sum()))
+
+        capacity = self.cell_ids.shape[2]
+        dist = np.abs(self.cell_points.reshape((-1, capacity))[cells, :self.max_cell_count] - (xs + 1j * ys)[:, np.newaxis, np.newaxis])
+        if not is_relaxed:
+            min_dist = d_sep
+        else:
+            candidate_ids = self.cell_ids.reshape((-1, capacity))[cells, :self.max_cell_count]
+            min_dist = np.where(candidate_ids == relaxed_streamline_id, d_sep_relaxed, d_sep)
+        allowed &= ~(dist < min_dist).any(axis=(1, 2))
+        return allowed
 
 def flow_field_streamline(
     grid: DepthDirectionValueGrid,
     streamline_registry: StreamlineRegistry,
     start_from_streamline_id: int,
     p_start: tuple[float, float],
-    d_sep: float,
+    d_sep: float | ToneSeparation,
     d_test_factor: float,
     d_step: float,
     max_depth_step: float,
     max_accum_angle: float,
     max_steps: int,
     min_steps: int,
+    integrator: str = "euler",
+    tolerance: float = 0.05,
+    profiler: Profiler = DISABLED_PROFILER,
 ) -> list[tuple[float, float]] | None:
+    integrate = INTEGRATORS[integrator]
     gv_start = grid.grid_value(p_start[0], p_start[1])
     if gv_start is None or not gv_start.is_covered():
+        profiler.count("seeds_rejected_coverage")
         return None
-    
+
+    # With a ToneSeparation, every point is tested against the separation at its own value
+    separation = d_sep if isinstance(d_sep, ToneSeparation) else None
+    d_sep_start = float(separation(gv_start.value)) if separation is not None else d_sep
     if not streamline_registry.is_point_allowed(
-        p_start, d_sep, d_test_factor * d_sep, start_from_streamline_id
+        p_start, d_sep_start, d_test_factor * d_sep_start, start_from_streamline_id
     ):
+        profiler.count("seeds_rejected_separation")
         return None
 
     def continue_line(
@@ -107,30 +226,55 @@ def flow_field_streamline(
         next_dir = direction0
         last_depth = depth0
         accum_angle = 0.0
+        d_sep_l = d_test_factor * d_sep_start
 
-        for _ in range(step_count):
-            p_new = (
-                lp_last[0] + next_dir[0] * step,
-                lp_last[1] + next_dir[1] * step
-            )
-            gv = grid.grid_value(p_new[0], p_new[1])
-            new_dir = gv.direction
-            dot = max(-1.0, min(1.0, next_dir[0]*new_dir[0] + next_dir[1]*new_dir[1]))
-            accum_angle += math.acos(dot)
-            d_sep_l = d_test_factor * d_sep
-            if (not gv.is_covered() or
-                accum_angle > accum_limit or
-                abs(gv.depth - last_depth) > max_depth_step or
-                not streamline_registry.is_point_allowed(p_new, d_sep_l, d_sep_l, 0)):
-                break
+        # The registry does not change while a line is traced, so the separation test runs once per chunk of steps
+        # and the line is cut at the first point that is too close to another streamline
+        steps_left = step_count
+        # Why the line stopped growing; only reported to the profiler
+        termination = "max_steps"
+        while steps_left > 0:
+            chunk: list[tuple[float, float]] = []
+            chunk_values: list[float] = []
+            is_terminated = False
+            for _ in range(min(SEPARATION_TEST_CHUNK_SIZE, steps_left)):
+                p_new, gv, step = integrate(grid, lp_last, next_dir, step, d_step, tolerance)
+                new_dir = gv.direction
+                dot = max(-1.0, min(1.0, next_dir[0]*new_dir[0] + next_dir[1]*new_dir[1]))
+                accum_angle += math.acos(dot)
+                if (not gv.is_covered() or
+                    accum_angle > accum_limit or
+                    abs(gv.depth - last_depth) > max_depth_step):
+                    is_terminated = True
+                    if profiler.enabled:
+                        if not gv.is_covered():
+                            termination = "coverage"
+                        elif accum_angle > accum_limit:
+                            termination = "angle"
+                        else:
+                            termination = "depth_jump"
+                    break
 
-            line.append(p_new)
-            lp_last = p_new
-            next_dir = gv.direction
-            last_depth = gv.depth
-        return line
+                chunk.append(p_new)
+                chunk_values.append(gv.value)
+                lp_last = p_new
+                next_dir = gv.direction
+                last_depth = gv.depth
+            steps_left -= SEPARATION_TEST_CHUNK_SIZE
 
-    gv_start = grid.grid_value(p_start[0], p_start[1])
+            if chunk:
+                if separation is not None:
+                    d_sep_l = d_test_factor * separation(np.array(chunk_values))
+                allowed = streamline_registry.points_allowed(chunk, d_sep_l, d_sep_l, 0)
+                if not allowed.all():
+                    line.extend(chunk[:int(np.argmin(allowed))])
+                    termination = "separation"
+                    break
+                line.extend(chunk)
+            if is_terminated:
+                break
+        profiler.count(f"line_ends_{termination}")
+        return line
 
     # forward and backward
     fwd = continue_line(p_start, gv_start.direction, gv_start.depth,
@@ -139,85 +283,445 @@ def flow_field_streamline(
                         -d_step, 0.5 * max_accum_angle, max_steps // 2)
     # combine
     line = list(reversed(bwd)) + [p_start] + fwd
-    return line if len(line) > (min_steps + 1) else None
+    if len(line) > (min_steps + 1):
+        profiler.count("streamlines_accepted")
+        return line
+    profiler.count("streamlines_rejected_too_short")
+    return None
 
-def flow_field_streamlines(
+def perpendicular_seeds(
+    grid: DepthDirectionValueGrid,
+    streamline: list[tuple[float, float]],
+    d_sep: float | ToneSeparation
+) -> np.ndarray:
+    # Two candidate seeds per streamline point, offset by d_sep to either side; ordered point-major, then sign (-1, 1)
+    points = np.asarray(streamline, dtype=np.float64)
+    samples = grid.sample_many(points[:, 0], points[:, 1])
+    normals = np.stack((-samples.dir_sin, samples.dir_cos), axis=1)
+    signs = np.array((-1.0, 1.0))
+    if isinstance(d_sep, ToneSeparation):
+        offsets = signs[np.newaxis, :, np.newaxis] * d_sep(samples.value)[:, np.newaxis, np.newaxis]
+    else:
+        offsets = signs[np.newaxis, :, np.newaxis] * d_sep
+    seeds = points[:, np.newaxis, :] + offsets * normals[:, np.newaxis, :]
+    return seeds.reshape((-1, 2))
+
+def _iter_wavefront_streamlines(
+    grid: DepthDirectionValueGrid,
+    registry,
+    queue: deque,
+    seeds: np.ndarray,
+    d_sep: float | ToneSeparation,
+    d_test_factor: float,
+    d_step: float,
+    max_depth_step: float,
+    max_accum_angle: float,
+    max_steps: int,
+    min_steps: int,
+    integrator: str,
+    tolerance: float,
+    batch_size: int,
+    deadline: float | None,
+    max_streamlines: int | None,
+    profiler: Profiler
+) -> Iterator[list[tuple[float, float]]]:
+    # The search of iter_flow_field_streamlines with the candidate seeds taken batch_size at a time, in the same
+    # order: first the jittered seeds, then the perpendicular seeds of the queued streamlines. A spread out subset of
+    # the candidates of a batch is traced together by trace_lockstep against the registry as it was before the
+    # batch. Then all candidates are committed one by one: the seed is tested again, and each traced half-line is cut
+    # at its first point that is too close to a streamline committed since; the other candidates are traced alone.
+    # The registry only grows, so this gives the streamlines of the serial search, up to the rounding differences
+    # between the scalar and the batched arithmetic.
+    assert batch_size > 0, "batch_size must be positive"
+    separation = d_sep if isinstance(d_sep, ToneSeparation) else None
+    max_d_test = d_test_factor * (separation.max_separation if separation is not None else d_sep)
+
+    def d_sep_at(values: np.ndarray) -> float | np.ndarray:
+        return separation(values) if separation is not None else d_sep
+
+    def d_test_at(values: np.ndarray) -> float | np.ndarray:
+        return d_test_factor * d_sep_at(values)
+
+    # (id of the streamline the seed may start next to, seed)
+    candidates: deque = deque((0, seed) for seed in seeds.tolist())
+    streamline_count = 0
+    stage_start = time.perf_counter()
+    while True:
+        # The queue only grows when a batch is committed, so it is drained into candidates as far as needed
+        while len(candidates) < batch_size and queue:
+            sid, sl = queue.popleft()
+            new_seeds = perpendicular_seeds(grid, sl, d_sep)
+            new_seed_samples = grid.sample_many(new_seeds[:, 0], new_seeds[:, 1])
+            new_seeds_covered = new_seed_samples.is_covered()
+            profiler.count("seeds_rejected_coverage", int(len(new_seeds) - new_seeds_covered.sum()))
+            candidates.extend((sid, seed) for seed in new_seeds[new_seeds_covered].tolist())
+        if not candidates:
+            break
+
+        batch = [candidates.popleft() for _ in range(min(batch_size, len(candidates)))]
+        batch_start_ids = np.array([sid for sid, _ in batch], dtype=np.int64)
+        batch_seeds = np.array([seed for _, seed in batch], dtype=np.float64)
+        batch_samples = grid.sample_many(batch_seeds[:, 0], batch_seeds[:, 1])
+        batch_d_sep = np.broadcast_to(d_sep_at(batch_samples.value), len(batch)).astype(np.float64)
+        # The candidates come in runs with the same start id, which share one registry query
+        run_starts = np.flatnonzero(np.diff(batch_start_ids, prepend=-1))
+        viable = np.empty(len(batch), dtype=bool)
+        for run_start, run_end in zip(run_starts.tolist(), np.append(run_starts[1:], len(batch)).tolist()):
+            run = slice(run_start, run_end)
+            viable[run] = registry.points_allowed(
+                batch_seeds[run], batch_d_sep[run], d_test_factor * batch_d_sep[run], int(batch_start_ids[run_start])
+            )
+        profiler.count("seeds_rejected_separation", int(len(batch) - viable.sum()))
+        # Seeds closer than their separation to an earlier traced seed of the batch are mostly rejected once the
+        # earlier streamline is committed, so instead of tracing them in lockstep, they are traced alone when their
+        # turn comes
+        viable_indices = np.flatnonzero(viable)
+        traced = viable_indices[separated_subset(batch_seeds[viable_indices], batch_d_sep[viable_indices])]
+        lockstep_index = np.full(len(batch), -1)
+        lockstep_index[traced] = np.arange(len(traced))
+
+        trace_start = time.perf_counter()
+        lines = trace_lockstep(
+            grid,
+            registry,
+            batch_seeds[traced],
+            batch_samples[traced],
+            d_test_at,
+            d_step=d_step,
+            max_depth_step=max_depth_step,
+            max_accum_angle=max_accum_angle,
+            max_steps=max_steps,
+            integrator=integrator,
+            tolerance=tolerance,
+            separation_test_chunk_size=SEPARATION_TEST_CHUNK_SIZE
+        )
+        profiler.add_time("wavefront_trace", time.perf_counter() - trace_start)
+        profiler.count("wavefront_batches")
+        profiler.count("wavefront_candidates", len(traced))
+        half_bounds = lines.bounds()
+
+        # Bounding boxes of the streamlines committed since the batch was traced, which are the only ones that can be
+        # too close to its traced points; the registry is only asked about the half-lines near one of them
+        committed_bounds = np.empty((len(batch), 4))
+        committed_count = 0
+
+        def is_near_committed(bounds: np.ndarray | tuple[float, ...], distance: float) -> bool:
+            others = committed_bounds[:committed_count]
+            return bool((
+                (others[:, 0] - distance < bounds[2]) & (bounds[0] < others[:, 2] + distance) &
+                (others[:, 1] - distance < bounds[3]) & (bounds[1] < others[:, 3] + distance)
+            ).any())
+
+        for i in viable_indices.tolist():
+            if ((max_streamlines is not None and streamline_count >= max_streamlines) or
+                (deadline is not None and time.perf_counter() >= deadline)):
+                profiler.add_time("queue_growth", time.perf_counter() - stage_start)
+                return
+            start_id, seed = batch[i]
+            d_sep_start = float(batch_d_sep[i])
+            if (committed_count > 0 and
+                not registry.is_point_allowed(seed, d_sep_start, d_test_factor * d_sep_start, start_id)):
+                profiler.count("seeds_rejected_separation")
+                continue
+
+            k = int(lockstep_index[i])
+            if k < 0:
+                profiler.count("wavefront_traced_alone")
+                line = flow_field_streamline(
+                    grid,
+                    registry,
+                    start_from_streamline_id=start_id,
+                    p_start=tuple(seed),
+                    d_sep=d_sep,
+                    d_test_factor=d_test_factor,
+                    d_step=d_step,
+                    max_depth_step=max_depth_step,
+                    max_accum_angle=max_accum_angle,
+                    max_steps=max_steps,
+                    min_steps=min_steps,
+                    integrator=integrator,
+                    tolerance=tolerance,
+                    profiler=profiler
+                )
+                if line is None:
+                    continue
+            else:
+                halves = []
+                for j in (k, len(traced) + k):
+                    half = lines.points[j, :lines.lengths[j]]
+                    if len(half) > 0 and is_near_committed(half_bounds[j], max_d_test):
+                        d_test = d_test_at(lines.values[j, :lines.lengths[j]])
+                        allowed = registry.points_allowed(half, d_test, d_test, 0)
+                        if not allowed.all():
+                            half = half[:int(np.argmin(allowed))]
+                            profiler.count("wavefront_lines_cut")
+                    halves.append(half.tolist())
+                fwd, bwd = halves
+                line = list(map(tuple, reversed(bwd))) + [tuple(seed)] + list(map(tuple, fwd))
+                if len(line) <= min_steps + 1:
+                    profiler.count("streamlines_rejected_too_short")
+                    continue
+                profiler.count("streamlines_accepted")
+            sid = registry.add_streamline(line)
+            queue.append((sid, line))
+            streamline_count += 1
+            line_points = np.asarray(line)
+            committed_bounds[committed_count] = (*line_points.min(axis=0), *line_points.max(axis=0))
+            committed_count += 1
+            profiler.add_time("queue_growth", time.perf_counter() - stage_start)
+            yield line
+            stage_start = time.perf_counter()
+    profiler.add_time("queue_growth", time.perf_counter() - stage_start)
+
+def iter_flow_field_streamlines(
     grid: DepthDirectionValueGrid,
     rng_seed: int,
     seed_box_size: int,
-    d_sep: float,
+    d_sep: float | ToneSeparation,
     d_test_factor: float,
     d_step: float,
     max_depth_step: float,
     max_accum_angle: float,
     max_steps: int,
-    min_steps: int
-) -> list[list[tuple[float, float]]]:
+    min_steps: int,
+    integrator: str = "euler",
+    tolerance: float = 0.05,
+    time_budget: float | None = None,
+    max_streamlines: int | None = None,
+    profiler: Profiler = DISABLED_PROFILER,
+    analysis_scale: float = 1.0,
+    initial_streamlines: Sequence[list[tuple[float, float]] | np.ndarray] = (),
+    seed_order: str = "grid",
+    batch_size: int | None = None,
+) -> Iterator[list[tuple[float, float]]]:
+    # Yields the streamlines in the order in which they are accepted. Every prefix of the sequence is evenly spaced,
+    # so stopping after time_budget seconds (measured from the first call to next) or after max_streamlines lines
+    # leaves a valid subset of the full result. The profiler stages "seeding" and "queue_growth" exclude the time the
+    # consumer spends between two streamlines.
+    # initial_streamlines are registered and grown from before seeding, but not yielded. seed_order is the order of
+    # the jittered seeds, see seed_candidates. With a batch_size, the candidates are traced batch_size at a time by
+    # the wavefront tracer, see _iter_wavefront_streamlines.
+    if analysis_scale != 1.0:
+        # The grid holds the field at analysis_scale times the output resolution (see analysis_resolution), while
+        # distances, initial_streamlines and the yielded lines are in output pixels. Trace in grid pixels with the
+        # distances scaled accordingly and map the lines back.
+        scaled_streamlines = iter_flow_field_streamlines(
+            grid,
+            rng_seed,
+            seed_box_size=analysis_scale * seed_box_size,
+            d_sep=d_sep.scaled(analysis_scale) if isinstance(d_sep, ToneSeparation) else analysis_scale * d_sep,
+            d_test_factor=d_test_factor,
+            d_step=analysis_scale * d_step,
+            max_depth_step=max_depth_step,
+            max_accum_angle=max_accum_angle,
+            max_steps=max_steps,
+            min_steps=min_steps,
+            integrator=integrator,
+            tolerance=analysis_scale * tolerance,
+            time_budget=time_budget,
+            max_streamlines=max_streamlines,
+            profiler=profiler,
+            initial_streamlines=[output_to_analysis(sl, analysis_scale) for sl in initial_streamlines],
+            seed_order=seed_order,
+            batch_size=batch_size,
+        )
+        for sl in scaled_streamlines:
+            yield list(map(tuple, analysis_to_output(sl, analysis_scale).tolist()))
+        return
+
+    if profiler.enabled:
+        grid = CountingGrid(grid, profiler)
     width = grid.width
     height = grid.height
-    registry = StreamlineRegistry(width, height, d_sep)
+    # The registry cells must be as large as the largest separation
+    max_d_sep = d_sep.max_separation if isinstance(d_sep, ToneSeparation) else d_sep
+    registry = StreamlineRegistry(width, height, max_d_sep, profiler)
     queue: deque = deque()
-    streamlines: list[list[tuple[float, float]]] = []
-    
-    random.seed(rng_seed)
-
-    # Seed points on a jittered grid
-    cell_count_x = int(width / seed_box_size)
-    cell_count_y = int(height / seed_box_size)
-    cell_width = float(width) / float(cell_count_x)
-    cell_height = float(height) / float(cell_count_y)
-    for iy in range(cell_count_y):
-        for ix in range(cell_count_x):
-            sx = cell_width * (ix + random.random())
-            sy = cell_height * (iy + random.random())
-            sl = flow_field_streamline(
+    streamline_count = 0
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    for sl in initial_streamlines:
+        queue.append((registry.add_streamline(sl), sl))
+
+    def is_budget_exhausted() -> bool:
+        return (
+            (max_streamlines is not None and streamline_count >= max_streamlines) or
+            (deadline is not None and time.perf_counter() >= deadline)
+        )
+
+    stage_start = time.perf_counter()
+
+    # Seed points on a jittered grid, without the uncovered ones
+    seeds, seed_samples, uncovered_count = seed_candidates(
+        grid, rng_seed, seed_box_size, seed_order, max_depth_step / abs(d_step)
+    )
+    profiler.count("seeds_rejected_coverage", uncovered_count)
+    if batch_size is not None:
+        profiler.add_time("seeding", time.perf_counter() - stage_start)
+        yield from _iter_wavefront_streamlines(
+            grid,
+            registry,
+            queue,
+            seeds,
+            d_sep=d_sep,
+            d_test_factor=d_test_factor,
+            d_step=d_step,
+            max_depth_step=max_depth_step,
+            max_accum_angle=max_accum_angle,
+            max_steps=max_steps,
+            min_steps=min_steps,
+            integrator=integrator,
+            tolerance=tolerance,
+            batch_size=batch_size,
+            deadline=deadline,
+            max_streamlines=max_streamlines,
+            profiler=profiler
+        )
+        return
+    seeds_d_sep = d_sep(seed_samples.value) if isinstance(d_sep, ToneSeparation) else d_sep
+    for seed_index, seed in enumerate(seeds.tolist()):
+        if seed_index % SEED_PREFILTER_CHUNK_SIZE == 0:
+            # The registry only grows, so seeds rejected now would also be rejected when traced. This skips the seeds
+            # in regions that are already full without changing the result.
+            chunk = slice(seed_index, seed_index + SEED_PREFILTER_CHUNK_SIZE)
+            chunk_d_sep = seeds_d_sep[chunk] if isinstance(d_sep, ToneSeparation) else d_sep
+            chunk_viable = registry.points_allowed(seeds[chunk], chunk_d_sep, d_test_factor * chunk_d_sep, 0)
+            profiler.count("seeds_rejected_separation", int(len(chunk_viable) - chunk_viable.sum()))
+        if not chunk_viable[seed_index % SEED_PREFILTER_CHUNK_SIZE]:
+            continue
+        if is_budget_exhausted():
+            profiler.add_time("seeding", time.perf_counter() - stage_start)
+            return
+        sl = flow_field_streamline(
+            grid,
+            registry,
+            start_from_streamline_id=0,
+            p_start=tuple(seed),
+            d_sep=d_sep,
+            d_test_factor=d_test_factor,
+            d_step=d_step,
+            max_depth_step=max_depth_step,
+            max_accum_angle=max_accum_angle,
+            max_steps=max_steps,
+            min_steps=min_steps,
+            integrator=integrator,
+            tolerance=tolerance,
+            profiler=profiler
+        )
+        if sl is not None:
+            sid = registry.add_streamline(sl)
+            queue.append((sid, sl))
+            streamline_count += 1
+            profiler.add_time("seeding", time.perf_counter() - stage_start)
+            yield sl
+            stage_start = time.perf_counter()
+    profiler.add_time("seeding", time.perf_counter() - stage_start)
+    stage_start = time.perf_counter()
+
+    # Grow from queue
+    while queue:
+        sid, sl = queue.popleft()
+        new_seeds = perpendicular_seeds(grid, sl, d_sep)
+        # The registry only grows, so seeds rejected now would also be rejected when traced
+        new_seed_samples = grid.sample_many(new_seeds[:, 0], new_seeds[:, 1])
+        new_seeds_covered = new_seed_samples.is_covered()
+        new_seeds_d_sep = d_sep(new_seed_samples.value) if isinstance(d_sep, ToneSeparation) else d_sep
+        new_seeds_viable = new_seeds_covered & registry.points_allowed(new_seeds, new_seeds_d_sep, d_test_factor * new_seeds_d_sep, sid)
+        if profiler.enabled:
+            profiler.count("seeds_rejected_coverage", int(len(new_seeds) - new_seeds_covered.sum()))
+            profiler.count("seeds_rejected_separation", int(new_seeds_covered.sum() - new_seeds_viable.sum()))
+        for new_seed, is_viable in zip(new_seeds.tolist(), new_seeds_viable):
+            if not is_viable:
+                continue
+            if is_budget_exhausted():
+                profiler.add_time("queue_growth", time.perf_counter() - stage_start)
+                return
+            new_sl = flow_field_streamline(
                 grid,
                 registry,
-                start_from_streamline_id=0,
-                p_start=(sx,sy),
+                start_from_streamline_id=sid,
+                p_start=tuple(new_seed),
                 d_sep=d_sep,
                 d_test_factor=d_test_factor,
                 d_step=d_step,
                 max_depth_step=max_depth_step,
                 max_accum_angle=max_accum_angle,
                 max_steps=max_steps,
-                min_steps=min_steps
+                min_steps=min_steps,
+                integrator=integrator,
+                tolerance=tolerance,
+                profiler=profiler
             )
-            if sl is not None:
-                sid = registry.add_streamline(sl)
-                queue.append((sid, sl))
-                streamlines.append(sl)
+            if new_sl:
+                new_sid = registry.add_streamline(new_sl)
+                queue.append((new_sid, new_sl))
+                streamline_count += 1
+                profiler.add_time("queue_growth", time.perf_counter() - stage_start)
+                yield new_sl
+                stage_start = time.perf_counter()
+    profiler.add_time("queue_growth", time.perf_counter() - stage_start)
 
-    # Grow from queue
-    while queue:
-        sid, sl = queue.popleft()
-        for lp in sl:
-            gv = grid.grid_value(lp[0], lp[1])
-            for sign in (-1.0, 1.0):
-                dir = gv.direction
-                new_seed = (
-                    lp[0] - dir[1] * sign * d_sep,
-                    lp[1] + dir[0] * sign * d_sep
-                )
-                new_sl = flow_field_streamline(
-                    grid,
-                    registry,
-                    start_from_streamline_id=sid,
-                    p_start=new_seed,
-                    d_sep=d_sep,
-                    d_test_factor=d_test_factor,
-                    d_step=d_step,
-                    max_depth_step=max_depth_step,
-                    max_accum_angle=max_accum_angle,
-                    max_steps=max_steps,
-                    min_steps=min_steps
-                )
-                if new_sl:
-                    new_sid = registry.add_streamline(new_sl)
-                    queue.append((new_sid, new_sl))
-                    streamlines.append(new_sl)
+def flow_field_streamlines(
+    grid: DepthDirectionValueGrid,
+    rng_seed: int,
+    seed_box_size: int,
+    d_sep: float | ToneSeparation,
+    d_test_factor: float,
+    d_step: float,
+    max_depth_step: float,
+    max_accum_angle: float,
+    max_steps: int,
+    min_steps: int,
+    integrator: str = "euler",
+    tolerance: float = 0.05,
+    time_budget: float | None = None,
+    max_streamlines: int | None = None,
+    profiler: Profiler = DISABLED_PROFILER,
+    analysis_scale: float = 1.0,
+    initial_streamlines: Sequence[list[tuple[float, float]] | np.ndarray] = (),
+    seed_order: str = "grid",
+    batch_size: int | None = None,
+) -> list[list[tuple[float, float]]]:
+    return list(iter_flow_field_streamlines(
+        grid,
+        rng_seed,
+        seed_box_size=seed_box_size,
+        d_sep=d_sep,
+        d_test_factor=d_test_factor,
+        d_step=d_step,
+        max_depth_step=max_depth_step,
+        max_accum_angle=max_accum_angle,
+        max_steps=max_steps,
+        min_steps=min_steps,
+        integrator=integrator,
+        tolerance=tolerance,
+        time_budget=time_budget,
+        max_streamlines=max_streamlines,
+        profiler=profiler,
+        analysis_scale=analysis_scale,
+        initial_streamlines=initial_streamlines,
+        seed_order=seed_order,
+        batch_size=batch_size
+    ))
 
-    return streamlines
+def batched_streamlines(
+    streamlines: Iterable[list[tuple[float, float]]],
+    first_batch_size: int = 16,
+    max_batch_size: int | None = None
+) -> Iterator[list[list[tuple[float, float]]]]:
+    # Groups streamlines into batches that double in size, so that the first batch is ready quickly while the total
+    # cost of consumers that touch all previously added data per batch (e.g. GreasePencilDrawing.sync_strokes) stays
+    # linear in the number of points. A max_batch_size bounds the time per batch, but once the batches stop doubling,
+    # that cost grows quadratically again.
+    batch: list[list[tuple[float, float]]] = []
+    batch_size = first_batch_size
+    for sl in streamlines:
+        batch.append(sl)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+            batch_size = 2 * batch_size if max_batch_size is None else min(2 * batch_size, max_batch_size)
+    if batch:
+        yield batch
 
 def streamlines_to_strokes(
     width: int,
@@ -225,15 +729,20 @@ def streamlines_to_strokes(
     drawing_origin: tuple[float, float, float],
     drawing_x_axis: tuple[float, float, float],
     drawing_y_axis: tuple[float, float, float],
-    streamlines: list[list[tuple[float, float]]]
-) -> list[np.ndarray]:
-    width_inv = 1.0 / width
-    height_inv = 1.0 / height
-
-    return [
-            np.array([(
-                drawing_origin[0] + (x_coord := (p[0]*width_inv)) * drawing_x_axis[0] + (y_coord := (p[1]*height_inv)) * drawing_y_axis[0],
-                drawing_origin[1] + x_coord * drawing_x_axis[1] + y_coord * drawing_y_axis[1],
-                drawing_origin[2] + x_coord * drawing_x_axis[2] + y_coord * drawing_y_axis[2]
-            ) for p in sl])
-        for sl in streamlines]
+    streamlines: Sequence[list[tuple[float, float]] | np.ndarray] | RaggedPoints
+) -> RaggedPoints:
+    pixels = streamlines if isinstance(streamlines, RaggedPoints) else RaggedPoints.from_sequences(streamlines, 2)
+    # One affine transform from pixel coordinates to the drawing for all points
+    transform = np.array((
+        np.asarray(drawing_x_axis, dtype=np.float64) / width,
+        np.asarray(drawing_y_axis, dtype=np.float64) / height
+    ))
+    points = pixels.points @ transform
+    points += drawing_origin
+    return RaggedPoints(points.astype(np.float32), pixels.offsets)
+
+def stroke_values(grid: DepthDirectionValueGrid, pixel_strokes: RaggedPoints, analysis_scale: float = 1.0) -> np.ndarray:
+    # The value channel at every point of strokes in output pixels (see analysis_scale of iter_flow_field_streamlines),
+    # e.g. for a per-point radius
+    points = output_to_analysis(pixel_strokes.points, analysis_scale).reshape((-1, 2))
+    return grid.sample_many(points[:, 0], points[:, 1]).value
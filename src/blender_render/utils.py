@@ -1,9 +1,187 @@
-import gzip
+from dataclasses import dataclass
+import json
+import os
+import struct
+import zlib
 
 import numpy as np
 
+from .ragged import RaggedPoints
 
-def ndarray_to_gz_file(a: np.ndarray, path: str):
-    with gzip.open(path, "wb") as file:
-        header = b"".join(k.to_bytes(4, "little") for k in a.shape)
-        file.write(header + a.tobytes())
+
+# G-buffer files: the magic bytes, the format version and the header length (both uint32, little-endian), a JSON
+# header, and the data. The data starts at a multiple of GBUFFER_ALIGNMENT bytes. Uncompressed data is the C-order
+# array and can be memory-mapped; compressed data is a sequence of zlib streams, one per tile of
+# (tile_height, tile_width, channels) pixels in row-major tile order, located by the "tiles" list of the header.
+GBUFFER_MAGIC = b"BRGBUF\x00\x00"
+GBUFFER_VERSION = 1
+GBUFFER_ALIGNMENT = 64
+GBUFFER_COMPRESSIONS = ("none", "zlib")
+DEPTH_ORIENTATION_VALUE_CHANNELS = ("depth", "orientation", "value")
+
+# Stroke files use the same layout with their own magic bytes. The data holds one block per layer, in the order of
+# the "layers" list of the header: the int64 offsets of the layer's RaggedPoints, then its float32 points (in pixel
+# coordinates of the G-buffer), each starting at a multiple of GBUFFER_ALIGNMENT bytes.
+STROKES_MAGIC = b"BRSTRK\x00\x00"
+STROKES_VERSION = 1
+
+@dataclass
+class GBuffer:
+    data: np.ndarray # (height, width, channels); a read-only memmap for uncompressed files
+    channels: list[str]
+    metadata: dict
+
+    def channel(self, name: str) -> np.ndarray:
+        return self.data[:, :, self.channels.index(name)]
+
+def tile_slices(height: int, width: int, tile_size: int) -> list[tuple[slice, slice]]:
+    return [
+        (slice(y0, min(y0 + tile_size, height)), slice(x0, min(x0 + tile_size, width)))
+        for y0 in range(0, height, tile_size)
+        for x0 in range(0, width, tile_size)
+    ]
+
+def write_gbuffer(
+    path: str,
+    a: np.ndarray,
+    channels: tuple[str, ...] = DEPTH_ORIENTATION_VALUE_CHANNELS,
+    metadata: dict | None = None,
+    compression: str = "none",
+    tile_size: int = 256,
+    compression_level: int = 6
+):
+    assert compression in GBUFFER_COMPRESSIONS, f"Unknown compression '{compression}'"
+    data = np.ascontiguousarray(a, dtype=np.float32)
+    assert data.ndim == 3 and data.shape[2] == len(channels), "Expected an array of shape (height, width, channels)"
+
+    header = {
+        "dtype": data.dtype.str,
+        "shape": list(data.shape),
+        "channels": list(channels),
+        "metadata": metadata or {},
+        "compression": compression,
+    }
+    chunks = [data]
+    if compression == "zlib":
+        chunks = [
+            zlib.compress(np.ascontiguousarray(data[ys, xs]).data, compression_level)
+            for ys, xs in tile_slices(data.shape[0], data.shape[1], tile_size)
+        ]
+        offsets = np.concatenate(([0], np.cumsum([len(c) for c in chunks])))
+        header["tile_size"] = tile_size
+        header["tiles"] = [[int(offset), len(c)] for offset, c in zip(offsets, chunks)]
+
+    _write_file(path, GBUFFER_MAGIC, GBUFFER_VERSION, header, chunks)
+
+def create_gbuffer(
+    path: str,
+    height: int,
+    width: int,
+    channels: tuple[str, ...] = DEPTH_ORIENTATION_VALUE_CHANNELS,
+    metadata: dict | None = None
+) -> GBuffer:
+    # An uncompressed G-buffer file of zeros, memory-mapped for writing, e.g. tile by tile. The file is created
+    # sparse where the file system supports it, so its size is not allocated up front.
+    header = {
+        "dtype": np.dtype(np.float32).str,
+        "shape": [height, width, len(channels)],
+        "channels": list(channels),
+        "metadata": metadata or {},
+        "compression": "none",
+    }
+    prefix = _file_prefix(GBUFFER_MAGIC, GBUFFER_VERSION, header)
+    with open(path, "wb") as file:
+        file.write(prefix)
+        file.truncate(len(prefix) + 4 * height * width * len(channels))
+    data = np.memmap(path, dtype=np.float32, mode="r+", offset=len(prefix), shape=(height, width, len(channels)))
+    return GBuffer(data, list(channels), header["metadata"])
+
+def _file_prefix(magic: bytes, version: int, header: dict) -> bytes:
+    header_bytes = json.dumps(header).encode()
+    prefix_length = len(magic) + 8
+    # Pad the header with spaces so that the data is aligned for memory mapping
+    padding = -(prefix_length + len(header_bytes)) % GBUFFER_ALIGNMENT
+    header_bytes += b" " * padding
+    return magic + struct.pack("<II", version, len(header_bytes)) + header_bytes
+
+def _write_file(path: str, magic: bytes, version: int, header: dict, chunks: list[np.ndarray | bytes]):
+    # Write to a temporary file first so that an interrupted write never leaves a truncated file behind
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(_file_prefix(magic, version, header))
+        for chunk in chunks:
+            file.write(chunk.data if isinstance(chunk, np.ndarray) else chunk)
+    os.replace(temp_path, path)
+
+def _read_header(path: str, magic: bytes, supported_version: int, kind: str) -> tuple[dict, int]:
+    # The JSON header and the file offset of the data
+    with open(path, "rb") as file:
+        if file.read(len(magic)) != magic:
+            raise ValueError(f"'{path}' is not a {kind} file.")
+        version, header_length = struct.unpack("<II", file.read(8))
+        if version > supported_version:
+            raise ValueError(f"{kind} version {version} of '{path}' is newer than the supported version {supported_version}.")
+        header = json.loads(file.read(header_length))
+    return header, len(magic) + 8 + header_length
+
+def read_gbuffer_header(path: str) -> tuple[dict, int]:
+    return _read_header(path, GBUFFER_MAGIC, GBUFFER_VERSION, "G-buffer")
+
+def read_gbuffer(path: str) -> GBuffer:
+    header, data_offset = read_gbuffer_header(path)
+    dtype = np.dtype(header["dtype"])
+    shape = tuple(header["shape"])
+
+    if header["compression"] == "none":
+        data = np.memmap(path, dtype=dtype, mode="r", offset=data_offset, shape=shape)
+    elif header["compression"] == "zlib":
+        data = np.empty(shape, dtype=dtype)
+        with open(path, "rb") as file:
+            for (ys, xs), (offset, length) in zip(tile_slices(shape[0], shape[1], header["tile_size"]), header["tiles"]):
+                file.seek(data_offset + offset)
+                tile = data[ys, xs]
+                tile[...] = np.frombuffer(zlib.decompress(file.read(length)), dtype=dtype).reshape(tile.shape)
+    else:
+        raise ValueError(f"Unknown G-buffer compression '{header['compression']}' in '{path}'.")
+    return GBuffer(data, header["channels"], header["metadata"])
+
+def _aligned(chunk: bytes | np.ndarray) -> list[bytes | np.ndarray]:
+    return [chunk, b"\x00" * (-chunk.nbytes % GBUFFER_ALIGNMENT)] if isinstance(chunk, np.ndarray) else [chunk]
+
+def write_strokes(path: str, layers: dict[str, RaggedPoints], metadata: dict | None = None):
+    header_layers = []
+    chunks: list[bytes | np.ndarray] = []
+    offset = 0
+    for name, ragged in layers.items():
+        offsets = np.ascontiguousarray(ragged.offsets, dtype=np.int64)
+        points = np.ascontiguousarray(ragged.points, dtype=np.float32)
+        layer_chunks = _aligned(offsets) + _aligned(points)
+        header_layers.append({
+            "name": name,
+            "stroke_count": len(ragged),
+            "point_count": points.shape[0],
+            "dimensions": points.shape[1],
+            "offset": offset,
+        })
+        chunks.extend(layer_chunks)
+        offset += sum(len(c) if isinstance(c, bytes) else c.nbytes for c in layer_chunks)
+
+    header = {"layers": header_layers, "metadata": metadata or {}}
+    _write_file(path, STROKES_MAGIC, STROKES_VERSION, header, chunks)
+
+def read_strokes(path: str) -> tuple[dict[str, RaggedPoints], dict]:
+    # The strokes per layer, memory-mapped, and the metadata
+    header, data_offset = _read_header(path, STROKES_MAGIC, STROKES_VERSION, "Strokes")
+    layers = {}
+    for layer in header["layers"]:
+        offsets_start = data_offset + layer["offset"]
+        offsets_bytes = 8 * (layer["stroke_count"] + 1)
+        points_start = offsets_start + offsets_bytes + (-offsets_bytes % GBUFFER_ALIGNMENT)
+        offsets = np.memmap(path, dtype=np.int64, mode="r", offset=offsets_start, shape=(layer["stroke_count"] + 1,))
+        if layer["point_count"] > 0:
+            points = np.memmap(path, dtype=np.float32, mode="r", offset=points_start, shape=(layer["point_count"], layer["dimensions"]))
+        else:
+            # Empty regions cannot be memory-mapped
+            points = np.empty((0, layer["dimensions"]), dtype=np.float32)
+        layers[layer["name"]] = RaggedPoints(points, offsets)
+    return layers, header["metadata"]
@@ -1,5 +1,5 @@
 void main() {
     fragPos = position;
     fragNorm = normal;
-    gl_Position = viewProjectionMatrix * vec4(position, 1.0f);
+    gl_Position = tileMatrix * viewProjectionMatrix * vec4(position, 1.0f);
 }
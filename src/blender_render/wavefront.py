@@ -0,0 +1,133 @@
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import numpy as np
+
+from .grid import DepthDirectionValueGrid, GridSamples
+from .integrators import BATCH_INTEGRATORS, sample_directions
+
+
+@dataclass
+class LockstepLines:
+    # Half-lines traced from a batch of seeds: half-line i < N runs forward from seed i, half-line N + i backward.
+    # Half-line j consists of points[j, :lengths[j]], with the value channel at each point in values.
+    points: np.ndarray # (2N, max_half_steps, 2)
+    values: np.ndarray # (2N, max_half_steps)
+    lengths: np.ndarray # (2N,)
+
+    def bounds(self) -> np.ndarray:
+        # (2N, 4) bounding boxes (x_min, y_min, x_max, y_max) of the half-lines; empty ones are inverted boxes
+        is_point = np.arange(self.points.shape[1]) < self.lengths[:, np.newaxis]
+        lower = np.where(is_point[:, :, np.newaxis], self.points, np.inf).min(axis=1, initial=np.inf)
+        upper = np.where(is_point[:, :, np.newaxis], self.points, -np.inf).max(axis=1, initial=-np.inf)
+        return np.concatenate((lower, upper), axis=1)
+
+def separated_subset(points: np.ndarray, distances: np.ndarray) -> np.ndarray:
+    # Greedy selection in order: point k is selected if it is at least distances[k] away from every point selected
+    # before it. Returns the mask of the selected points.
+    selected = np.zeros(len(points), dtype=bool)
+    if len(points) == 0:
+        return selected
+    cell_size = float(np.max(distances))
+    cells: dict[tuple[int, int], list[tuple[float, float]]] = {}
+    for k, ((x, y), d) in enumerate(zip(points.tolist(), distances.tolist())):
+        cx = int(x // cell_size)
+        cy = int(y // cell_size)
+        d_sq = d * d
+        if any(
+            (x - qx) * (x - qx) + (y - qy) * (y - qy) < d_sq
+            for ny in (cy - 1, cy, cy + 1)
+            for nx in (cx - 1, cx, cx + 1)
+            for qx, qy in cells.get((nx, ny), ())
+        ):
+            continue
+        selected[k] = True
+        cells.setdefault((cx, cy), []).append((x, y))
+    return selected
+
+def _cut_at_separation(
+    registry,
+    lines: LockstepLines,
+    tested: np.ndarray,
+    d_test_at: Callable[[np.ndarray], float | np.ndarray]
+) -> np.ndarray:
+    # Tests the points of all half-lines past tested[j] in one registry query and cuts each half-line at its first
+    # point that is too close to another streamline; returns the indices of the half-lines that were cut
+    pending = np.flatnonzero(lines.lengths > tested)
+    if len(pending) == 0:
+        return pending
+    counts = lines.lengths[pending] - tested[pending]
+    rows = np.repeat(pending, counts)
+    starts = np.cumsum(counts) - counts
+    columns = tested[rows] + np.arange(len(rows)) - np.repeat(starts, counts)
+    tested[pending] = lines.lengths[pending]
+    d_test = d_test_at(lines.values[rows, columns])
+    allowed = registry.points_allowed(lines.points[rows, columns], d_test, d_test, 0)
+    # rows and columns are sorted, so the first disallowed point of a half-line is its first entry
+    cut, first = np.unique(rows[~allowed], return_index=True)
+    lines.lengths[cut] = columns[~allowed][first]
+    tested[cut] = lines.lengths[cut]
+    return cut
+
+def trace_lockstep(
+    grid: DepthDirectionValueGrid,
+    registry,
+    seeds: np.ndarray,
+    seed_samples: GridSamples,
+    d_test_at: Callable[[np.ndarray], float | np.ndarray],
+    d_step: float,
+    max_depth_step: float,
+    max_accum_angle: float,
+    max_steps: int,
+    integrator: str = "euler",
+    tolerance: float = 0.05,
+    separation_test_chunk_size: int = 16
+) -> LockstepLines:
+    # Advances both halves of the streamlines of all seeds together, one step of all unfinished half-lines per
+    # iteration, with the termination rules of flow_field_streamline: coverage, accumulated angle, depth jumps, and
+    # separation d_test_at(values) from the streamlines of the registry, which must not change meanwhile. As in
+    # flow_field_streamline, the separation is tested once per chunk of steps. Unlike there, the seeds themselves
+    # are not tested.
+    integrate = BATCH_INTEGRATORS[integrator]
+    seed_count = len(seeds)
+    half_steps = max_steps // 2
+    p = np.concatenate((seeds, seeds)).astype(np.float64)
+    direction = np.tile(sample_directions(seed_samples), (2, 1))
+    depth = np.tile(seed_samples.depth, 2)
+    h = np.concatenate((np.full(seed_count, d_step), np.full(seed_count, -d_step)))
+    accum_angle = np.zeros(2 * seed_count)
+    accum_limit = 0.5 * max_accum_angle
+
+    lines = LockstepLines(
+        np.empty((2 * seed_count, half_steps, 2)),
+        np.empty((2 * seed_count, half_steps)),
+        np.zeros(2 * seed_count, dtype=np.int64)
+    )
+    tested = np.zeros(2 * seed_count, dtype=np.int64)
+    active = np.arange(2 * seed_count)
+    for step in range(half_steps):
+        if len(active) == 0:
+            break
+        p_new, samples, h_new = integrate(grid, p[active], direction[active], h[active], d_step, tolerance)
+        new_direction = sample_directions(samples)
+        dot = np.clip(np.einsum("ij,ij->i", direction[active], new_direction), -1.0, 1.0)
+        accum_angle[active] += np.arccos(dot)
+        grows = (
+            samples.is_covered() &
+            (accum_angle[active] <= accum_limit) &
+            (np.abs(samples.depth - depth[active]) <= max_depth_step)
+        )
+
+        growing = active[grows]
+        lines.points[growing, step] = p_new[grows]
+        lines.values[growing, step] = samples.value[grows]
+        lines.lengths[growing] += 1
+        p[growing] = p_new[grows]
+        direction[growing] = new_direction[grows]
+        depth[growing] = samples.depth[grows]
+        h[growing] = h_new[grows]
+        active = growing
+        if (step + 1) % separation_test_chunk_size == 0:
+            active = np.setdiff1d(active, _cut_at_separation(registry, lines, tested, d_test_at), assume_unique=True)
+    _cut_at_separation(registry, lines, tested, d_test_at)
+    return lines
@@ -0,0 +1,40 @@
+import os
+import sys
+
+
+# Loads a strokes file written by replay.py into the Grease Pencil layers of the same names.
+# Run it like main.py, through run_from_blender.py.
+module_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(module_path)
+
+strokes_path = os.path.join(module_path, "strokes.bin")
+stroke_radius = 0.0004
+
+modules_to_remove = [module for module in sys.modules if module.startswith("blender_render")]
+for module in modules_to_remove:
+    del sys.modules[module]
+
+
+from blender_render import BlenderScene, GreasePencilDrawing, read_strokes, streamlines_to_strokes
+
+layers, metadata = read_strokes(strokes_path)
+print("Stroke counts:", {name: len(strokes) for name, strokes in layers.items()})
+
+scene = BlenderScene("Light")
+width, height = scene.render_resolution()
+if (width, height) != (metadata["width"], metadata["height"]):
+    print(f"Warning: the strokes were traced at {metadata['width']} x {metadata['height']}, but the render resolution is {width} x {height}")
+frame_origin, frame_x_axis, frame_y_axis = scene.drawing_frame()
+
+for layer_name, pixel_strokes in layers.items():
+    strokes = streamlines_to_strokes(
+        metadata["width"],
+        metadata["height"],
+        frame_origin.to_tuple(),
+        frame_x_axis.to_tuple(),
+        frame_y_axis.to_tuple(),
+        pixel_strokes
+    )
+    gp_drawing = GreasePencilDrawing("HatchLines", layer_name, create_layer=True)
+    gp_drawing.clear()
+    gp_drawing.add_strokes(strokes, radius=stroke_radius)
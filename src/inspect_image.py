@@ -1,34 +1,26 @@
-import gzip
 import os
+import sys
 
 import matplotlib.pyplot as plt
-import numpy as np
-
-def gz_file_to_ndarray(path: str) -> np.ndarray:
-    with gzip.open(path, "rb") as file:
-        header = file.read(4 * 3)
-        shape = tuple(int.from_bytes(header[i:i + 4], "little") for i in range(0, len(header), 4))
-        data = file.read()
-    return np.frombuffer(data, dtype=np.float32).reshape(shape).copy()
 
 file_path = os.path.dirname(os.path.abspath(__file__))
-image_depth_orientation_value = gz_file_to_ndarray(os.path.join(file_path, "render_dov.bin.gz"))
-print("Image Depth-Orientation-Value shape:", image_depth_orientation_value.shape)
+sys.path.append(file_path)
 
+from blender_render import read_gbuffer
 
-fig, axes = plt.subplots(1, 3, figsize=(15, 5))
 
-axes[0].imshow(image_depth_orientation_value[:, :, 0])
-axes[0].set_title("Depth Channel")
-axes[0].axis("off")
+gbuffer = read_gbuffer(os.path.join(file_path, "render_dov.gbuf"))
+print("Image Depth-Orientation-Value shape:", gbuffer.data.shape)
+print("Channels:", gbuffer.channels)
+print("Metadata:", gbuffer.metadata)
 
-axes[1].imshow(image_depth_orientation_value[:, :, 1])
-axes[1].set_title("Orientation Channel")
-axes[1].axis("off")
 
-axes[2].imshow(image_depth_orientation_value[:, :, 2])
-axes[2].set_title("Value Channel")
-axes[2].axis("off")
+fig, axes = plt.subplots(1, 3, figsize=(15, 5))
+
+for ax, name in zip(axes, ("depth", "orientation", "value")):
+    ax.imshow(gbuffer.channel(name))
+    ax.set_title(f"{name.capitalize()} Channel")
+    ax.axis("off")
 
 plt.tight_layout()
 plt.show()
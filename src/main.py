@@ -1,10 +1,11 @@
+import json
 import math
 import os
 import sys
 
+import bpy
 from mathutils import Vector
-
-# import numpy as np
+import numpy as np
 
 
 print("Script arguments:", sys.argv)
@@ -19,14 +20,33 @@ for module in modules_to_remove:
     del sys.modules[module]
 
 
-from blender_render import BlenderScene, BlenderShaderRenderer, DepthDirectionValueGrid, GreasePencilDrawing, flow_field_streamlines, streamlines_to_strokes
-# from blender_render import ndarray_to_gz_file
+from blender_render import BlenderScene, BlenderShaderRenderer, DepthDirectionValueGrid, GeometryCache, GreasePencilDrawing, HatchLayer, Profiler, RaggedPoints, RefinementBand, RendererSession, ToneSeparation, analysis_resolution, create_gbuffer, batched_streamlines, flow_field_hatch_layers, iter_hatch_layer_streamlines, refine_hatch_layers, simplify_strokes, stroke_values, streamlines_to_strokes
+# from blender_render import write_gbuffer
+
+# Keep the geometry cache in Blender's driver namespace so that it survives the module reloads above
+geometry_cache = bpy.app.driver_namespace.get("blender_render_geometry_cache")
+if geometry_cache is None:
+    geometry_cache = GeometryCache(max_bytes=2 * 1024**3, spill_dir=None)
+    bpy.app.driver_namespace["blender_render_geometry_cache"] = geometry_cache
+
+# Stage timings and tracer counters; written as JSON to profile_report_path (or printed) once the strokes are added
+profiler = Profiler(enabled=True)
+profile_report_path = None
+
+def write_profile_report():
+    if profile_report_path is None:
+        print("Profile:", json.dumps(profiler.report(), indent=2))
+    else:
+        profiler.write_json(profile_report_path)
 
 scene = BlenderScene("Light")
 
-triangle_data = scene.world_triangle_data()
+with profiler.stage("geometry_extraction"):
+    triangle_data = scene.world_triangle_data(geometry_cache)
+print("Geometry cache:", geometry_cache.stats)
 print("Vertex count:", len(triangle_data.vertices))
 print("Normal count:", len(triangle_data.normals))
+print("Triangle count:", len(triangle_data.indices))
 
 width, height = scene.render_resolution()
 aspect_ratio = width / height
@@ -61,54 +81,220 @@ print("Frame Y axis:", frame_y_axis)
 print("Frame origin:", frame_origin)
 
 
-renderer = BlenderShaderRenderer()
-pixels_orientation_depth_value = renderer.render_depth_orientation_value(
-    triangle_data,
-    view_projection_matrix,
-    camera_position,
-    light_position,
-    True,
-    0.5 * math.pi,
-    width,
-    height
-)
+# Render and trace the field at a fraction of the output resolution; d_sep and d_step stay in output pixels.
+# Hatch lines are tens of pixels apart, so a scale of 0.5 or less saves memory without visibly changing them.
+analysis_scale = 1.0
+# Trace the lines within this many output pixels of a depth discontinuity again on a full resolution render (None:
+# off). Refinement needs all lines of a layer, so it only applies if the strokes are not streamed.
+refinement_margin = None
+# The full resolution render of the refinement only covers the tiles of this size that the lines to refine reach
+# (render_tile_size instead, if set)
+refinement_tile_size = 256
+# Render in tiles of at most this many pixels per side into memory-mapped files in out_of_core_dir, for print
+# resolutions whose G-buffer and grid do not fit into GPU or main memory at once (None: one framebuffer in memory)
+render_tile_size = None
+out_of_core_dir = bpy.app.tempdir
+analysis_width, analysis_height = analysis_resolution(width, height, analysis_scale)
+print(f"Analysis size: {analysis_width} x {analysis_height}")
+
+# The compiled shader, framebuffers and uploaded geometry are kept in the driver namespace as well, so a rerun only
+# compiles and uploads what changed
+renderer = BlenderShaderRenderer(RendererSession.from_namespace(bpy.app.driver_namespace))
+
+def render_depth_orientation_value(image_width, image_height):
+    return renderer.render_depth_orientation_value(
+        triangle_data,
+        view_projection_matrix,
+        camera_position,
+        light_position,
+        True,
+        0.5 * math.pi,
+        image_width,
+        image_height,
+        profiler
+    )
 
-grid = DepthDirectionValueGrid(width, height, pixels_orientation_depth_value)
+def render_grid(image_scale, name, band=None):
+    # The G-buffer and the grid at image_scale times the output resolution; tiled, both are memmaps of files named
+    # after name. With a refinement band, only the tiles that the band reaches are rendered, and the other pixels are
+    # left uncovered.
+    image_width, image_height = analysis_resolution(width, height, image_scale)
+    if render_tile_size is None and band is None:
+        pixels = render_depth_orientation_value(image_width, image_height)
+        with profiler.stage("grid_build"):
+            return pixels, DepthDirectionValueGrid(image_width, image_height, pixels)
+    tile_size = refinement_tile_size if render_tile_size is None else render_tile_size
+    tiles = None
+    if band is not None:
+        tiles = band.output_tiles(image_width, image_height, tile_size)
+        print(f"Rendering {len(tiles)} of {math.ceil(image_width / tile_size) * math.ceil(image_height / tile_size)} tiles for '{name}'")
+    if render_tile_size is None:
+        # Depth 0 marks the pixels that are not rendered as uncovered
+        pixels = np.zeros((image_height, image_width, 3), dtype=np.float32)
+    else:
+        pixels = create_gbuffer(
+            os.path.join(out_of_core_dir, f"{name}.gbuf"),
+            image_height,
+            image_width,
+            metadata={"output_size": [width, height], "analysis_scale": image_scale}
+        ).data
+    renderer.render_depth_orientation_value_tiled(
+        triangle_data,
+        view_projection_matrix,
+        camera_position,
+        light_position,
+        True,
+        0.5 * math.pi,
+        image_width,
+        image_height,
+        pixels,
+        tile_size,
+        profiler,
+        tiles
+    )
+    if render_tile_size is None:
+        with profiler.stage("grid_build"):
+            return pixels, DepthDirectionValueGrid(image_width, image_height, pixels)
+    pixels.flush()
+    with profiler.stage("grid_build"):
+        planes_path = os.path.join(out_of_core_dir, f"{name}_planes.npy")
+        planes = np.lib.format.open_memmap(planes_path, mode="w+", dtype=np.float32, shape=(5, image_height, image_width))
+        return pixels, DepthDirectionValueGrid.from_pixels(pixels, planes)
+
+image_depth_orientation_value, grid = render_grid(analysis_scale, "render_dov")
+print("Renderer session:", renderer.session.stats)
 
 d_sep = 11.0
 step_size = 0.9
-streamlines = flow_field_streamlines(
-    grid,
-    rng_seed=420163298,
+rng_seed = 420163298
+# Add a second layer, rotated by 90 degrees and denser in the dark, that only covers the dark areas
+cross_hatching = False
+# Each layer goes to the Grease Pencil layer of the same name, which is created if necessary
+hatch_layers = [HatchLayer("Layer", d_sep=d_sep)]
+if cross_hatching:
+    hatch_layers.append(HatchLayer(
+        "CrossHatch",
+        d_sep=ToneSeparation(d_sep_dark=0.6*d_sep, d_sep_light=1.2*d_sep),
+        orientation_offset=0.5*math.pi,
+        value_threshold=0.35
+    ))
+streamline_params = dict(
     seed_box_size=1.9*d_sep,
-    d_sep=d_sep,
     d_test_factor=0.65,
     d_step=step_size,
     max_depth_step=0.05,
     max_accum_angle=5.0,
     max_steps=110,
-    min_steps=10
+    min_steps=10,
+    # "value" seeds the dark areas first, "discontinuity_distance" the areas far from silhouettes and depth jumps
+    seed_order="grid",
+    integrator="euler",
+    # With "rk4" steps, tracing the seeds in batches of 4096 (see the README) is about 10-20% faster
+    batch_size=None,
+    profiler=profiler
 )
+stroke_radius = 0.0004
+# Radius in the darkest areas relative to stroke_radius, which applies in the lightest ones (1.0: constant radius)
+stroke_radius_dark_factor = 1.0
+# Drop the points that are closer than this many pixels to the simplified stroke (None: keep all points)
+simplify_tolerance = None
+# Add the strokes in batches from a timer while they are traced, so that the first ones show up right away.
+# Set a time budget (in seconds per layer) to stop early with an evenly spaced subset, e.g. for previews.
+stream_strokes = True
+time_budget = None
 
-strokes = streamlines_to_strokes(
-    width,
-    height,
-    frame_origin.to_tuple(),
-    frame_x_axis.to_tuple(),
-    frame_y_axis.to_tuple(),
-    streamlines
-)
+# The drawings are not cleared: strokes are matched by their points, so a rerun only removes and adds the strokes that
+# changed, and the others keep their edits
+# Write the radius to the kept strokes as well, e.g. after changing stroke_radius; this overwrites their edited radius
+update_kept_strokes = False
+gp_drawings = {layer.name: GreasePencilDrawing("HatchLines", layer.name, create_layer=True) for layer in hatch_layers}
+synced_keys = {layer.name: [] for layer in hatch_layers}
+
+def add_to_drawing(layer_name, streamlines, remove_missing):
+    pixel_strokes = RaggedPoints.from_sequences(streamlines, 2)
+    if simplify_tolerance is not None:
+        with profiler.stage("simplify"):
+            pixel_strokes = simplify_strokes(pixel_strokes, simplify_tolerance, profiler)
+    with profiler.stage("strokes"):
+        strokes = streamlines_to_strokes(
+            width,
+            height,
+            frame_origin.to_tuple(),
+            frame_x_axis.to_tuple(),
+            frame_y_axis.to_tuple(),
+            pixel_strokes
+        )
+    radius = stroke_radius
+    if stroke_radius_dark_factor != 1.0:
+        values = np.clip(stroke_values(grid, pixel_strokes, analysis_scale), 0.0, 1.0)
+        radius = stroke_radius * (stroke_radius_dark_factor + (1.0 - stroke_radius_dark_factor) * values)
+    with profiler.stage("grease_pencil"):
+        keys = strokes.keys()
+        synced_keys[layer_name].append(keys)
+        return gp_drawings[layer_name].sync_strokes(strokes, radius=radius, remove_missing=remove_missing, keys=keys, update_kept=update_kept_strokes)
+
+def remove_stale_strokes():
+    # After streaming, remove the strokes of previous runs that were not traced again
+    for layer_name, gp_drawing in gp_drawings.items():
+        removed = gp_drawing.remove_strokes_except(np.concatenate(synced_keys[layer_name] + [np.zeros(0, dtype=np.uint64)]))
+        print(f"Removed {removed} stale strokes from layer '{layer_name}'")
+
+# Stop the stroke stream of a previous run of this script that is still in progress
+previous_stream = bpy.app.driver_namespace.get("blender_render_stroke_stream")
+if previous_stream is not None and bpy.app.timers.is_registered(previous_stream):
+    bpy.app.timers.unregister(previous_stream)
+
+if stream_strokes:
+    batches = (
+        (layer_name, batch)
+        for layer_name, streamlines in iter_hatch_layer_streamlines(grid, hatch_layers, rng_seed, time_budget=time_budget, analysis_scale=analysis_scale, **streamline_params)
+        for batch in batched_streamlines(streamlines)
+    )
+    streamed_counts = {}
 
-gp_drawing = GreasePencilDrawing("HatchLines", "Layer")
-gp_drawing.clear()
-gp_drawing.add_strokes(strokes, radius=0.0004)
+    def add_next_batch():
+        item = next(batches, None)
+        if item is None:
+            print("Streamline counts:", streamed_counts)
+            with profiler.stage("grease_pencil"):
+                remove_stale_strokes()
+            write_profile_report()
+            return None
+        layer_name, batch = item
+        add_to_drawing(layer_name, batch, remove_missing=False)
+        streamed_counts[layer_name] = streamed_counts.get(layer_name, 0) + len(batch)
+        return 0.0
 
+    bpy.app.driver_namespace["blender_render_stroke_stream"] = add_next_batch
+    bpy.app.timers.register(add_next_batch)
+else:
+    layer_streamlines = flow_field_hatch_layers(grid, hatch_layers, rng_seed, time_budget=time_budget, analysis_scale=analysis_scale, **streamline_params)
+    if refinement_margin is not None:
+        band = RefinementBand(grid, analysis_scale, streamline_params["max_depth_step"], refinement_margin)
+        _, fine_grid = render_grid(1.0, "render_dov_full", band)
+        with profiler.stage("refinement"):
+            layer_streamlines = refine_hatch_layers(layer_streamlines, fine_grid, band, hatch_layers, rng_seed, **streamline_params)
+    for layer_name, streamlines in layer_streamlines.items():
+        print(f"Streamline count of layer '{layer_name}':", len(streamlines))
+        print(f"Stroke changes of layer '{layer_name}':", add_to_drawing(layer_name, streamlines, remove_missing=True))
+    write_profile_report()
 
-# image_depth_orientation_value = np.array(pixels_orientation_depth_value, dtype=np.float32).reshape((height, width, 3))
 # print(image_depth_orientation_value.shape)
 # print("Depth range:", image_depth_orientation_value[:, :, 0].min(), image_depth_orientation_value[:, :, 0].max())
 # print("Orientation range:", image_depth_orientation_value[:, :, 1].min(), image_depth_orientation_value[:, :, 1].max())
 # print("Value range:", image_depth_orientation_value[:, :, 2].min(), image_depth_orientation_value[:, :, 2].max())
 
-# ndarray_to_gz_file(image_depth_orientation_value, os.path.join(module_path, f"render_dov.bin.gz"))
+# write_gbuffer(
+#     os.path.join(module_path, "render_dov.gbuf"),
+#     image_depth_orientation_value,
+#     metadata={
+#         "view_projection_matrix": [list(row) for row in view_projection_matrix],
+#         "camera_position": camera_position.to_tuple(),
+#         "light_position": light_position.to_tuple(),
+#         "is_directional_light": True,
+#         "orientation_offset": 0.5 * math.pi,
+#         "analysis_scale": analysis_scale,
+#         "output_size": [width, height],
+#     }
+# )
 # print("Rendered image data written to disk")
@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from blender_render import (
+    DepthDirectionValueGrid, HatchLayer, Profiler, RaggedPoints, ToneSeparation,
+    flow_field_hatch_layers, order_strokes, read_gbuffer, simplify_strokes, write_hpgl, write_strokes, write_svg
+)
+
+
+# Traces the hatch lines of a G-buffer saved with write_gbuffer, without Blender, and writes them as a strokes file
+# in pixel coordinates. import_strokes.py loads such a file into Grease Pencil layers inside Blender.
+#
+# The config is a JSON object with
+#   "rng_seed": int
+#   "streamlines": keyword arguments of flow_field_streamlines other than grid, rng_seed and d_sep; the
+#                  analysis_scale is read from the G-buffer metadata, and an "analysis_scale" here must match it
+#   "layers": list of {"name", "d_sep", "orientation_offset", "value_threshold"}, where d_sep is either a number or
+#             {"d_sep_dark", "d_sep_light", "gamma"}
+# See replay_config.json for an example.
+
+def hatch_layers_from_config(config: dict) -> list[HatchLayer]:
+    layers = []
+    for layer in config["layers"]:
+        d_sep = layer["d_sep"]
+        layers.append(HatchLayer(
+            name=layer["name"],
+            d_sep=ToneSeparation(**d_sep) if isinstance(d_sep, dict) else float(d_sep),
+            orientation_offset=layer.get("orientation_offset", 0.0),
+            value_threshold=layer.get("value_threshold"),
+        ))
+    return layers
+
+def main():
+    parser = argparse.ArgumentParser(description="Trace hatch lines of a saved G-buffer and write them to a strokes file")
+    parser.add_argument("gbuffer", help="G-buffer file written by write_gbuffer")
+    parser.add_argument("config", help="JSON file with the streamline parameters and hatch layers")
+    parser.add_argument("output", help="Strokes file to write")
+    parser.add_argument("--profile", help="Write a JSON profile report to this file")
+    parser.add_argument("--simplify", type=float, help="Simplify the strokes with this tolerance in pixels")
+    parser.add_argument("--svg", help="Also write the strokes, ordered for a pen plotter, to this SVG file")
+    parser.add_argument("--hpgl", help="Also write the strokes, ordered for a pen plotter, to this HPGL file")
+    parser.add_argument("--hpgl-units-per-pixel", type=float, default=1.0, help="Plotter units per pixel of the HPGL file")
+    args = parser.parse_args()
+
+    with open(args.config) as file:
+        config = json.load(file)
+    profiler = Profiler(enabled=args.profile is not None)
+
+    with profiler.stage("load"):
+        gbuffer = read_gbuffer(args.gbuffer)
+        height, width = gbuffer.data.shape[:2]
+    with profiler.stage("grid_build"):
+        grid = DepthDirectionValueGrid(width, height, gbuffer.data)
+    # The strokes are in output pixels. The G-buffer records the scale it was rendered at; a config that was written
+    # for another scale would place the lines wrongly.
+    analysis_scale = gbuffer.metadata.get("analysis_scale", 1.0)
+    streamline_kwargs = dict(config["streamlines"])
+    config_analysis_scale = streamline_kwargs.pop("analysis_scale", analysis_scale)
+    if config_analysis_scale != analysis_scale:
+        raise ValueError(
+            f"The config has analysis_scale {config_analysis_scale}, but the G-buffer was rendered at {analysis_scale}"
+        )
+    output_width, output_height = gbuffer.metadata.get(
+        "output_size",
+        (round(width / analysis_scale), round(height / analysis_scale))
+    )
+
+    start = time.perf_counter()
+    layer_streamlines = flow_field_hatch_layers(
+        grid,
+        hatch_layers_from_config(config),
+        config["rng_seed"],
+        profiler=profiler,
+        analysis_scale=analysis_scale,
+        **streamline_kwargs
+    )
+    print(f"Traced in {time.perf_counter() - start:.2f} s:", {name: len(sls) for name, sls in layer_streamlines.items()})
+
+    layer_strokes = {name: RaggedPoints.from_sequences(sls, 2) for name, sls in layer_streamlines.items()}
+    if args.simplify is not None:
+        with profiler.stage("simplify"):
+            simplified = {name: simplify_strokes(strokes, args.simplify, profiler) for name, strokes in layer_strokes.items()}
+        points_before = sum(len(strokes.points) for strokes in layer_strokes.values())
+        points_after = sum(len(strokes.points) for strokes in simplified.values())
+        print(f"Simplified from {points_before} to {points_after} points ({1.0 - points_after / max(points_before, 1):.1%} fewer)")
+        layer_strokes = simplified
+
+    with profiler.stage("write"):
+        write_strokes(
+            args.output,
+            layer_strokes,
+            metadata={"width": output_width, "height": output_height, "config": config, "simplify_tolerance": args.simplify, "gbuffer_metadata": gbuffer.metadata}
+        )
+    if args.svg is not None or args.hpgl is not None:
+        # One tour per layer, since a plotter draws the layers one after the other, each with its own pen
+        plot_layers = {}
+        travel_before = travel_after = 0.0
+        for name, strokes in layer_strokes.items():
+            strokes = strokes.take(np.flatnonzero(strokes.lengths() > 0))
+            stroke_order = order_strokes(strokes, profiler=profiler)
+            plot_layers[name] = stroke_order.apply(strokes)
+            travel_before += stroke_order.travel_before
+            travel_after += stroke_order.travel_after
+        print(f"Pen travel reduced from {travel_before:.0f} to {travel_after:.0f} pixels ({1.0 - travel_after / max(travel_before, 1e-9):.1%} less)")
+        with profiler.stage("write_plot"):
+            if args.svg is not None:
+                with open(args.svg, "w") as file:
+                    write_svg(file, plot_layers, output_width, output_height)
+            if args.hpgl is not None:
+                with open(args.hpgl, "w") as file:
+                    write_hpgl(file, plot_layers, args.hpgl_units_per_pixel)
+    if args.profile is not None:
+        profiler.write_json(args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import sys
+import types
+
+import numpy as np
+
+
+# Stand-ins for the modules that only exist inside Blender, with just what the blender_render modules touch at import
+# time: the names in their annotations, Matrix.Identity and the GPU state calls. The tests build the objects that
+# the code under test reads (meshes, textures, drawings) themselves.
+
+class Matrix:
+    def __init__(self, rows=()):
+        self.rows = np.array(rows, dtype=np.float64)
+
+    @staticmethod
+    def Identity(size: int) -> "Matrix":
+        return Matrix(np.identity(size))
+
+    def __array__(self, dtype=None, copy=None):
+        return self.rows if dtype is None else self.rows.astype(dtype)
+
+class Vector(tuple):
+    pass
+
+def _module(name: str, **attributes) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+# The GPU state calls of the last render pass, in order
+gpu_state_calls: list[tuple[str, object]] = []
+
+def _state_setter(name: str):
+    return lambda value: gpu_state_calls.append((name, value))
+
+sys.modules.setdefault("bpy", _module("bpy", types=types.SimpleNamespace(Mesh=object)))
+sys.modules.setdefault("mathutils", _module("mathutils", Matrix=Matrix, Vector=Vector))
+sys.modules.setdefault("gpu", _module(
+    "gpu",
+    types=types.SimpleNamespace(GPUShader=object, GPUBatch=object, GPUFrameBuffer=object, GPUTexture=object),
+    state=types.SimpleNamespace(**{
+        name: _state_setter(name) for name in ("depth_mask_set", "depth_test_set", "face_culling_set", "front_facing_set")
+    })
+))
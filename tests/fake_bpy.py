@@ -0,0 +1,108 @@
+
+import numpy as np
+
+
+# Just enough of a Grease Pencil v3 drawing for GreasePencilDrawing: attributes on the POINT and CURVE domains with
+# foreach_get/foreach_set over all their values, curve offsets, add_strokes and remove_strokes. Like Blender, new
+# attributes and the values of new strokes start at zero, and foreach_set must write the whole attribute.
+
+class FakeAttributeData:
+    def __init__(self, attribute: "FakeAttribute"):
+        self.attribute = attribute
+
+    def __len__(self) -> int:
+        return len(self.attribute.values)
+
+    def foreach_get(self, name: str, out: np.ndarray):
+        assert out.size == self.attribute.values.size, "foreach_get needs a buffer for all values"
+        out.reshape(-1)[:] = self.attribute.values.reshape(-1)
+
+    def foreach_set(self, name: str, values: np.ndarray):
+        values = np.asarray(values)
+        assert values.size == self.attribute.values.size, "foreach_set must write all values"
+        self.attribute.values = values.astype(self.attribute.values.dtype).reshape(self.attribute.values.shape)
+        self.attribute.write_count += 1
+
+class FakeAttribute:
+    def __init__(self, domain: str, dtype, count: int, width: int = 1):
+        self.domain = domain
+        self.values = np.zeros((count, width) if width > 1 else count, dtype=dtype)
+        self.data = FakeAttributeData(self)
+        self.write_count = 0
+
+class FakeAttributes(dict):
+    def __init__(self, drawing: "FakeDrawing"):
+        super().__init__()
+        self.drawing = drawing
+
+    def new(self, name: str, data_type: str, domain: str) -> FakeAttribute:
+        count = self.drawing.point_count() if domain == "POINT" else len(self.drawing.sizes)
+        self[name] = FakeAttribute(domain, np.int32 if data_type == "INT" else np.float32, count)
+        return self[name]
+
+class FakeOffsets(list):
+    def foreach_get(self, name: str, out: np.ndarray):
+        out[:] = self
+
+class FakeDrawing:
+    def __init__(self):
+        self.sizes: list[int] = []
+        self.attributes = FakeAttributes(self)
+        self.attributes["position"] = FakeAttribute("POINT", np.float32, 0, width=3)
+        self.added_stroke_count = 0
+        self.removed_stroke_count = 0
+
+    def point_count(self) -> int:
+        return sum(self.sizes)
+
+    @property
+    def strokes(self) -> list:
+        return [None] * len(self.sizes)
+
+    @property
+    def curve_offsets(self) -> FakeOffsets:
+        return FakeOffsets(np.concatenate(([0], np.cumsum(self.sizes, dtype=np.int64))).tolist())
+
+    def add_strokes(self, sizes: list[int]):
+        self.sizes += list(sizes)
+        self.added_stroke_count += len(sizes)
+        for attribute in self.attributes.values():
+            count = sum(sizes) if attribute.domain == "POINT" else len(sizes)
+            added = np.zeros((count,) + attribute.values.shape[1:], dtype=attribute.values.dtype)
+            attribute.values = np.concatenate((attribute.values, added))
+
+    def remove_strokes(self, indices: list[int] | None = None):
+        keep = np.zeros(len(self.sizes), dtype=bool)
+        if indices is not None:
+            keep[:] = True
+            keep[indices] = False
+        self.removed_stroke_count += int((~keep).sum())
+        offsets = np.concatenate(([0], np.cumsum(self.sizes, dtype=np.int64)))
+        points = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in np.flatnonzero(keep)] + [np.zeros(0, dtype=np.int64)])
+        for attribute in self.attributes.values():
+            attribute.values = attribute.values[points if attribute.domain == "POINT" else keep]
+        self.sizes = [size for size, is_kept in zip(self.sizes, keep) if is_kept]
+
+    def stroke_points(self, name: str = "position") -> list[np.ndarray]:
+        offsets = np.concatenate(([0], np.cumsum(self.sizes, dtype=np.int64)))
+        values = self.attributes[name].values
+        return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+# grease_pencil imports bpy at module level, but a drawing made by fake_drawing never touches it
+import fake_blender
+
+from blender_render.grease_pencil import GreasePencilDrawing
+
+
+class FakeGreasePencilData:
+    def __init__(self):
+        self.update_count = 0
+
+    def update_tag(self):
+        self.update_count += 1
+
+def fake_drawing() -> GreasePencilDrawing:
+    gp_drawing = GreasePencilDrawing.__new__(GreasePencilDrawing)
+    gp_drawing.drawing = FakeDrawing()
+    gp_drawing.gp_data = FakeGreasePencilData()
+    return gp_drawing
@@ -0,0 +1,71 @@
+import random
+
+import numpy as np
+import pytest
+
+from benchmarks.fields import noise_field, sphere_field, torus_field
+from blender_render.grid import DepthDirectionValueGrid
+from blender_render.streamlines import StreamlineRegistry, flow_field_streamlines
+
+import legacy
+
+
+FIELDS = {"sphere": sphere_field, "noise": noise_field, "torus": torus_field}
+WIDTH = 640
+HEIGHT = 400
+
+def legacy_grid(pixels: np.ndarray) -> legacy.DepthDirectionValueGrid:
+    height, width = pixels.shape[:2]
+    return legacy.DepthDirectionValueGrid(width, height, [tuple(map(float, t)) for t in pixels.reshape((-1, 3))])
+
+@pytest.mark.parametrize("field", FIELDS)
+def test_grid_value_matches_legacy(field):
+    pixels = FIELDS[field](WIDTH, HEIGHT)
+    old = legacy_grid(pixels)
+    new = DepthDirectionValueGrid(WIDTH, HEIGHT, pixels)
+    rng = random.Random(7)
+    for _ in range(5000):
+        # Including points outside the grid, which are clamped onto its border
+        x = rng.uniform(-3.0, WIDTH + 3.0)
+        y = rng.uniform(-3.0, HEIGHT + 3.0)
+        a = old.grid_value(x, y)
+        b = new.grid_value(x, y)
+        assert b.coverage_value == pytest.approx(a.coverage_value, abs=1e-5)
+        assert b.depth == pytest.approx(a.depth, abs=1e-5)
+        assert b.direction == pytest.approx(a.direction, abs=1e-5)
+        assert b.value == pytest.approx(a.value, abs=1e-5)
+
+def test_registry_matches_legacy():
+    rng = np.random.default_rng(3)
+    old = legacy.StreamlineRegistry(WIDTH, HEIGHT, 11.0)
+    new = StreamlineRegistry(WIDTH, HEIGHT, 11.0)
+    for _ in range(60):
+        # Random walks, which put many points of one streamline into the same cell
+        start = rng.uniform((0.0, 0.0), (WIDTH, HEIGHT))
+        line = start + np.cumsum(rng.normal(scale=2.0, size=(rng.integers(1, 80), 2)), axis=0)
+        assert new.add_streamline(line) == old.add_streamline(list(map(tuple, line.tolist())))
+
+    points = rng.uniform((-5.0, -5.0), (WIDTH + 5.0, HEIGHT + 5.0), size=(3000, 2))
+    for d_sep, d_sep_relaxed in ((11.0, 11.0), (11.0, 0.65 * 11.0), (7.0, 11.0)):
+        relaxed_ids = rng.integers(0, 61, len(points))
+        expected = [
+            old.is_point_allowed(tuple(p), d_sep, d_sep_relaxed, int(sid))
+            for p, sid in zip(points.tolist(), relaxed_ids)
+        ]
+        assert [new.is_point_allowed(tuple(p), d_sep, d_sep_relaxed, int(sid)) for p, sid in zip(points.tolist(), relaxed_ids)] == expected
+        for sid in (0, 17):
+            expected = [old.is_point_allowed(tuple(p), d_sep, d_sep_relaxed, sid) for p in points.tolist()]
+            assert new.points_allowed(points, d_sep, d_sep_relaxed, sid).tolist() == expected
+
+@pytest.mark.parametrize("field", FIELDS)
+def test_streamlines_match_legacy(field):
+    pixels = FIELDS[field](WIDTH, HEIGHT)
+    kwargs = dict(
+        rng_seed=42, seed_box_size=20, d_sep=11.0, d_test_factor=0.65, d_step=0.9, max_depth_step=0.05,
+        max_accum_angle=5.0, max_steps=110, min_steps=10
+    )
+    expected = legacy.flow_field_streamlines(legacy_grid(pixels), **kwargs)
+    streamlines = flow_field_streamlines(DepthDirectionValueGrid(WIDTH, HEIGHT, pixels), **kwargs)
+    assert len(streamlines) == len(expected)
+    for sl, expected_sl in zip(streamlines, expected):
+        assert np.allclose(sl, expected_sl, atol=1e-4)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from benchmarks.fields import noise_field
+from blender_render.grid import DepthDirectionValueGrid
+from blender_render.ragged import RaggedPoints
+from blender_render.utils import create_gbuffer, read_gbuffer, read_strokes, write_gbuffer, write_strokes
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib"])
+def test_gbuffer_round_trip(tmp_path, compression):
+    # A size that is not a multiple of the tile size, so that the last tiles are partial
+    pixels = noise_field(300, 170)
+    path = str(tmp_path / "field.gbuf")
+    write_gbuffer(path, pixels, metadata={"analysis_scale": 0.5}, compression=compression, tile_size=64)
+    gbuffer = read_gbuffer(path)
+    assert np.array_equal(gbuffer.data, pixels)
+    assert gbuffer.metadata == {"analysis_scale": 0.5}
+    assert np.array_equal(gbuffer.channel("value"), pixels[:, :, 2])
+
+def test_read_gbuffer_rejects_other_files(tmp_path):
+    path = tmp_path / "strokes.bin"
+    write_strokes(str(path), {})
+    with pytest.raises(ValueError):
+        read_gbuffer(str(path))
+
+def test_created_gbuffer_is_written_through_the_memmap(tmp_path):
+    pixels = noise_field(300, 170)
+    path = str(tmp_path / "tiled.gbuf")
+    gbuffer = create_gbuffer(path, 170, 300, metadata={"output_size": [600, 340]})
+    for y0 in range(0, 170, 64):
+        gbuffer.data[y0:y0 + 64] = pixels[y0:y0 + 64]
+    gbuffer.data.flush()
+    del gbuffer
+
+    read = read_gbuffer(path)
+    assert np.array_equal(read.data, pixels)
+    assert read.metadata == {"output_size": [600, 340]}
+    # The grid built a chunk of rows at a time equals the one built at once
+    planes = np.empty((5, 170, 300), dtype=np.float32)
+    chunked = DepthDirectionValueGrid.from_pixels(read.data, planes, rows_per_chunk=50)
+    whole = DepthDirectionValueGrid(300, 170, pixels)
+    xs = np.linspace(0.0, 299.0, 1000)
+    ys = np.linspace(0.0, 169.0, 1000)
+    assert np.array_equal(chunked.sample_many(xs, ys).value, whole.sample_many(xs, ys).value)
+
+def test_strokes_round_trip(tmp_path):
+    rng = np.random.default_rng(2)
+    layers = {
+        "Layer": RaggedPoints.from_sequences([rng.uniform(0, 100, (n, 2)) for n in (3, 0, 7, 1)], 2),
+        "Empty": RaggedPoints.from_sequences([], 2),
+        "CrossHatch": RaggedPoints.from_sequences([rng.uniform(0, 100, (5, 2))], 2),
+    }
+    path = str(tmp_path / "strokes.bin")
+    write_strokes(path, layers, metadata={"width": 100, "height": 100})
+    read, metadata = read_strokes(path)
+    assert list(read) == list(layers)
+    assert metadata == {"width": 100, "height": 100}
+    for name, strokes in layers.items():
+        assert np.array_equal(read[name].offsets, strokes.offsets)
+        assert np.array_equal(read[name].points, strokes.points.astype(np.float32))
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+
+from blender_render.geometry_cache import GeometryCache
+
+
+def entry(value: float) -> dict[str, np.ndarray]:
+    # 40 bytes per entry
+    return {"vertices": np.full(6, value, dtype=np.float32), "indices": np.arange(4, dtype=np.uint32)}
+
+def test_content_key_depends_on_content_dtype_and_shape():
+    a = np.arange(6, dtype=np.float32)
+    assert GeometryCache.content_key(a) == GeometryCache.content_key(a.copy())
+    assert GeometryCache.content_key(a) != GeometryCache.content_key(a + 1)
+    assert GeometryCache.content_key(a) != GeometryCache.content_key(a.astype(np.float64))
+    assert GeometryCache.content_key(a) != GeometryCache.content_key(a.reshape((2, 3)))
+    assert GeometryCache.content_key(a[:3], a[3:]) != GeometryCache.content_key(a[:2], a[2:])
+
+def test_least_recently_used_entries_are_evicted():
+    cache = GeometryCache(max_bytes=100)
+    for name in "abc":
+        cache.put(name, entry(1.0))
+    # Three entries do not fit, so the oldest one went
+    assert list(cache.entries) == ["b", "c"]
+    assert (cache.stats.entries, cache.stats.bytes, cache.stats.evictions) == (2, 80, 1)
+
+    assert cache.get("b") is not None
+    cache.put("d", entry(2.0))
+    # b was used after c, so c is evicted
+    assert list(cache.entries) == ["b", "d"]
+    assert cache.get("a") is None and cache.get("c") is None
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.evictions) == (1, 2, 2)
+
+def test_entry_larger_than_the_budget_is_kept_alone():
+    cache = GeometryCache(max_bytes=30)
+    cache.put("a", entry(1.0))
+    assert list(cache.entries) == ["a"] and cache.stats.bytes == 40
+    cache.put("b", entry(2.0))
+    assert list(cache.entries) == ["b"]
+
+def test_replacing_an_entry_keeps_the_byte_count():
+    cache = GeometryCache(max_bytes=1000)
+    cache.put("a", entry(1.0))
+    cache.put("a", {"vertices": np.zeros(1, dtype=np.float32)})
+    assert cache.stats.bytes == 4 and cache.stats.entries == 1
+
+def test_evicted_entries_are_spilled_and_loaded_back(tmp_path):
+    spill_dir = str(tmp_path / "spill")
+    cache = GeometryCache(max_bytes=50, spill_dir=spill_dir)
+    cache.put("a", entry(1.0))
+    cache.put("b", entry(2.0))
+    assert os.listdir(spill_dir) == ["a.npz"]
+
+    arrays = cache.get("a")
+    assert np.array_equal(arrays["vertices"], entry(1.0)["vertices"])
+    assert arrays["indices"].dtype == np.uint32
+    assert (cache.stats.hits, cache.stats.spill_hits, cache.stats.misses) == (1, 1, 0)
+    # Loading a back evicted b, which is spilled in turn
+    assert list(cache.entries) == ["a"]
+    assert sorted(os.listdir(spill_dir)) == ["a.npz", "b.npz"]
+
+    # A new cache on the same directory finds the spilled entries, e.g. after a restart
+    other = GeometryCache(max_bytes=50, spill_dir=spill_dir)
+    assert np.array_equal(other.get("b")["vertices"], entry(2.0)["vertices"])
+    assert other.stats.spill_hits == 1
+
+def test_clear_resets_entries_and_stats():
+    cache = GeometryCache(max_bytes=100)
+    cache.put("a", entry(1.0))
+    cache.get("a")
+    cache.clear()
+    assert len(cache.entries) == 0 and cache.stats.hits == 0 and cache.stats.bytes == 0
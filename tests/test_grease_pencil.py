@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+
+from blender_render.ragged import RaggedPoints
+
+from fake_bpy import fake_drawing
+
+
+def random_strokes(count: int, seed: int) -> RaggedPoints:
+    rng = np.random.default_rng(seed)
+    return RaggedPoints.from_sequences([rng.random((n, 3)).astype(np.float32) for n in rng.integers(2, 9, count)], 3, dtype=np.float32)
+
+def drawn_strokes(gp_drawing, name: str = "position") -> dict[bytes, np.ndarray]:
+    # The values of attribute name of every stroke of the drawing, by the bytes of the stroke's points
+    return {
+        points.tobytes(): values
+        for points, values in zip(gp_drawing.drawing.stroke_points(), gp_drawing.drawing.stroke_points(name))
+    }
+
+def test_sync_keeps_unchanged_strokes():
+    strokes = random_strokes(30, 1)
+    gp_drawing = fake_drawing()
+    stats = gp_drawing.sync_strokes(strokes, radius=0.1)
+    assert (stats.kept, stats.added, stats.removed) == (0, 30, 0)
+
+    radius = gp_drawing.drawing.attributes["radius"]
+    stats = gp_drawing.sync_strokes(strokes, radius=0.2)
+    assert (stats.kept, stats.added, stats.removed) == (30, 0, 0)
+    # Nothing was added, removed or written
+    assert gp_drawing.drawing.added_stroke_count == 30 and gp_drawing.drawing.removed_stroke_count == 0
+    assert radius.write_count == 1 and np.all(radius.values == np.float32(0.1))
+
+    # On request, the radius of every stroke is written in one call
+    stats = gp_drawing.sync_strokes(strokes, radius=0.2, update_kept=True)
+    assert (stats.kept, stats.added, stats.removed) == (30, 0, 0)
+    assert radius.write_count == 2 and np.all(radius.values == np.float32(0.2))
+
+def test_sync_keeps_the_edited_radius_of_kept_strokes():
+    strokes = random_strokes(10, 15)
+    gp_drawing = fake_drawing()
+    gp_drawing.sync_strokes(strokes.take(np.arange(0, 8)), radius=0.1)
+    # A stroke thickened in Blender
+    edited = gp_drawing.drawing.attributes["radius"].values
+    edited[strokes.offsets[3]:strokes.offsets[4]] = 0.5
+
+    stats = gp_drawing.sync_strokes(strokes, radius=0.2)
+    assert (stats.kept, stats.added, stats.removed) == (8, 2, 0)
+    radius = drawn_strokes(gp_drawing, "radius")
+    assert np.all(radius[strokes[3].tobytes()] == np.float32(0.5))
+    assert all(np.all(radius[strokes[k].tobytes()] == np.float32(0.1)) for k in (0, 1, 2, 4, 5, 6, 7))
+    assert all(np.all(radius[strokes[k].tobytes()] == np.float32(0.2)) for k in (8, 9))
+
+def test_sync_adds_and_removes_only_changed_strokes():
+    strokes = random_strokes(40, 2)
+    gp_drawing = fake_drawing()
+    gp_drawing.sync_strokes(strokes.take(np.arange(0, 30)), radius=0.1)
+
+    changed = strokes.take(np.arange(10, 40))
+    # Per-point radius, e.g. from the value channel
+    radius = np.arange(len(changed.points), dtype=np.float32)
+    stats = gp_drawing.sync_strokes(changed, radius=radius)
+    assert (stats.kept, stats.added, stats.removed) == (20, 10, 10)
+    assert gp_drawing.drawing.added_stroke_count == 40 and gp_drawing.drawing.removed_stroke_count == 10
+
+    # The added strokes get their radius, the kept ones keep the one they were added with
+    drawn = drawn_strokes(gp_drawing, "radius")
+    assert len(drawn) == len(changed)
+    for k, stroke in enumerate(changed):
+        expected = radius[changed.offsets[k]:changed.offsets[k + 1]] if k >= 20 else np.float32(0.1)
+        assert np.all(drawn[stroke.tobytes()] == expected)
+
+def test_batched_sync_then_remove_stale_strokes():
+    strokes = random_strokes(25, 3)
+    gp_drawing = fake_drawing()
+    gp_drawing.sync_strokes(random_strokes(5, 4), radius=0.1)
+
+    keys = []
+    for batch in (np.arange(0, 16), np.arange(16, 25)):
+        batch_strokes = strokes.take(batch)
+        keys.append(batch_strokes.keys())
+        stats = gp_drawing.sync_strokes(batch_strokes, radius=0.3, remove_missing=False, keys=keys[-1])
+        assert stats.removed == 0
+    assert gp_drawing.remove_strokes_except(np.concatenate(keys)) == 5
+    assert set(drawn_strokes(gp_drawing)) == {stroke.tobytes() for stroke in strokes}
+
+@pytest.mark.parametrize("method", ["add_strokes", "sync_strokes"])
+def test_first_opacity_keeps_earlier_strokes_opaque(method):
+    gp_drawing = fake_drawing()
+
+    def add(strokes, **kwargs):
+        if method == "sync_strokes":
+            # Keep the strokes added without a key
+            kwargs["remove_missing"] = False
+        getattr(gp_drawing, method)(strokes, **kwargs)
+
+    earlier = random_strokes(5, 5)
+    later = random_strokes(5, 6)
+    gp_drawing.add_strokes(earlier, radius=0.1)
+    add(later, radius=0.1, opacity=0.5)
+
+    opacity = drawn_strokes(gp_drawing, "opacity")
+    for stroke in earlier:
+        assert np.all(opacity[stroke.tobytes()] == 1.0)
+    for stroke in later:
+        assert np.all(opacity[stroke.tobytes()] == np.float32(0.5))
+
+    # Strokes added without an opacity once the drawing has one are opaque as well
+    newest = random_strokes(3, 7)
+    add(newest, radius=0.1)
+    opacity = drawn_strokes(gp_drawing, "opacity")
+    assert all(np.all(opacity[stroke.tobytes()] == 1.0) for stroke in newest)
+
+def test_add_strokes_takes_ragged_strokes_in_one_write():
+    strokes = random_strokes(20, 8)
+    gp_drawing = fake_drawing()
+    gp_drawing.add_strokes(strokes, radius=0.1)
+    position = gp_drawing.drawing.attributes["position"]
+    assert position.write_count == 1
+    assert np.array_equal(position.values, strokes.points)
+    assert gp_drawing.drawing.sizes == strokes.lengths().tolist()
+
+    # Appending reads the existing points back, since foreach_set writes all of them
+    more = random_strokes(5, 9)
+    gp_drawing.add_strokes(list(more), radius=np.linspace(0.0, 1.0, len(more.points)))
+    assert np.array_equal(position.values, np.concatenate((strokes.points, more.points)))
+    assert np.array_equal(gp_drawing.drawing.attributes["radius"].values[len(strokes.points):], np.linspace(0.0, 1.0, len(more.points)).astype(np.float32))
+    assert np.all(gp_drawing.drawing.attributes["radius"].values[:len(strokes.points)] == np.float32(0.1))
+    assert np.all(gp_drawing.stroke_keys() == 0)
+
+def test_sync_adds_repeated_strokes_once():
+    strokes = random_strokes(6, 10)
+    repeated = strokes.take([0, 1, 2, 1, 3, 4, 5, 0])
+    gp_drawing = fake_drawing()
+    stats = gp_drawing.sync_strokes(repeated, radius=np.arange(len(repeated.points), dtype=np.float32))
+    assert (stats.kept, stats.added, stats.removed) == (0, 6, 0)
+    assert gp_drawing.stroke_keys().tolist() == strokes.keys().tolist()
+    # The radius of a repeated stroke comes from its first occurrence, the second stroke of repeated
+    first_point = repeated.offsets[1]
+    assert np.array_equal(drawn_strokes(gp_drawing, "radius")[strokes[1].tobytes()], np.arange(first_point, first_point + len(strokes[1])))
+
+def test_remove_strokes_except_drops_unkeyed_and_repeated_strokes():
+    strokes = random_strokes(4, 11)
+    gp_drawing = fake_drawing()
+    gp_drawing.sync_strokes(strokes, radius=0.1)
+    # Strokes added without a key, and a stroke whose key repeats that of the first one
+    gp_drawing.add_strokes(random_strokes(3, 12), radius=0.1)
+    gp_drawing.add_strokes(strokes.take([0]), radius=0.1)
+    keys = gp_drawing.stroke_keys()
+    keys[-1] = keys[0]
+    gp_drawing._set_stroke_keys(keys)
+
+    assert gp_drawing.remove_strokes_except(np.append(strokes.keys(), np.uint64(0))) == 4
+    assert gp_drawing.stroke_keys().tolist() == strokes.keys().tolist()
+    assert gp_drawing.remove_strokes_except(strokes.keys()[2:]) == 2
+    assert [stroke.tobytes() for stroke in gp_drawing.drawing.stroke_points()] == [strokes[2].tobytes(), strokes[3].tobytes()]
+
+def test_sync_removes_unkeyed_strokes_and_keeps_their_neighbours_in_place():
+    strokes = random_strokes(5, 13)
+    gp_drawing = fake_drawing()
+    gp_drawing.add_strokes(random_strokes(2, 14), radius=0.1)
+    stats = gp_drawing.sync_strokes(strokes.take([0, 1, 2]), radius=0.1)
+    assert (stats.kept, stats.added, stats.removed) == (0, 3, 2)
+    stats = gp_drawing.sync_strokes(strokes.take([4, 2, 0, 3]), radius=0.2)
+    assert (stats.kept, stats.added, stats.removed) == (2, 2, 1)
+    # Kept strokes stay in their order, new ones are appended
+    assert [stroke.tobytes() for stroke in gp_drawing.drawing.stroke_points()] == [strokes[i].tobytes() for i in (0, 2, 4, 3)]
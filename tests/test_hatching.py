@@ -0,0 +1,82 @@
+import math
+
+import numpy as np
+import pytest
+
+from benchmarks.fields import noise_field
+from blender_render.grid import DepthDirectionValueGrid
+from blender_render.hatching import HatchLayer, LayerGrid, flow_field_hatch_layers
+from blender_render.streamlines import ToneSeparation, flow_field_streamlines
+
+
+STREAMLINE_PARAMS = dict(
+    seed_box_size=12.0,
+    d_test_factor=0.65,
+    d_step=0.9,
+    max_depth_step=0.05,
+    max_accum_angle=5.0,
+    max_steps=110,
+    min_steps=10
+)
+
+def gradient_grid(width: int, height: int) -> DepthDirectionValueGrid:
+    # Horizontal hatch directions, dark at the top and light at the bottom
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    pixels = np.stack((np.full_like(xx, 5.0), np.zeros_like(xx), yy / (height - 1)), axis=-1)
+    return DepthDirectionValueGrid(width, height, pixels)
+
+def test_tone_separation_maps_the_value_to_a_distance():
+    separation = ToneSeparation(d_sep_dark=4.0, d_sep_light=12.0, gamma=2.0)
+    assert separation.max_separation == 12.0
+    assert np.allclose(separation(np.array([-1.0, 0.0, 0.5, 1.0, 2.0])), [4.0, 4.0, 6.0, 12.0, 12.0])
+    assert separation.scaled(0.5) == ToneSeparation(2.0, 6.0, 2.0)
+
+def test_tone_separation_spaces_the_lines_by_the_value():
+    grid = gradient_grid(300, 300)
+    streamlines = flow_field_streamlines(grid, 1, d_sep=ToneSeparation(d_sep_dark=4.0, d_sep_light=12.0), **STREAMLINE_PARAMS)
+    points = np.concatenate([np.asarray(sl) for sl in streamlines])
+    # d_sep is about 5.3 pixels in the dark band and about 10.7 pixels in the light one, so the dark band holds about
+    # twice as many line points
+    dark_count = np.count_nonzero((points[:, 1] > 20.0) & (points[:, 1] < 80.0))
+    light_count = np.count_nonzero((points[:, 1] > 220.0) & (points[:, 1] < 280.0))
+    assert 1.6 < dark_count / light_count < 2.6
+    # With a constant d_sep, both bands are alike
+    constant = np.concatenate([np.asarray(sl) for sl in flow_field_streamlines(grid, 1, d_sep=8.0, **STREAMLINE_PARAMS)])
+    ratio = np.count_nonzero((constant[:, 1] > 20.0) & (constant[:, 1] < 80.0)) / np.count_nonzero((constant[:, 1] > 220.0) & (constant[:, 1] < 280.0))
+    assert 0.8 < ratio < 1.25
+
+def test_layer_grid_rotates_directions_and_masks_coverage():
+    grid = DepthDirectionValueGrid(120, 80, noise_field(120, 80))
+    view = LayerGrid(grid, 0.5 * math.pi, 0.4)
+    rng = np.random.default_rng(4)
+    xs = rng.uniform(0.0, 119.0, 200)
+    ys = rng.uniform(0.0, 79.0, 200)
+    samples = grid.sample_many(xs, ys)
+    view_samples = view.sample_many(xs, ys)
+    assert np.allclose(view_samples.dir_cos, -samples.dir_sin)
+    assert np.allclose(view_samples.dir_sin, samples.dir_cos)
+    assert np.array_equal(view_samples.coverage, np.where(samples.value < 0.4, samples.coverage, 0.0))
+    for k in range(0, 200, 20):
+        gv = view.grid_value(xs[k], ys[k])
+        assert gv.direction == pytest.approx((view_samples.dir_cos[k], view_samples.dir_sin[k]), abs=1e-6)
+        assert gv.coverage_value == pytest.approx(view_samples.coverage[k], abs=1e-6)
+
+def test_hatch_layers_are_traced_per_layer():
+    grid = gradient_grid(200, 200)
+    layers = [HatchLayer("Base", d_sep=8.0), HatchLayer("Cross", d_sep=8.0, orientation_offset=0.5 * math.pi, value_threshold=0.5)]
+    layer_streamlines = flow_field_hatch_layers(grid, layers, 1, **STREAMLINE_PARAMS)
+    assert list(layer_streamlines) == ["Base", "Cross"]
+    # The first layer is the plain trace; the others get their own seed
+    assert layer_streamlines["Base"] == flow_field_streamlines(grid, 1, d_sep=8.0, **STREAMLINE_PARAMS)
+
+    base_points = np.concatenate([np.asarray(sl) for sl in layer_streamlines["Base"]])
+    cross_points = np.concatenate([np.asarray(sl) for sl in layer_streamlines["Cross"]])
+    # The base lines run along the rows over the whole grid, the cross lines along the columns in the dark half
+    assert all(np.ptp(np.asarray(sl)[:, 1]) < 1e-3 for sl in layer_streamlines["Base"])
+    assert all(np.ptp(np.asarray(sl)[:, 0]) < 1e-3 for sl in layer_streamlines["Cross"])
+    assert base_points[:, 1].max() > 190.0
+    assert len(cross_points) > 0 and cross_points[:, 1].max() < 0.5 * 199 + 1.0
+
+def test_hatch_layer_names_must_be_unique():
+    with pytest.raises(AssertionError):
+        flow_field_hatch_layers(gradient_grid(50, 50), [HatchLayer("A", 8.0), HatchLayer("A", 8.0)], 1, **STREAMLINE_PARAMS)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from benchmarks.fields import vortex_field
+from blender_render.grid import DepthDirectionValueGrid
+from blender_render.integrators import BATCH_INTEGRATORS, INTEGRATORS, sample_directions
+
+
+WIDTH = 400
+HEIGHT = 400
+
+@pytest.fixture(scope="module")
+def vortex_grid() -> DepthDirectionValueGrid:
+    return DepthDirectionValueGrid(WIDTH, HEIGHT, vortex_field(WIDTH, HEIGHT))
+
+def radius_drift(grid: DepthDirectionValueGrid, integrator: str, step_count: int = 400) -> float:
+    # Largest change of the distance to the centre along a circle traced from (x, y) = (centre + 100, centre)
+    integrate = INTEGRATORS[integrator]
+    centre = np.array((0.5 * WIDTH, 0.5 * HEIGHT))
+    p = (centre[0] + 100.0, centre[1])
+    direction = grid.grid_value(*p).direction
+    h = 2.0
+    drift = 0.0
+    for _ in range(step_count):
+        p, gv, h = integrate(grid, p, direction, h, 2.0, 0.01)
+        direction = gv.direction
+        drift = max(drift, abs(float(np.hypot(*(np.array(p) - centre))) - 100.0))
+    return drift
+
+def test_higher_order_integrators_follow_circles(vortex_grid):
+    drifts = {name: radius_drift(vortex_grid, name) for name in INTEGRATORS}
+    # Euler spirals outwards by a few pixels per revolution
+    assert drifts["euler"] > 5.0
+    assert drifts["midpoint"] < 0.01
+    assert drifts["rk4"] < 0.01
+    assert drifts["adaptive_rk23"] < 0.01
+
+def test_adaptive_step_stays_within_bounds(vortex_grid):
+    integrate = INTEGRATORS["adaptive_rk23"]
+    p = (0.5 * WIDTH + 30.0, 0.5 * HEIGHT)
+    direction = vortex_grid.grid_value(*p).direction
+    for h in (4.0, -4.0):
+        _, _, h_next = integrate(vortex_grid, p, direction, h, 4.0, 1e-3)
+        assert 0.0 < abs(h_next) <= 4.0
+        assert np.sign(h_next) == np.sign(h)
+
+@pytest.mark.parametrize("integrator", INTEGRATORS)
+def test_batched_integrators_match_scalar(vortex_grid, integrator):
+    rng = np.random.default_rng(5)
+    points = rng.uniform(20.0, WIDTH - 20.0, size=(200, 2))
+    samples = vortex_grid.sample_many(points[:, 0], points[:, 1])
+    directions = sample_directions(samples)
+    h = rng.choice((-1.5, 1.5), size=len(points))
+    p_new, new_samples, h_new = BATCH_INTEGRATORS[integrator](vortex_grid, points, directions, h, 1.5, 0.01)
+    for k in range(len(points)):
+        expected_p, expected_gv, expected_h = INTEGRATORS[integrator](
+            vortex_grid, tuple(points[k]), tuple(directions[k]), float(h[k]), 1.5, 0.01
+        )
+        assert p_new[k] == pytest.approx(expected_p, abs=1e-6)
+        assert new_samples.value[k] == pytest.approx(expected_gv.value, abs=1e-6)
+        assert h_new[k] == pytest.approx(expected_h, abs=1e-9)
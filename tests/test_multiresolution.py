@@ -0,0 +1,37 @@
+import numpy as np
+
+from benchmarks.fields import sphere_field
+from blender_render.grid import DepthDirectionValueGrid
+from blender_render.multiresolution import RefinementBand, refine_streamlines
+from blender_render.streamlines import flow_field_streamlines
+from blender_render.utils import tile_slices
+
+
+STREAMLINE_PARAMS = dict(
+    seed_box_size=20.9,
+    d_sep=11.0,
+    d_test_factor=0.65,
+    d_step=0.9,
+    max_depth_step=0.05,
+    max_accum_angle=5.0,
+    max_steps=110,
+    min_steps=10
+)
+
+def test_refinement_only_needs_the_tiles_of_the_band():
+    width, height, tile_size = 800, 600, 64
+    coarse_grid = DepthDirectionValueGrid(400, 300, sphere_field(400, 300))
+    streamlines = flow_field_streamlines(coarse_grid, 3, analysis_scale=0.5, **STREAMLINE_PARAMS)
+    band = RefinementBand(coarse_grid, 0.5, STREAMLINE_PARAMS["max_depth_step"], 8.0)
+    tiles = band.output_tiles(width, height, tile_size)
+    assert 0 < len(tiles) < len(tile_slices(height, width, tile_size)) // 2
+
+    fine_pixels = sphere_field(width, height)
+    # Depth 0 marks the pixels of the tiles that are not rendered as uncovered
+    tile_pixels = np.zeros_like(fine_pixels)
+    for ys, xs in tiles:
+        tile_pixels[ys, xs] = fine_pixels[ys, xs]
+    refined = refine_streamlines(streamlines, DepthDirectionValueGrid(width, height, fine_pixels), band, 5, **STREAMLINE_PARAMS)
+    tile_refined = refine_streamlines(streamlines, DepthDirectionValueGrid(width, height, tile_pixels), band, 5, **STREAMLINE_PARAMS)
+    assert len(refined) > len(streamlines) // 2
+    assert refined == tile_refined
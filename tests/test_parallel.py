@@ -0,0 +1,110 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.fields import noise_field
+from blender_render.grid import DepthDirectionValueGrid
+from blender_render.parallel import SharedGridPlanes, _attach_shared_planes, _tile_tasks, _trace_tile_on, flow_field_streamlines_tiled, parameter_sweep, sweep_strokes_path, tile_halo
+from blender_render.streamlines import ToneSeparation, flow_field_streamlines
+from blender_render.utils import read_strokes
+
+import blender_render.parallel as parallel
+
+
+STREAMLINE_PARAMS = dict(
+    seed_box_size=20.9,
+    d_sep=11.0,
+    d_test_factor=0.65,
+    d_step=0.9,
+    max_depth_step=0.05,
+    max_accum_angle=5.0,
+    max_steps=110,
+    min_steps=10
+)
+
+def noise_grid(size: int) -> DepthDirectionValueGrid:
+    return DepthDirectionValueGrid(size, size, noise_field(size, size))
+
+def test_tiled_result_does_not_depend_on_the_workers():
+    grid = noise_grid(256)
+    single = flow_field_streamlines_tiled(grid, 3, tile_size=128, workers=1, **STREAMLINE_PARAMS)
+    assert single == flow_field_streamlines_tiled(grid, 3, tile_size=128, workers=2, **STREAMLINE_PARAMS)
+    assert single == flow_field_streamlines_tiled(grid, 3, tile_size=128, workers=3, **STREAMLINE_PARAMS)
+
+def test_owned_lines_are_not_cut_at_the_window_edges():
+    grid = noise_grid(512)
+    halo = tile_halo(STREAMLINE_PARAMS["d_sep"], STREAMLINE_PARAMS["max_steps"], STREAMLINE_PARAMS["d_step"])
+    tasks = _tile_tasks(grid.width, grid.height, 128, halo, 3, STREAMLINE_PARAMS)
+    owned_count = 0
+    for task in tasks:
+        wx0, wy0, wx1, wy1 = task.window
+        for sl in _trace_tile_on(grid.planes, task):
+            owned_count += 1
+            for x, y in (sl[0], sl[-1]):
+                # Window edges on the border of the grid are edges of the serial trace as well
+                assert wx0 == 0 or x > wx0 + 1.0
+                assert wy0 == 0 or y > wy0 + 1.0
+                assert wx1 == grid.width or x < wx1 - 2.0
+                assert wy1 == grid.height or y < wy1 - 2.0
+    assert owned_count > 300
+
+def test_tiled_result_covers_about_as_much_as_the_serial_one():
+    grid = noise_grid(512)
+    serial_points = sum(len(sl) for sl in flow_field_streamlines(grid, 3, **STREAMLINE_PARAMS))
+    tiled = flow_field_streamlines_tiled(grid, 3, tile_size=128, **STREAMLINE_PARAMS)
+    assert sum(len(sl) for sl in tiled) > 0.95 * serial_points
+    unfilled = flow_field_streamlines_tiled(grid, 3, tile_size=128, fill_gaps=False, **STREAMLINE_PARAMS)
+    assert tiled[:len(unfilled)] == unfilled
+
+def test_workers_see_the_planes_of_the_shared_grid():
+    grid = noise_grid(64)
+    with SharedGridPlanes(grid) as shared_planes:
+        _attach_shared_planes(shared_planes.name, shared_planes.shape)
+        try:
+            assert np.array_equal(parallel._worker_planes, grid.planes)
+        finally:
+            parallel._worker_planes = None
+            parallel._worker_shm.close()
+            parallel._worker_shm = None
+
+def sweep_param_sets() -> list[dict]:
+    return [
+        dict(STREAMLINE_PARAMS, rng_seed=seed, d_sep=d_sep)
+        for seed, d_sep in ((1, 14.0), (2, 8.0), (3, ToneSeparation(6.0, 12.0)))
+    ]
+
+def test_sweep_yields_the_stats_of_each_set_in_order():
+    grid = noise_grid(128)
+    param_sets = sweep_param_sets()
+    results = list(parameter_sweep(grid, param_sets))
+    assert [result.index for result in results] == [0, 1, 2]
+    for result, params in zip(results, param_sets):
+        assert result.params == params
+        streamlines = flow_field_streamlines(grid, **params)
+        assert result.streamline_count == len(streamlines) and result.point_count == sum(len(sl) for sl in streamlines)
+        length = sum(np.linalg.norm(np.diff(np.asarray(sl), axis=0), axis=1).sum() for sl in streamlines)
+        assert result.total_length == pytest.approx(length, rel=1e-5)
+        assert [stroke.tolist() for stroke in result.streamlines] == [np.asarray(sl, dtype=np.float32).tolist() for sl in streamlines]
+    # Denser lines are longer in total
+    assert results[1].total_length > results[0].total_length
+    # The workers give the same results, in the same order
+    parallel_results = list(parameter_sweep(grid, param_sets, workers=2))
+    assert [(r.index, r.streamline_count, r.point_count) for r in parallel_results] == [(r.index, r.streamline_count, r.point_count) for r in results]
+
+def test_sweep_writes_each_set_to_the_output_dir(tmp_path):
+    grid = noise_grid(128)
+    output_dir = str(tmp_path / "sweep")
+    results = list(parameter_sweep(grid, sweep_param_sets(), workers=2, output_dir=output_dir))
+    assert all(result.streamlines is None for result in results)
+    assert sorted(os.listdir(output_dir)) == ["summary.jsonl", "sweep_00000.bin", "sweep_00001.bin", "sweep_00002.bin"]
+    with open(os.path.join(output_dir, "summary.jsonl")) as file:
+        summaries = [json.loads(line) for line in file]
+    assert [summary["index"] for summary in summaries] == [0, 1, 2]
+    assert summaries[2]["params"]["d_sep"] == {"d_sep_dark": 6.0, "d_sep_light": 12.0, "gamma": 1.0}
+    for result, summary in zip(results, summaries):
+        layers, metadata = read_strokes(sweep_strokes_path(output_dir, result.index))
+        assert metadata == summary
+        assert len(layers["Layer"]) == result.streamline_count == summary["streamline_count"]
+        assert len(layers["Layer"].points) == result.point_count
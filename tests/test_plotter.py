@@ -0,0 +1,71 @@
+import io
+import itertools
+import xml.dom.minidom
+
+import numpy as np
+
+from blender_render.plotter import order_strokes, travel_distance, write_hpgl, write_svg
+from blender_render.ragged import RaggedPoints
+
+
+def random_strokes(count: int, seed: int) -> RaggedPoints:
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(0.0, 1000.0, (count, 2))
+    return RaggedPoints.from_sequences(
+        [start + np.outer(np.arange(n), rng.normal(size=2) * 5.0) for start, n in zip(starts, rng.integers(1, 8, count))],
+        2
+    )
+
+def test_order_is_a_permutation_that_shortens_the_travel():
+    strokes = random_strokes(2000, 1)
+    stroke_order = order_strokes(strokes)
+    assert sorted(stroke_order.order.tolist()) == list(range(len(strokes)))
+    assert stroke_order.travel_before == travel_distance(strokes)
+    assert stroke_order.travel_after <= stroke_order.travel_greedy < 0.2 * stroke_order.travel_before
+
+    ordered = stroke_order.apply(strokes)
+    assert np.isclose(travel_distance(ordered), stroke_order.travel_after)
+    for k, (stroke_index, is_reversed) in enumerate(zip(stroke_order.order, stroke_order.reverse)):
+        expected = strokes[stroke_index][::-1] if is_reversed else strokes[stroke_index]
+        assert np.array_equal(ordered[k], expected)
+
+def test_greedy_pass_takes_the_nearest_end():
+    strokes = random_strokes(40, 2)
+    stroke_order = order_strokes(strokes, two_opt_window=1, max_two_opt_passes=0)
+    firsts = strokes.points[strokes.offsets[:-1]]
+    lasts = strokes.points[strokes.offsets[1:] - 1]
+    pen = np.zeros(2)
+    left = set(range(len(strokes)))
+    for stroke_index, is_reversed in zip(stroke_order.order.tolist(), stroke_order.reverse.tolist()):
+        entry = lasts[stroke_index] if is_reversed else firsts[stroke_index]
+        nearest = min(np.hypot(*(end - pen)) for i in left for end in (firsts[i], lasts[i]))
+        assert np.isclose(np.hypot(*(entry - pen)), nearest)
+        left.remove(stroke_index)
+        pen = firsts[stroke_index] if is_reversed else lasts[stroke_index]
+
+def test_order_is_close_to_optimal_on_tiny_inputs():
+    strokes = random_strokes(6, 3)
+    stroke_order = order_strokes(strokes, two_opt_window=6)
+    # Exhaustive search over orders and directions
+    best = min(
+        travel_distance(strokes, np.array(order), np.array(reverse))
+        for order in itertools.permutations(range(6))
+        for reverse in itertools.product((False, True), repeat=6)
+    )
+    # 2-opt without or-opt moves is not exact, but within a few percent here
+    assert stroke_order.travel_after <= 1.1 * best
+
+def test_writers_stream_every_stroke():
+    strokes = random_strokes(20, 4)
+    layers = {"Layer": strokes, "CrossHatch": strokes.take([0, 1])}
+    svg = io.StringIO()
+    write_svg(svg, layers, 1000, 1000)
+    document = xml.dom.minidom.parseString(svg.getvalue())
+    assert len(document.getElementsByTagName("g")) == 2
+    assert len(document.getElementsByTagName("path")) == 22
+
+    hpgl = io.StringIO()
+    write_hpgl(hpgl, layers)
+    commands = hpgl.getvalue()
+    assert commands.startswith("IN;") and "SP2;" in commands
+    assert commands.count("PU") == 22 + 1
@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+
+from benchmarks.fields import sphere_field
+from blender_render.grid import DepthDirectionValueGrid
+from blender_render.profiling import CountingGrid, Profiler
+from blender_render.streamlines import StreamlineRegistry, flow_field_streamline, flow_field_streamlines, perpendicular_seeds
+
+
+def uniform_grid(width: int, height: int) -> DepthDirectionValueGrid:
+    # Horizontal directions everywhere
+    pixels = np.zeros((height, width, 3), dtype=np.float32)
+    pixels[:, :, 0] = 5.0
+    pixels[:, :, 2] = 0.5
+    return DepthDirectionValueGrid(width, height, pixels)
+
+def test_stages_and_counters_accumulate():
+    profiler = Profiler()
+    for _ in range(3):
+        with profiler.stage("render"):
+            pass
+    profiler.add_time("render", 2.0)
+    profiler.count("registry_queries", 4)
+    profiler.count("registry_candidates", 10)
+    profiler.count("registry_queries")
+    report = profiler.report()
+    assert report["stages"]["render"]["calls"] == 4
+    assert 2.0 <= report["stages"]["render"]["seconds"] < 2.1
+    assert report["counters"] == {"registry_candidates": 10, "registry_queries": 5}
+    assert report["registry_candidates_per_query"] == 2.0
+
+    disabled = Profiler(enabled=False)
+    with disabled.stage("render"):
+        disabled.count("registry_queries")
+    assert disabled.report()["stages"] == {} and disabled.report()["counters"] == {}
+
+def test_report_is_written_as_json(tmp_path):
+    profiler = Profiler()
+    profiler.count("simplify_points_in", 8)
+    profiler.count("simplify_points_out", 2)
+    path = tmp_path / "profile.json"
+    profiler.write_json(str(path))
+    assert json.loads(path.read_text())["simplify_point_reduction"] == 0.75
+
+def test_counters_of_a_single_streamline():
+    profiler = Profiler()
+    grid = CountingGrid(uniform_grid(100, 40), profiler)
+    registry = StreamlineRegistry(100, 40, 10.0, profiler)
+    # A line along row 10 puts 10 points into each cell of the second row of cells
+    registry.add_streamline([(float(x), 10.0) for x in range(100)])
+
+    sl = flow_field_streamline(
+        grid, registry, 0, (50.5, 21.0), d_sep=10.0, d_test_factor=0.5, d_step=1.0, max_depth_step=1.0,
+        max_accum_angle=5.0, max_steps=20, min_steps=2, profiler=profiler
+    )
+    assert len(sl) == 21
+    counters = profiler.report()["counters"]
+    # One sample at the seed and one per step of both halves
+    assert counters["grid_value_calls"] == 21
+    assert "sample_many_calls" not in counters
+    # The seed is tested alone, each half of 10 points in one chunk
+    assert counters["registry_queries"] == 1 + 10 + 10
+    # Every query looks at 3 x 3 cells, three of which hold 10 points each
+    assert counters["registry_candidates"] == 21 * 30
+    assert profiler.report()["registry_candidates_per_query"] == 30.0
+    assert counters["streamlines_accepted"] == 1 and counters["line_ends_max_steps"] == 2
+
+    perpendicular_seeds(grid, sl, 10.0)
+    counters = profiler.report()["counters"]
+    assert counters["sample_many_calls"] == 1 and counters["sample_many_points"] == 21
+
+def test_counters_of_a_trace_add_up():
+    profiler = Profiler()
+    grid = DepthDirectionValueGrid(200, 150, sphere_field(200, 150))
+    streamlines = flow_field_streamlines(
+        grid, 1, seed_box_size=20.9, d_sep=11.0, d_test_factor=0.65, d_step=0.9, max_depth_step=0.05,
+        max_accum_angle=5.0, max_steps=110, min_steps=10, profiler=profiler
+    )
+    report = profiler.report()
+    counters = report["counters"]
+    assert counters["streamlines_accepted"] == len(streamlines)
+    # Every traced seed ends twice, once per half
+    traced = counters["streamlines_accepted"] + counters.get("streamlines_rejected_too_short", 0)
+    assert sum(n for name, n in counters.items() if name.startswith("line_ends_")) == 2 * traced
+    assert counters["grid_value_calls"] > sum(len(sl) for sl in streamlines)
+    assert set(report["stages"]) == {"seeding", "queue_growth"}
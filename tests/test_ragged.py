@@ -0,0 +1,34 @@
+import numpy as np
+
+from blender_render.ragged import RaggedPoints
+
+
+def test_from_sequences_take_and_point_indices():
+    polylines = [[(0.0, 1.0), (2.0, 3.0)], [], [(4.0, 5.0)], [(6.0, 7.0), (8.0, 9.0), (10.0, 11.0)]]
+    ragged = RaggedPoints.from_sequences(polylines, 2)
+    assert ragged.offsets.tolist() == [0, 2, 2, 3, 6]
+    assert [stroke.tolist() for stroke in ragged] == [[list(p) for p in pl] for pl in polylines]
+    assert ragged.point_indices([3, 0]).tolist() == [3, 4, 5, 0, 1]
+    taken = ragged.take([3, 1, 0])
+    assert taken.offsets.tolist() == [0, 3, 3, 5]
+    assert taken[0].tolist() == [[6.0, 7.0], [8.0, 9.0], [10.0, 11.0]]
+    # Array polylines take the concatenating path
+    assert np.array_equal(RaggedPoints.from_sequences([np.asarray(pl, dtype=np.float64).reshape((-1, 2)) for pl in polylines], 2).points, ragged.points)
+
+def test_keys_depend_only_on_the_points_of_each_stroke():
+    rng = np.random.default_rng(9)
+    polylines = [rng.random((n, 3)).astype(np.float32) for n in rng.integers(1, 20, 500)]
+    keys = RaggedPoints.from_sequences(polylines, 3, dtype=np.float32).keys()
+    assert len(np.unique(keys)) == len(polylines)
+    # The same strokes in another order and next to other strokes have the same keys
+    shuffled = rng.permutation(len(polylines))
+    moved = RaggedPoints.from_sequences([polylines[i] for i in shuffled] + [rng.random((4, 3)).astype(np.float32)], 3, dtype=np.float32)
+    assert np.array_equal(moved.keys()[:-1], keys[shuffled])
+
+def test_keys_change_with_any_point():
+    stroke = np.array(((0.0, 0.0, 0.0), (1.0, 2.0, 3.0), (4.0, 5.0, 6.0)), dtype=np.float32)
+    nudged = stroke.copy()
+    nudged[1, 2] = np.nextafter(nudged[1, 2], np.float32(4.0))
+    variants = [stroke, stroke[::-1].copy(), stroke[:2], nudged, np.concatenate((stroke, stroke[-1:]))]
+    keys = RaggedPoints.from_sequences(variants + [np.zeros((0, 3), dtype=np.float32)], 3, dtype=np.float32).keys()
+    assert len(np.unique(keys)) == len(keys)
@@ -0,0 +1,111 @@
+from contextlib import contextmanager
+
+import numpy as np
+
+import fake_blender
+from fake_blender import Matrix, Vector
+from blender_render.profiling import DISABLED_PROFILER
+from blender_render.render import BlenderShaderRenderer
+from blender_render.scene import MeshTriangles
+from blender_render.session import RendererSession
+
+
+class FakeBuffer(bytearray):
+    # gpu.types.Buffer exposes its memory through the buffer protocol and has settable dimensions
+    dimensions = None
+
+class FakeTexture:
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.buffers = []
+
+    def clear(self, format: str, value: tuple):
+        self.cleared = value
+
+    def read(self) -> FakeBuffer:
+        # RGBA pixels whose channels encode their row, column and channel index, rows counted from the bottom
+        rows, cols, channels = np.meshgrid(np.arange(self.height), np.arange(self.width), np.arange(4), indexing="ij")
+        buffer = FakeBuffer((1000.0 * rows + 10.0 * cols + channels).astype(np.float32).tobytes())
+        self.buffers.append(buffer)
+        return buffer
+
+class FakeFramebuffer:
+    @contextmanager
+    def bind(self):
+        yield
+
+class FakeShader:
+    def __init__(self):
+        self.uniforms = {}
+
+    def uniform_float(self, name: str, value):
+        self.uniforms[name] = value
+
+    def uniform_bool(self, name: str, value: bool):
+        self.uniforms[name] = value
+
+class FakeBatch:
+    def __init__(self):
+        self.draw_count = 0
+
+    def draw(self, shader: FakeShader):
+        self.draw_count += 1
+
+def fake_renderer() -> BlenderShaderRenderer:
+    # Skips compiling the shader; the framebuffers of the session are made by fake_framebuffer
+    renderer = BlenderShaderRenderer.__new__(BlenderShaderRenderer)
+    renderer.session = RendererSession()
+    renderer.shader = FakeShader()
+    return renderer
+
+def fake_framebuffer(renderer: BlenderShaderRenderer, width: int, height: int) -> FakeTexture:
+    color_texture = FakeTexture(width, height)
+    renderer.session.framebuffer(width, height, lambda w, h: (FakeFramebuffer(), FakeTexture(w, h), color_texture))
+    return color_texture
+
+def render_pass_args(width: int, height: int) -> tuple:
+    return (Matrix.Identity(4), Matrix.Identity(4), Vector((0.0, 0.0, 5.0)), Vector((1.0, 1.0, 1.0)), True, 0.5, width, height, DISABLED_PROFILER)
+
+def test_readback_is_a_view_of_the_rgb_channels():
+    renderer = fake_renderer()
+    color_texture = fake_framebuffer(renderer, 7, 5)
+    batch = FakeBatch()
+    pixels = renderer._render_pass(batch, *render_pass_args(7, 5))
+    assert batch.draw_count == 1
+    assert color_texture.cleared == (-1.0, 0.0, 0.0, 1.0)
+    assert pixels.shape == (5, 7, 3) and pixels.dtype == np.float32
+    # Row y, column x and channel c of the pixels are those of the readback
+    assert pixels[3, 2].tolist() == [3020.0, 3021.0, 3022.0]
+    assert pixels[4, 6].tolist() == [4060.0, 4061.0, 4062.0]
+
+    buffer = color_texture.buffers[-1]
+    assert buffer.dimensions == 7 * 5 * 4
+    # No copy: the pixels share the memory of the buffer that the texture returned
+    assert not pixels.flags.owndata
+    assert np.shares_memory(pixels, np.frombuffer(buffer, dtype=np.float32))
+    np.frombuffer(buffer, dtype=np.float32)[4 * (3 * 7 + 2)] = -7.0
+    assert pixels[3, 2, 0] == -7.0
+
+    # The depth test and culling are only on during the pass
+    assert fake_blender.gpu_state_calls[-4:] == [
+        ("depth_mask_set", False), ("depth_test_set", "NONE"), ("face_culling_set", "NONE"), ("front_facing_set", False)
+    ]
+
+def test_tiled_render_only_writes_the_given_tiles():
+    renderer = fake_renderer()
+    triangles = MeshTriangles(np.zeros((3, 3), dtype=np.float32), np.zeros((3, 3), dtype=np.float32), np.array([[0, 1, 2]], dtype=np.uint32))
+    batch = FakeBatch()
+    renderer.session.batch((triangles.vertices, triangles.normals, triangles.indices), lambda: batch)
+    fake_framebuffer(renderer, 4, 4)
+    fake_framebuffer(renderer, 2, 2)
+    out = np.full((6, 10, 3), -5.0, dtype=np.float32)
+    tiles = [(slice(0, 4), slice(4, 8)), (slice(4, 6), slice(8, 10))]
+    renderer.render_depth_orientation_value_tiled(triangles, *render_pass_args(10, 6)[1:-3], 10, 6, out, 4, DISABLED_PROFILER, tiles)
+    assert batch.draw_count == 2
+    assert out[0:4, 4:8, 0].tolist() == [[1000.0 * y + 10.0 * x for x in range(4)] for y in range(4)]
+    assert out[4:6, 8:10, 2].tolist() == [[1000.0 * y + 10.0 * x + 2.0 for x in range(2)] for y in range(2)]
+    rendered = np.zeros(out.shape[:2], dtype=bool)
+    for ys, xs in tiles:
+        rendered[ys, xs] = True
+    assert np.all(out[~rendered] == -5.0)
@@ -0,0 +1,54 @@
+import json
+import sys
+
+import numpy as np
+import pytest
+
+from benchmarks.fields import sphere_field
+from blender_render.utils import read_strokes, write_gbuffer
+
+import replay
+
+
+CONFIG = {
+    "rng_seed": 7,
+    "streamlines": {
+        "seed_box_size": 20.9,
+        "d_test_factor": 0.65,
+        "d_step": 0.9,
+        "max_depth_step": 0.05,
+        "max_accum_angle": 5.0,
+        "max_steps": 110,
+        "min_steps": 10
+    },
+    "layers": [{"name": "Layer", "d_sep": 11.0}]
+}
+
+def run_replay(monkeypatch, tmp_path, config):
+    # A G-buffer rendered at half of an 800 x 600 output
+    gbuffer_path = str(tmp_path / "half.gbuf")
+    write_gbuffer(gbuffer_path, sphere_field(400, 300), metadata={"output_size": [800, 600], "analysis_scale": 0.5})
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(config))
+    output_path = str(tmp_path / "strokes.bin")
+    monkeypatch.setattr(sys, "argv", ["replay.py", gbuffer_path, str(config_path), output_path])
+    replay.main()
+    return read_strokes(output_path)
+
+def test_strokes_are_in_output_pixels_of_the_gbuffer_scale(monkeypatch, tmp_path):
+    layers, metadata = run_replay(monkeypatch, tmp_path, CONFIG)
+    assert (metadata["width"], metadata["height"]) == (800, 600)
+    points = np.asarray(layers["Layer"].points)
+    # The sphere covers a disc of radius 120 analysis pixels, i.e. 240 output pixels, around the centre
+    radii = np.hypot(points[:, 0] - 400.0, points[:, 1] - 300.0)
+    assert radii.max() > 200.0
+    assert radii.max() < 245.0
+
+def test_config_with_another_analysis_scale_is_rejected(monkeypatch, tmp_path):
+    config = json.loads(json.dumps(CONFIG))
+    config["streamlines"]["analysis_scale"] = 1.0
+    with pytest.raises(ValueError):
+        run_replay(monkeypatch, tmp_path, config)
+    config["streamlines"]["analysis_scale"] = 0.5
+    layers, _ = run_replay(monkeypatch, tmp_path, config)
+    assert len(layers["Layer"]) > 0
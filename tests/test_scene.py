@@ -0,0 +1,104 @@
+import numpy as np
+
+import fake_blender
+from blender_render.geometry_cache import GeometryCache
+from blender_render.scene import BlenderScene, MeshTriangles
+
+
+class FakeCollection:
+    # A mesh element collection with foreach_get over flattened per-element properties
+    def __init__(self, **properties: np.ndarray):
+        self.properties = properties
+
+    def __len__(self) -> int:
+        return len(next(iter(self.properties.values())))
+
+    def foreach_get(self, name: str, out: np.ndarray):
+        out[:] = np.asarray(self.properties[name]).reshape(-1)
+
+class FakeMesh:
+    # A flat pentagon (loops 0-4) and a smooth quad (loops 5-8) that share the edge between vertices 1 and 2. Like
+    # Blender's calc_loop_triangles, the n-gons are fanned out from their first loop.
+    CO = np.array([
+        (0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (1.5, 1.0, 0.0), (0.5, 1.8, 0.0), (-0.5, 1.0, 0.0), (2.0, -0.5, 0.3), (2.5, 1.2, 0.3)
+    ], dtype=np.float32)
+    LOOP_VERTICES = np.array([0, 1, 2, 3, 4, 1, 5, 6, 2], dtype=np.int32)
+    LOOP_TRIANGLES = np.array([(0, 1, 2), (0, 2, 3), (0, 3, 4), (5, 6, 7), (5, 7, 8)], dtype=np.int32)
+
+    def __init__(self, use_smooth=(False, True), has_custom_normals=False):
+        rng = np.random.default_rng(0)
+        self.vertex_normals = rng.normal(size=(7, 3)).astype(np.float32)
+        self.loop_normals = rng.normal(size=(9, 3)).astype(np.float32)
+        self.vertices = FakeCollection(co=self.CO, normal=self.vertex_normals)
+        self.loops = FakeCollection(vertex_index=self.LOOP_VERTICES, normal=self.loop_normals)
+        self.polygons = FakeCollection(use_smooth=np.array(use_smooth), loop_total=np.array([5, 4], dtype=np.int32))
+        self.has_custom_normals = has_custom_normals
+        self.loop_triangles = FakeCollection()
+        self.triangulation_count = 0
+
+    def calc_loop_triangles(self):
+        self.loop_triangles = FakeCollection(loops=self.LOOP_TRIANGLES)
+        self.triangulation_count += 1
+
+def test_ngons_are_triangulated_with_flat_and_smooth_corners():
+    mesh = FakeMesh()
+    triangles = BlenderScene._local_triangle_data(mesh)
+    assert triangles.indices.dtype == np.uint32 and triangles.indices.shape == (5, 3)
+    # Every triangle corner lies on the vertex of its loop
+    corner_loops = FakeMesh.LOOP_TRIANGLES.reshape(-1)
+    assert np.array_equal(triangles.vertices[triangles.indices.reshape(-1)], FakeMesh.CO[FakeMesh.LOOP_VERTICES[corner_loops]])
+
+    # The flat pentagon gets a vertex per corner with the corner normal; the smooth quad shares the mesh vertices and
+    # their normals, also at the vertices 1 and 2 that it shares with the pentagon
+    assert len(triangles.vertices) == 7 + 5
+    assert triangles.indices[:3].tolist() == [[7, 8, 9], [7, 9, 10], [7, 10, 11]]
+    assert triangles.indices[3:].tolist() == [[1, 5, 6], [1, 6, 2]]
+    assert np.array_equal(triangles.normals[7:], mesh.loop_normals[:5])
+    assert np.array_equal(triangles.normals[:7], mesh.vertex_normals)
+
+def test_all_smooth_mesh_keeps_its_vertices():
+    mesh = FakeMesh(use_smooth=(True, True))
+    triangles = BlenderScene._local_triangle_data(mesh)
+    assert np.array_equal(triangles.vertices, FakeMesh.CO)
+    assert np.array_equal(triangles.normals, mesh.vertex_normals)
+    assert np.array_equal(triangles.indices, FakeMesh.LOOP_VERTICES[FakeMesh.LOOP_TRIANGLES])
+
+def test_unchanged_mesh_comes_from_the_cache():
+    cache = GeometryCache(max_bytes=1 << 20)
+    mesh = FakeMesh()
+    first = BlenderScene._local_triangle_data(mesh, cache)
+    second = BlenderScene._local_triangle_data(mesh, cache)
+    assert mesh.triangulation_count == 1 and cache.stats.hits == 1
+    assert all(np.array_equal(getattr(first, name), getattr(second, name)) for name in ("vertices", "normals", "indices"))
+    # Custom normals are part of the key
+    BlenderScene._local_triangle_data(FakeMesh(has_custom_normals=True), cache)
+    assert cache.stats.misses == 2
+
+def test_instances_get_transformed_copies():
+    mesh = FakeMesh()
+    local = BlenderScene._local_triangle_data(mesh)
+    angle = 0.3
+    rotation_scale = np.array([
+        (1.0, 0.0, 0.0), (0.0, np.cos(angle), -np.sin(angle)), (0.0, np.sin(angle), np.cos(angle))
+    ]) @ np.diag((2.0, 0.5, 3.0))
+    matrix = np.identity(4)
+    matrix[:3, :3] = rotation_scale
+    matrix[:3, 3] = (1.0, -2.0, 3.0)
+    world = BlenderScene._transform_instances(local, np.stack((np.identity(4), matrix)))
+
+    vertex_count = len(local.vertices)
+    assert world.vertices.dtype == np.float32 and world.normals.dtype == np.float32
+    assert np.allclose(world.vertices[:vertex_count], local.vertices)
+    assert np.allclose(world.vertices[vertex_count:], local.vertices @ rotation_scale.T + (1.0, -2.0, 3.0), atol=1e-6)
+    assert np.array_equal(world.indices, np.concatenate((local.indices, local.indices + vertex_count)))
+
+    # Normals are transformed by the inverse transpose and stay unit length, so they stay perpendicular to the
+    # transformed faces also under non-uniform scaling
+    assert np.allclose(np.linalg.norm(world.normals, axis=1), 1.0, atol=1e-6)
+    corners = local.vertices[local.indices[3]].astype(np.float64)
+    face_normal = np.cross(corners[1] - corners[0], corners[2] - corners[0])
+    flat = MeshTriangles(local.vertices, np.tile(face_normal / np.linalg.norm(face_normal), (vertex_count, 1)).astype(np.float32), local.indices)
+    transformed = BlenderScene._transform_instances(flat, matrix[np.newaxis])
+    world_corners = transformed.vertices[transformed.indices[3]].astype(np.float64)
+    world_normal = np.cross(world_corners[1] - world_corners[0], world_corners[2] - world_corners[0])
+    assert np.allclose(transformed.normals[transformed.indices[3, 0]], world_normal / np.linalg.norm(world_normal), atol=1e-5)
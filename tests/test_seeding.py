@@ -0,0 +1,61 @@
+import random
+
+import numpy as np
+
+from benchmarks.fields import sphere_field
+from blender_render.grid import DepthDirectionValueGrid
+from blender_render.seeding import SeedingMaps, dilate, jittered_seeds, seed_candidates
+
+
+WIDTH = 320
+HEIGHT = 200
+
+def test_jittered_seeds_are_one_per_box_and_reproducible():
+    seeds = jittered_seeds(WIDTH, HEIGHT, 20.0, 5)
+    assert seeds.shape == (16 * 10, 2)
+    boxes = (seeds // 20.0).astype(int)
+    assert len({tuple(box) for box in boxes.tolist()}) == len(seeds)
+    assert np.array_equal(seeds, jittered_seeds(WIDTH, HEIGHT, 20.0, 5))
+
+def test_jittered_seeds_leave_global_random_state_alone():
+    random.seed(3)
+    expected = random.random()
+    random.seed(3)
+    jittered_seeds(WIDTH, HEIGHT, 20.0, 5)
+    assert random.random() == expected
+
+def test_seed_orders_are_permutations_of_covered_seeds():
+    grid = DepthDirectionValueGrid(WIDTH, HEIGHT, sphere_field(WIDTH, HEIGHT))
+    seeds, samples, uncovered_count = seed_candidates(grid, 5, 20.0)
+    all_seeds = jittered_seeds(WIDTH, HEIGHT, 20.0, 5)
+    assert len(seeds) + uncovered_count == len(all_seeds)
+    assert samples.is_covered().all()
+
+    by_value, value_samples, _ = seed_candidates(grid, 5, 20.0, order="value")
+    assert sorted(map(tuple, by_value.tolist())) == sorted(map(tuple, seeds.tolist()))
+    assert (np.diff(value_samples.value) >= 0.0).all()
+
+    by_distance, _, _ = seed_candidates(grid, 5, 20.0, order="discontinuity_distance", max_depth_jump=0.05)
+    assert sorted(map(tuple, by_distance.tolist())) == sorted(map(tuple, seeds.tolist()))
+    # The sphere's silhouette is the only discontinuity, so the first seeds lie near its centre
+    centre = np.array((0.5 * WIDTH, 0.5 * HEIGHT))
+    distances = np.hypot(*(by_distance - centre).T)
+    assert distances[:5].max() < distances[-5:].min()
+
+def test_discontinuity_distance_counts_lattice_steps():
+    covered = np.zeros((9, 9), dtype=bool)
+    covered[2:7, 2:7] = True
+    pixels = np.stack((np.where(covered, 5.0, -1.0), np.zeros((9, 9)), np.zeros((9, 9))), axis=-1)
+    maps = SeedingMaps.from_grid(DepthDirectionValueGrid(9, 9, pixels), 1.0, 0.05)
+    assert maps.covered.tolist() == covered.tolist()
+    # The pixels on both sides of the silhouette are discontinuities; the centre is two steps inside them, and the
+    # corner two steps away from (1, 2)
+    assert maps.discontinuities[1, 2] and maps.discontinuities[2, 2] and not maps.discontinuities[1, 1]
+    assert maps.discontinuity_distance[4, 4] == 2
+    assert maps.discontinuity_distance[0, 0] == 2
+    assert maps.discontinuity_distance[2, 2] == 0
+
+def test_dilate_grows_a_square():
+    mask = np.zeros((7, 7), dtype=bool)
+    mask[3, 3] = True
+    assert dilate(mask, 2).sum() == 25
@@ -0,0 +1,66 @@
+import numpy as np
+
+from blender_render.session import RendererSession
+
+
+def test_shader_is_compiled_once_per_source():
+    namespace = {}
+    compiled = []
+
+    def compile_shader():
+        compiled.append(object())
+        return compiled[-1]
+
+    key = RendererSession.source_key("void main() {}", ("position", "VEC3"))
+    shader = RendererSession.from_namespace(namespace).shader(key, compile_shader)
+    # A new session on the same namespace, as after a module reload, finds the compiled shader
+    session = RendererSession.from_namespace(namespace)
+    assert session.shader(key, compile_shader) is shader
+    assert session.stats.shader_compiles == 0 and session.stats.shader_reuses == 1
+    other_key = RendererSession.source_key("void main() { }", ("position", "VEC3"))
+    assert other_key != key
+    assert session.shader(other_key, compile_shader) is not shader
+    assert len(compiled) == 2
+
+def test_framebuffers_are_reused_by_size_and_evicted_least_recently_used():
+    session = RendererSession()
+    allocated = []
+
+    def allocate(width, height):
+        allocated.append((width, height))
+        return (width, height, len(allocated))
+
+    first = session.framebuffer(64, 32, allocate)
+    assert session.framebuffer(64, 32, allocate) is first
+    for size in range(1, RendererSession.MAX_FRAMEBUFFERS):
+        session.framebuffer(size, size, allocate)
+    # Using 64 x 32 again makes 1 x 1 the least recently used size, which the next new size evicts
+    session.framebuffer(64, 32, allocate)
+    session.framebuffer(100, 100, allocate)
+    assert (64, 32) in session.state["framebuffers"]
+    assert (1, 1) not in session.state["framebuffers"]
+    assert len(session.state["framebuffers"]) == RendererSession.MAX_FRAMEBUFFERS
+    assert session.stats.framebuffer_allocations == RendererSession.MAX_FRAMEBUFFERS + 1
+
+def test_batch_is_uploaded_only_when_the_geometry_changes():
+    session = RendererSession()
+    uploads = []
+
+    def upload():
+        uploads.append(object())
+        return uploads[-1]
+
+    vertices = np.arange(12, dtype=np.float32).reshape((4, 3))
+    indices = np.array(((0, 1, 2), (0, 2, 3)), dtype=np.int32)
+    batch = session.batch((vertices, None, indices), upload)
+    assert session.batch((vertices.copy(), None, indices.copy()), upload) is batch
+    moved = vertices.copy()
+    moved[0, 0] += 1.0
+    assert session.batch((moved, None, indices), upload) is not batch
+    # Which arrays are missing is part of the key
+    session.batch((moved, indices, None), upload)
+    assert len(uploads) == 3
+    assert session.stats.batch_uploads == 3 and session.stats.batch_reuses == 1
+
+    session.clear()
+    assert session.state["batch"] is None and not session.state["shaders"] and not session.state["framebuffers"]
@@ -0,0 +1,38 @@
+import numpy as np
+
+from blender_render.ragged import RaggedPoints
+from blender_render.simplify import simplify_strokes
+
+
+def rdp(points: np.ndarray, tolerance: float) -> np.ndarray:
+    # Recursive Ramer-Douglas-Peucker, splitting at the first farthest point
+    if len(points) < 3:
+        return points
+    a = points[0]
+    ab = points[-1] - a
+    ap = points[1:-1] - a
+    ab_length_sq = ab @ ab
+    t = np.clip(ap @ ab / ab_length_sq, 0.0, 1.0) if ab_length_sq > 0.0 else np.zeros(len(ap))
+    distances = np.hypot(*(ap - t[:, np.newaxis] * ab).T)
+    farthest = int(np.argmax(distances)) + 1
+    if distances[farthest - 1] <= tolerance:
+        return points[[0, -1]]
+    return np.concatenate((rdp(points[:farthest + 1], tolerance)[:-1], rdp(points[farthest:], tolerance)))
+
+def test_matches_recursive_rdp():
+    rng = np.random.default_rng(11)
+    polylines = [np.cumsum(rng.normal(size=(n, 2)), axis=0) for n in rng.integers(0, 60, 200)]
+    # Closed strokes, whose chord has length zero, and straight ones
+    polylines += [np.array(((0.0, 0.0), (3.0, 1.0), (1.0, 4.0), (0.0, 0.0))), np.linspace((0.0, 0.0), (9.0, 3.0), 10)]
+    strokes = RaggedPoints.from_sequences(polylines, 2)
+    for tolerance in (0.0, 0.25, 2.0):
+        simplified = simplify_strokes(strokes, tolerance)
+        assert len(simplified) == len(strokes)
+        for stroke, polyline in zip(simplified, polylines):
+            assert np.array_equal(stroke, rdp(polyline, tolerance))
+
+def test_keeps_end_points_and_short_strokes():
+    strokes = RaggedPoints.from_sequences([[], [(1.0, 2.0)], [(0.0, 0.0), (5.0, 5.0)], [(0.0, 0.0), (1.0, 0.01), (2.0, 0.0)]], 2)
+    simplified = simplify_strokes(strokes, 0.5)
+    assert simplified.lengths().tolist() == [0, 1, 2, 2]
+    assert simplified[3].tolist() == [[0.0, 0.0], [2.0, 0.0]]
@@ -0,0 +1,45 @@
+import pytest
+
+from benchmarks.fields import noise_field, sphere_field, torus_field
+from blender_render.grid import DepthDirectionValueGrid
+from blender_render.streamlines import ToneSeparation, batched_streamlines, flow_field_streamlines
+
+
+FIELDS = {"sphere": sphere_field, "noise": noise_field, "torus": torus_field}
+STREAMLINE_PARAMS = dict(
+    seed_box_size=20.9,
+    d_test_factor=0.65,
+    d_step=0.9,
+    max_depth_step=0.05,
+    max_accum_angle=5.0,
+    max_steps=110,
+    min_steps=10
+)
+
+
+def test_batches_keep_doubling_without_a_cap():
+    streamlines = [[(float(i), 0.0)] for i in range(1000)]
+    batches = list(batched_streamlines(streamlines, first_batch_size=4))
+    assert [len(b) for b in batches] == [4, 8, 16, 32, 64, 128, 256, 492]
+    assert [sl for b in batches for sl in b] == streamlines
+
+def test_batches_stop_doubling_at_the_cap():
+    batches = list(batched_streamlines(([(0.0, 0.0)] for _ in range(40)), first_batch_size=4, max_batch_size=10))
+    assert [len(b) for b in batches] == [4, 8, 10, 10, 8]
+
+@pytest.mark.parametrize("field", FIELDS)
+@pytest.mark.parametrize("integrator", ["euler", "rk4"])
+@pytest.mark.parametrize("d_sep", [11.0, ToneSeparation(6.0, 14.0)], ids=["fixed", "tone"])
+def test_wavefront_search_matches_the_serial_search(field, integrator, d_sep):
+    # The batches commit their lines in the order of the serial search, and on these fields the result is exactly
+    # the same, also for batches that are smaller than the number of seeds
+    grid = DepthDirectionValueGrid(480, 320, FIELDS[field](480, 320))
+    serial = flow_field_streamlines(grid, 5, d_sep=d_sep, integrator=integrator, **STREAMLINE_PARAMS)
+    assert len(serial) > 50
+    for batch_size in (64, 4096):
+        assert flow_field_streamlines(grid, 5, d_sep=d_sep, integrator=integrator, batch_size=batch_size, **STREAMLINE_PARAMS) == serial
+
+def test_flow_field_streamlines_rejects_unknown_parameters():
+    grid = DepthDirectionValueGrid(64, 48, sphere_field(64, 48))
+    with pytest.raises(TypeError):
+        flow_field_streamlines(grid, 5, d_sep=6.0, d_sepp=6.0, **STREAMLINE_PARAMS)